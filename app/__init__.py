@@ -6,7 +6,10 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.environment import env
+from app.core.middleware import MetricsMiddleware, RedisRoundTripsMiddleware
+from app.core.profiling import ProfilerMiddleware
 from app.core.worker import get_worker_id
+from app.db.session import LazyAsyncSession
 
 
 @asynccontextmanager
@@ -17,16 +20,31 @@ async def lifespan(application: FastAPI):
 
     await Container.initialize()
     await Container.initialize_services()
+    await Container.initialize_background_tasks()
 
     # The initialisation of the database will only be performed in one worker
     if worker_id == 1:
         await Container.initialize_database()
 
+    # Uvicorn starts accepting connections of the worker only after the lifespan startup
+    if env.warmup_enabled:
+        await Container.health_service.warm_up()
+    Container.ready = True
+
     logging.warning(f'WORKER {worker_id} STARTED')
 
     yield
 
-    await Container.redis_client.close()
+    Container.ready = False
+
+    logging.warning(
+        f'WORKER {worker_id} USER LOCAL CACHE {Container.user_local_cache_repo.stats()}'
+    )
+    logging.warning(
+        f'WORKER {worker_id} PASSWORD HASHING {Container.password_hasher.stats()}'
+    )
+    logging.warning(f'WORKER {worker_id} DB SESSIONS {LazyAsyncSession.stats()}')
+    await Container.shutdown()
 
 
 app = FastAPI(
@@ -34,6 +52,9 @@ app = FastAPI(
     docs_url='/docs' if env.debug else None,
 )
 
+app.add_middleware(RedisRoundTripsMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilerMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=['*'],
@@ -56,4 +77,19 @@ def register_rest_routes(application: FastAPI):
     )
 
 
+def register_health_routes(application: FastAPI):
+    from app.api import health
+
+    application.include_router(health.router)
+
+
+def register_metrics_routes(application: FastAPI):
+    from app.api import metrics
+
+    application.include_router(metrics.router)
+
+
 register_rest_routes(app)
+register_health_routes(app)
+if env.metrics_enabled:
+    register_metrics_routes(app)
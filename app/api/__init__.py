@@ -1,5 +1,18 @@
+from fastapi import Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.session import LazyAsyncSession
+from app.unions.loaders import UserLoader
+
+
 async def get_db_session():
     from app.core.container import Container
 
-    async with Container.async_session() as session:
+    async with LazyAsyncSession(Container.async_session) as session:
         yield session
+
+
+async def get_user_loader(session: AsyncSession = Depends(get_db_session)):
+    from app.core.container import Container
+
+    return UserLoader(Container, session)
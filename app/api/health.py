@@ -0,0 +1,24 @@
+from fastapi import APIRouter
+
+from app.core.container import Container
+
+router = APIRouter(
+    prefix='/health',
+    tags=['health'],
+)
+
+
+@router.get(
+    '/live',
+    include_in_schema=False,
+)
+async def live():
+    return await Container.health_service.live()
+
+
+@router.get(
+    '/ready',
+    include_in_schema=False,
+)
+async def ready():
+    return await Container.health_service.ready()
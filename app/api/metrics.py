@@ -0,0 +1,71 @@
+import ipaddress
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, Request
+from fastapi.responses import PlainTextResponse
+
+from app.core.container import Container
+from app.core.environment import env
+from app.core.exceptions import (
+    raise_exception,
+    UnauthorizedException,
+    ErrorMessageCodes,
+)
+
+router = APIRouter(
+    tags=['metrics'],
+)
+
+allowed_networks = [
+    ipaddress.ip_network(network.strip())
+    for network in env.metrics_allowed_networks.split(',')
+    if network.strip()
+]
+
+
+async def authorize_scraper(
+    request: Request,
+    authorization: Optional[str] = Header(None),
+):
+    """
+    Metrics are served to clients from the allowed networks
+    and to scrapers with the metrics token
+    """
+
+    token = env.metrics_token.get_secret_value() if env.metrics_token else ''
+    if (
+        token
+        and authorization is not None
+        and secrets.compare_digest(authorization.encode(), f'Bearer {token}'.encode())
+    ):
+        return
+
+    if request.client is not None:
+        try:
+            address = ipaddress.ip_address(request.client.host)
+        except ValueError:
+            address = None
+        if address is not None and any(
+            address in network for network in allowed_networks
+        ):
+            return
+
+    raise raise_exception(
+        UnauthorizedException,
+        ErrorMessageCodes.AUTH_FAILED,
+        {'WWW-Authenticate': 'Bearer'},
+    )
+
+
+@router.get(
+    '/metrics',
+    response_class=PlainTextResponse,
+    include_in_schema=False,
+    dependencies=[Depends(authorize_scraper)],
+)
+async def metrics():
+    return PlainTextResponse(
+        await Container.metrics_service.metrics(),
+        media_type='text/plain; version=0.0.4; charset=utf-8',
+    )
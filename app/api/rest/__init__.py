@@ -4,43 +4,40 @@ I created the ‘rest’ directory so that when adding other approaches, such as
 
 from typing import Optional
 
-import jwt
-from fastapi import Depends, Request
+from fastapi import Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.api import get_db_session
-from app.cache.models.user import UserCacheModel
+from app.cache.models.user import UserCacheStruct
 from app.db.exceptions import DbObjectDoesNotExist
 
-from app.core.authentication import JWTBearer
-from app.core.environment import env
+from app.core.authentication import jwt_bearer
 from app.core.exceptions import UnauthorizedException
+from app.schemas.rest.auth import JwtTokenPayload
 
 
 async def get_current_user(
-    token: str = Depends(JWTBearer()),
+    payload: JwtTokenPayload = Depends(jwt_bearer),
     session: AsyncSession = Depends(get_db_session),
-) -> UserCacheModel:
-    from app.core.container import Container
+) -> UserCacheStruct:
+    return await _get_current_user(payload, session=session)
 
-    try:
-        payload = jwt.decode(
-            token,
-            env.jwt_secretkey.get_secret_value(),
-            algorithms=[env.jwt_algorithm],
-        )
-    except Exception:
-        raise UnauthorizedException(detail='Could not validate credentials')
 
-    token_type = payload.get('type', None)
-    if token_type != 'access':
+async def _get_current_user(
+    payload: JwtTokenPayload,
+    session: AsyncSession,
+    version: Optional[str] = None,
+) -> UserCacheStruct:
+    from app.core.container import Container
+
+    if payload.type != 'access':
         raise UnauthorizedException(detail='Could not validate credentials')
-    user_id = int(payload['id'])
 
     try:
         user_cache_model = await Container.user_union.get(
-            user_id,
+            payload.id,
             session=session,
+            version=version,
         )
     except DbObjectDoesNotExist:
         raise UnauthorizedException(detail='Could not validate credentials')
@@ -49,11 +46,11 @@ async def get_current_user(
 
 
 async def get_current_unverified_user(
-    token: str = Depends(JWTBearer()),
+    payload: JwtTokenPayload = Depends(jwt_bearer),
     session: AsyncSession = Depends(get_db_session),
-) -> UserCacheModel:
+) -> UserCacheStruct:
     user_cache_model = await get_current_user(
-        token,
+        payload,
         session=session,
     )
 
@@ -64,11 +61,11 @@ async def get_current_unverified_user(
 
 
 async def get_current_verified_user(
-    token: str = Depends(JWTBearer()),
+    payload: JwtTokenPayload = Depends(jwt_bearer),
     session: AsyncSession = Depends(get_db_session),
-) -> UserCacheModel:
+) -> UserCacheStruct:
     user_cache_model = await get_current_user(
-        token,
+        payload,
         session=session,
     )
 
@@ -79,11 +76,11 @@ async def get_current_verified_user(
 
 
 async def get_current_admin_user(
-    token: str = Depends(JWTBearer()),
+    payload: JwtTokenPayload = Depends(jwt_bearer),
     session: AsyncSession = Depends(get_db_session),
-) -> UserCacheModel:
+) -> UserCacheStruct:
     user_cache_model = await get_current_verified_user(
-        token,
+        payload,
         session=session,
     )
 
@@ -91,3 +88,30 @@ async def get_current_admin_user(
         raise UnauthorizedException(detail='You\'re not an admin.')
 
     return user_cache_model
+
+
+async def get_current_verified_user_with_version(
+    payload: JwtTokenPayload = Depends(jwt_bearer),
+    session: AsyncSession = Depends(get_db_session),
+) -> tuple[UserCacheStruct, str]:
+    """
+    The current user along with its ETag version. The version is read first,
+    so the user is never older than the version it is sent under.
+    """
+
+    from app.core.container import Container
+
+    if payload.type != 'access':
+        raise UnauthorizedException(detail='Could not validate credentials')
+
+    version = await Container.user_union.get_version(payload.id)
+    user_cache_model = await _get_current_user(
+        payload,
+        session=session,
+        version=version,
+    )
+
+    if not user_cache_model.verified:
+        raise UnauthorizedException(detail='User is not verified')
+
+    return user_cache_model, version
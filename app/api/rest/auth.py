@@ -4,8 +4,11 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import APIRouter, Depends, status, Body
 
 from app.api.rest import get_current_unverified_user
-from app.cache.models.user import UserCacheModel
+from app.cache.models.user import UserCacheStruct
 from app.core.container import Container
+from app.core.environment import env
+from app.core.exceptions import ErrorMessageCodes
+from app.core.rate_limit import RateLimit
 
 from app.api import get_db_session
 from app.schemas.rest.auth import SignUpRequest, JWTResponse, SignInRequest
@@ -22,6 +25,7 @@ router = APIRouter(
     response_model=JWTResponse,
     summary='Sign Up',
     description='Endpoint for user registration by email',
+    dependencies=[Depends(RateLimit('sign-up-ip', env.rate_limit_sign_up_ip, 'ip'))],
 )
 async def sign_up(
     request_schema: SignUpRequest,
@@ -38,9 +42,19 @@ async def sign_up(
     summary='Resend Verification Code',
     description='Endpoint for resend verification code',
     status_code=status.HTTP_200_OK,
+    dependencies=[
+        Depends(
+            RateLimit(
+                'resend-verification-code-user',
+                env.rate_limit_resend_verification_code_user,
+                'user',
+                error_code=ErrorMessageCodes.VERIFICATION_CODE_LIMIT,
+            )
+        )
+    ],
 )
 async def resend_verification_code(
-    current_user: UserCacheModel = Depends(get_current_unverified_user),
+    current_user: UserCacheStruct = Depends(get_current_unverified_user),
 ):
     return await Container.auth_service.resend_verification_code(
         current_user,
@@ -52,10 +66,19 @@ async def resend_verification_code(
     response_model=JWTResponse,
     summary='Check Verification Code',
     description='Endpoint for check verification code',
+    dependencies=[
+        Depends(
+            RateLimit(
+                'check-verification-code-user',
+                env.rate_limit_check_verification_code_user,
+                'user',
+            )
+        )
+    ],
 )
 async def check_verification_code(
     code: Annotated[int, Body(ge=1000, le=9999, embed=True)],
-    current_user: UserCacheModel = Depends(get_current_unverified_user),
+    current_user: UserCacheStruct = Depends(get_current_unverified_user),
     session: AsyncSession = Depends(get_db_session),
 ):
     return await Container.auth_service.check_verification_code(
@@ -86,6 +109,10 @@ async def refresh_access_token(
     response_model=JWTResponse,
     summary='Sign in',
     description='Endpoint for user login by email and password',
+    dependencies=[
+        Depends(RateLimit('sign-in-ip', env.rate_limit_sign_in_ip, 'ip')),
+        Depends(RateLimit('sign-in-email', env.rate_limit_sign_in_email, 'email')),
+    ],
 )
 async def sign_in(
     request_schema: SignInRequest,
@@ -1,14 +1,24 @@
-from typing import Annotated
+from typing import Annotated, Optional
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi import APIRouter, Depends, Query, Path, status
+from fastapi import APIRouter, Depends, Header, Query, Path, Response, status
 
-from app.api.rest import get_current_verified_user, get_current_admin_user
-from app.cache.models.user import UserCacheModel
+from app.api.rest import (
+    get_current_admin_user,
+    get_current_verified_user_with_version,
+)
+from app.cache.models.user import UserCacheStruct
 from app.core.container import Container
 
-from app.api import get_db_session
-from app.schemas.rest.users import MeResponse, UpdateUserRequest, UsersResponse
+from app.api import get_db_session, get_user_loader
+from app.schemas.rest.users import (
+    MeResponse,
+    UpdateUserRequest,
+    UsersResponse,
+    UsersBatchRequest,
+    UsersBatchResponse,
+)
+from app.unions.loaders import UserLoader
 
 router = APIRouter(
     prefix='/users',
@@ -23,9 +33,19 @@ router = APIRouter(
     description='Endpoint to get information about the current user',
 )
 async def me(
-    curren_user: UserCacheModel = Depends(get_current_verified_user),
+    response: Response,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+    curren_user_with_version: tuple[UserCacheStruct, str] = Depends(
+        get_current_verified_user_with_version
+    ),
 ):
-    return await Container.users_service.me(curren_user)
+    curren_user, version = curren_user_with_version
+    return await Container.users_service.me(
+        curren_user,
+        version,
+        if_none_match,
+        response,
+    )
 
 
 @router.get(
@@ -36,15 +56,36 @@ async def me(
 )
 async def user(
     user_id: Annotated[int, Path(ge=1)],
-    curren_user: UserCacheModel = Depends(get_current_admin_user),
+    response: Response,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+    curren_user: UserCacheStruct = Depends(get_current_admin_user),
     session: AsyncSession = Depends(get_db_session),
 ):
     return await Container.users_service.user(
         user_id,
+        if_none_match,
+        response,
         session,
     )
 
 
+@router.post(
+    '/users/batch',
+    response_model=UsersBatchResponse,
+    summary='Users by ids',
+    description='Endpoint to get information about up to 100 users by ids at once',
+)
+async def users_batch(
+    request_schema: UsersBatchRequest,
+    curren_user: UserCacheStruct = Depends(get_current_admin_user),
+    user_loader: UserLoader = Depends(get_user_loader),
+):
+    return await Container.users_service.users_batch(
+        request_schema,
+        user_loader,
+    )
+
+
 @router.patch(
     '/users/{user_id}',
     status_code=status.HTTP_204_NO_CONTENT,
@@ -54,7 +95,7 @@ async def user(
 async def update_user(
     user_id: Annotated[int, Path(ge=1)],
     request_schema: UpdateUserRequest,
-    curren_user: UserCacheModel = Depends(get_current_admin_user),
+    curren_user: UserCacheStruct = Depends(get_current_admin_user),
     session: AsyncSession = Depends(get_db_session),
 ):
     return await Container.users_service.update_user(
@@ -72,7 +113,7 @@ async def update_user(
 )
 async def delete_user(
     user_id: Annotated[int, Path(ge=1)],
-    curren_user: UserCacheModel = Depends(get_current_admin_user),
+    curren_user: UserCacheStruct = Depends(get_current_admin_user),
     session: AsyncSession = Depends(get_db_session),
 ):
     return await Container.users_service.delete_user(
@@ -85,14 +126,22 @@ async def delete_user(
     '/users',
     response_model=UsersResponse,
     summary='Users list',
-    description='Endpoint to get information about the current user',
+    description='Endpoint to get the list of users by page number or by after/before cursors',
 )
 async def users(
-    page: Annotated[int, Query(ge=1)] = 1,
-    curren_user: UserCacheModel = Depends(get_current_admin_user),
+    response: Response,
+    page: Annotated[Optional[int], Query(ge=1)] = None,
+    after: Annotated[Optional[str], Query(max_length=32)] = None,
+    before: Annotated[Optional[str], Query(max_length=32)] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+    curren_user: UserCacheStruct = Depends(get_current_admin_user),
     session: AsyncSession = Depends(get_db_session),
 ):
     return await Container.users_service.users(
         page,
+        after,
+        before,
+        if_none_match,
+        response,
         session,
     )
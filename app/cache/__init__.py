@@ -1,6 +1,67 @@
+import time
+from contextvars import ContextVar
 from typing import Optional
 
 from redis.asyncio import ConnectionPool, Redis
+from redis.asyncio.client import Pipeline
+
+from app.core.metrics import redis_command_duration
+
+
+class RedisRoundTrips:
+    """
+    Number of Redis round trips made while serving a request
+    """
+
+    def __init__(self):
+        self.count = 0
+
+
+redis_round_trips: ContextVar[Optional[RedisRoundTrips]] = ContextVar(
+    'redis_round_trips',
+    default=None,
+)
+
+
+def _count_round_trip():
+    round_trips = redis_round_trips.get()
+    if round_trips is not None:
+        round_trips.count += 1
+
+
+class CountingPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        _count_round_trip()
+        started_at = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            redis_command_duration.observe(
+                time.perf_counter() - started_at,
+                'MULTI' if self.is_transaction else 'PIPELINE',
+            )
+
+
+class CountingRedis(Redis):
+    """
+    Redis client that counts round trips of the current request and observes
+    their latency, a pipeline or a script call is a single round trip
+    """
+
+    async def execute_command(self, *args, **options):
+        _count_round_trip()
+        started_at = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            redis_command_duration.observe(time.perf_counter() - started_at, args[0])
+
+    def pipeline(
+        self, transaction: bool = True, shard_hint: Optional[str] = None
+    ) -> CountingPipeline:
+        return CountingPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
 
 
 async def get_redis_client(
@@ -16,11 +77,10 @@ async def get_redis_client(
         protocol = 'redis'
 
     pool: ConnectionPool = ConnectionPool.from_url(
-        f'{protocol}://{redis_username}:{redis_password}@{redis_host}:{redis_port}?decode_responses=True',
-        decode_responses=True,
+        f'{protocol}://{redis_username}:{redis_password}@{redis_host}:{redis_port}',
     )
-    redis_client = Redis(
+    # Responses are left as bytes, cache entries are binary-safe codec payloads
+    redis_client = CountingRedis(
         connection_pool=pool,
-        decode_responses=True,
     )
     return redis_client
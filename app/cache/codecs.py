@@ -0,0 +1,157 @@
+"""
+Codecs of user cache entries.
+Every encoded entry starts with a format byte, so entries written by another codec (or by
+an older version of the application) are still readable or, if unknown, treated as a miss.
+The format byte is followed by the schema version of UserCacheStruct, entries of another
+version are misses too, the binary codec would misread them.
+"""
+
+import json
+import struct
+from typing import Optional
+
+import pydantic_core
+
+from app.cache.exceptions import CacheObjectDoesNotExist
+from app.cache.models.user import UserCacheJson, UserCacheStruct
+
+
+# Bumped whenever the fields of UserCacheStruct change
+SCHEMA_VERSION = b'\x01'
+
+
+class BaseCacheCodec:
+    format_byte: bytes
+
+    def encode(self, user: UserCacheStruct) -> bytes:
+        raise NotImplementedError
+
+    def decode_payload(self, payload: bytes) -> UserCacheStruct:
+        raise NotImplementedError
+
+
+class JsonCacheCodec(BaseCacheCodec):
+    format_byte = b'\x01'
+
+    def encode(self, user: UserCacheStruct) -> bytes:
+        return self.format_byte + SCHEMA_VERSION + encode_json(user)
+
+    def decode_payload(self, payload: bytes) -> UserCacheStruct:
+        return UserCacheStruct(**pydantic_core.from_json(payload))
+
+
+class BinaryCacheCodec(BaseCacheCodec):
+    """
+    Fixed header: id (int64), flags (uint8) and the utf-8 lengths of email, first_name
+    and last_name (uint16 each), followed by the three strings.
+    Users with longer strings are written by the json codec, decode reads both.
+    """
+
+    format_byte = b'\x02'
+
+    HEADER = struct.Struct('<qBHHH')
+
+    VERIFIED_FLAG = 1
+    IS_ADMIN_FLAG = 2
+    FIRST_NAME_NONE_FLAG = 4
+    LAST_NAME_NONE_FLAG = 8
+
+    def encode(self, user: UserCacheStruct) -> bytes:
+        flags = 0
+        if user.verified:
+            flags |= self.VERIFIED_FLAG
+        if user.is_admin:
+            flags |= self.IS_ADMIN_FLAG
+        if user.first_name is None:
+            flags |= self.FIRST_NAME_NONE_FLAG
+        if user.last_name is None:
+            flags |= self.LAST_NAME_NONE_FLAG
+
+        email = user.email.encode()
+        first_name = (user.first_name or '').encode()
+        last_name = (user.last_name or '').encode()
+        try:
+            header = self.HEADER.pack(
+                user.id, flags, len(email), len(first_name), len(last_name)
+            )
+        except struct.error:
+            return CACHE_CODECS['json'].encode(user)
+
+        return b''.join(
+            (
+                self.format_byte,
+                SCHEMA_VERSION,
+                header,
+                email,
+                first_name,
+                last_name,
+            )
+        )
+
+    def decode_payload(self, payload: bytes) -> UserCacheStruct:
+        _id, flags, email_length, first_name_length, last_name_length = (
+            self.HEADER.unpack_from(payload)
+        )
+        offset = self.HEADER.size
+        email = payload[offset : offset + email_length].decode()
+        offset += email_length
+        first_name = payload[offset : offset + first_name_length].decode()
+        offset += first_name_length
+        last_name = payload[offset : offset + last_name_length].decode()
+
+        return UserCacheStruct(
+            id=_id,
+            email=email,
+            first_name=None if flags & self.FIRST_NAME_NONE_FLAG else first_name,
+            last_name=None if flags & self.LAST_NAME_NONE_FLAG else last_name,
+            verified=bool(flags & self.VERIFIED_FLAG),
+            is_admin=bool(flags & self.IS_ADMIN_FLAG),
+        )
+
+
+CACHE_CODECS: dict[str, BaseCacheCodec] = {
+    'json': JsonCacheCodec(),
+    'binary': BinaryCacheCodec(),
+}
+
+_CODECS_BY_FORMAT_BYTE = {
+    codec.format_byte[0]: codec for codec in CACHE_CODECS.values()
+}
+
+
+def encode_json(user: UserCacheStruct) -> bytes:
+    """
+    JSON of the user as the API returns it
+    """
+
+    # pydantic_core serializes slotted dataclasses natively, in field order
+    return pydantic_core.to_json(user)
+
+
+def passthrough(_id: int, value: bytes) -> Optional[UserCacheJson]:
+    """
+    :return: the stored JSON of an entry written by the json codec,
+        None for entries of other formats, they have to be decoded
+    """
+
+    if value[:2] != JsonCacheCodec.format_byte + SCHEMA_VERSION:
+        return None
+    return UserCacheJson(id=_id, json=value[2:])
+
+
+def decode(value: bytes) -> UserCacheStruct:
+    """
+    Decodes an entry written by any codec
+    """
+
+    codec = _CODECS_BY_FORMAT_BYTE.get(value[0]) if value else None
+    if codec is not None:
+        if value[1:2] != SCHEMA_VERSION:
+            raise CacheObjectDoesNotExist
+        return codec.decode_payload(value[2:])
+
+    # Plain pydantic JSON written before the codecs were introduced
+    if value[:1] == b'{':
+        return UserCacheStruct(**json.loads(value))
+
+    raise CacheObjectDoesNotExist
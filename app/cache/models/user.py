@@ -1,8 +1,29 @@
+from dataclasses import dataclass
 from typing import Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 
 class UserCacheModel(BaseModel):
+    # Responses are validated straight from UserCacheStruct instances
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+
+    email: str
+    first_name: Optional[str]
+    last_name: Optional[str]
+
+    verified: bool
+    is_admin: bool
+
+
+@dataclass(slots=True)
+class UserCacheStruct:
+    """
+    Lightweight in-process representation of a cached user,
+    converted to UserCacheModel only at the response boundary
+    """
+
     id: int
 
     email: str
@@ -11,3 +32,14 @@ class UserCacheModel(BaseModel):
 
     verified: bool
     is_admin: bool
+
+
+@dataclass(slots=True)
+class UserCacheJson:
+    """
+    Cached user kept as the JSON stored by the json codec,
+    it is sent to the client without being decoded and encoded again
+    """
+
+    id: int
+    json: bytes
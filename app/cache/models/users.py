@@ -1,7 +0,0 @@
-from pydantic import BaseModel
-
-from app.cache.models.user import UserCacheModel
-
-
-class UsersCacheModel(BaseModel):
-    users: list[UserCacheModel]
@@ -1,17 +1,51 @@
-from typing import TYPE_CHECKING
+import datetime
+import secrets
+from typing import TYPE_CHECKING, Optional
 
 from app.cache.exceptions import CacheObjectDoesNotExist
+from app.core.environment import env
 
 if TYPE_CHECKING:
     from app.core.container import Container
 
 
 class BaseCacheRepo:
+    """
+    Base parent class of cache repositories.
+    Besides key naming it holds the shared command layer: operations that would take several
+    commands are combined into a single round trip with pipelines, MULTI or Lua scripts.
+    """
+
+    # Increments a counter only while it exists, so a missing counter is not resurrected
+    # with a partial value and gets loaded from the database instead
+    INCR_EXISTING_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 1 then
+        return redis.call('INCRBY', KEYS[1], ARGV[1])
+    end
+    return nil
+    """
+
+    # GET with a sliding TTL that is only written once the remaining TTL drops below
+    # the threshold, instead of an EXPIRE on every hit
+    GET_SLIDING_SCRIPT = """
+    local value = redis.call('GET', KEYS[1])
+    if value and redis.call('PTTL', KEYS[1]) < tonumber(ARGV[2]) then
+        redis.call('PEXPIRE', KEYS[1], ARGV[1])
+    end
+    return value
+    """
 
     def __init__(self, container: type['Container']):
         self.container = container
         self.prefix_key = self.__class__.__name__.lower()
 
+        self._incr_existing = self.container.redis_client.register_script(
+            self.INCR_EXISTING_SCRIPT
+        )
+        self._get_sliding = self.container.redis_client.register_script(
+            self.GET_SLIDING_SCRIPT
+        )
+
     @staticmethod
     async def check_object_exists(obj):
         if obj is None:
@@ -21,3 +55,38 @@ class BaseCacheRepo:
         exists = await self.container.redis_client.exists(key)
         if not exists:
             raise CacheObjectDoesNotExist
+
+    async def get_sliding(self, key: str, ttl: datetime.timedelta) -> Optional[str]:
+        ttl_ms = int(ttl.total_seconds() * 1000)
+        return await self._get_sliding(
+            keys=[key],
+            args=[ttl_ms, int(ttl_ms * env.cache_ttl_refresh_ratio)],
+        )
+
+    async def incr_existing(self, key: str, amount: int) -> Optional[int]:
+        return await self._incr_existing(
+            keys=[key],
+            args=[amount],
+        )
+
+    async def get_version_token(self, key: str) -> str:
+        """
+        Opaque token that changes whenever the versioned data changes.
+        A missing token is created at random, so a token never repeats after it expired.
+        """
+
+        async with self.pipeline() as pipe:
+            pipe.set(key, secrets.token_hex(8), nx=True, ex=datetime.timedelta(days=1))
+            pipe.get(key)
+            _, token = await pipe.execute()
+        return token.decode() if isinstance(token, bytes) else token
+
+    async def bump_version_token(self, key: str):
+        await self.container.redis_client.set(
+            key,
+            secrets.token_hex(8),
+            ex=datetime.timedelta(days=1),
+        )
+
+    def pipeline(self, transaction: bool = False):
+        return self.container.redis_client.pipeline(transaction=transaction)
@@ -0,0 +1,189 @@
+import hashlib
+import math
+from typing import AsyncIterator, Optional
+
+from app.cache.repos import BaseCacheRepo
+from app.core.environment import env
+
+
+class EmailFilterCacheRepo(BaseCacheRepo):
+    """
+    Bloom filter of registered emails in a Redis bitmap.
+    A negative answer is definite, a positive one is a 'maybe' that has to be checked
+    in the database. Bits of deleted users are only cleared by the periodic rebuild.
+    """
+
+    # -1 while the filter is not built, the caller has to ask the database then
+    CHECK_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return -1
+    end
+    for i = 1, #ARGV do
+        if redis.call('GETBIT', KEYS[1], ARGV[i]) == 0 then
+            return 0
+        end
+    end
+    return 1
+    """
+
+    # Bits are only set in filters that exist (the live one and the one being rebuilt),
+    # a filter made of new emails alone would answer 'not registered' for older ones
+    ADD_SCRIPT = """
+    for _, key in ipairs(KEYS) do
+        if redis.call('EXISTS', key) == 1 then
+            for i = 1, #ARGV do
+                redis.call('SETBIT', key, ARGV[i], 1)
+            end
+        end
+    end
+    """
+
+    def __init__(self, container):
+        super().__init__(container)
+
+        # Optimal size and number of hash functions for the capacity and error rate
+        self.capacity = env.email_filter_capacity
+        self.error_rate = env.email_filter_error_rate
+        self.size = math.ceil(
+            -self.capacity * math.log(self.error_rate) / math.log(2) ** 2
+        )
+        self.hash_count = max(round(self.size / self.capacity * math.log(2)), 1)
+
+        # A filter of another size is a different filter, it is never mixed up
+        self.filter_key = f'{self.prefix_key}:{self.size}:{self.hash_count}'
+        self.building_key = f'{self.filter_key}-building'
+
+        self._check = self.container.redis_client.register_script(self.CHECK_SCRIPT)
+        self._add = self.container.redis_client.register_script(self.ADD_SCRIPT)
+
+        self.checks = 0
+        self.absent = 0
+        self.maybe = 0
+        self.false_positives = 0
+        self.unavailable = 0
+        self.fill_ratio = 0.0
+
+    def offsets(self, email: str) -> list[int]:
+        """
+        Bit offsets of the email by double hashing of a single digest
+        """
+
+        digest = hashlib.blake2b(email.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    async def might_contain(self, email: str) -> Optional[bool]:
+        """
+        :return: False if the email is surely not registered, True if it may be,
+            None if the filter is not built yet
+        """
+
+        result = await self._check(keys=[self.filter_key], args=self.offsets(email))
+        self.checks += 1
+        if result == -1:
+            self.unavailable += 1
+            return None
+        if result == 0:
+            self.absent += 1
+            return False
+        self.maybe += 1
+        return True
+
+    async def add(self, email: str):
+        await self._add(
+            keys=[self.filter_key, self.building_key],
+            args=self.offsets(email),
+        )
+
+    async def lock_rebuild(self, interval: int, timeout: int = 600) -> bool:
+        """
+        :return: True if the caller should rebuild the filter now, because it is
+            missing or older than interval seconds and nobody else is rebuilding it
+        """
+
+        async with self.pipeline() as pipe:
+            pipe.exists(self.filter_key)
+            pipe.exists(f'{self.filter_key}-rebuilt')
+            filter_exists, rebuilt = await pipe.execute()
+        if filter_exists and rebuilt:
+            return False
+
+        locked = await self.container.redis_client.set(
+            f'{self.filter_key}-rebuild-lock',
+            1,
+            nx=True,
+            ex=timeout,
+        )
+        return bool(locked)
+
+    async def rebuild(self, emails: AsyncIterator[list[str]], interval: int) -> int:
+        """
+        Builds a new filter next to the live one and swaps it in atomically
+
+        :param emails: all registered emails in chunks
+        :return: number of added emails
+        """
+
+        try:
+            count = await self._build(emails)
+        except BaseException:
+            # Another worker may retry straight away instead of after the lock timeout
+            await self.container.redis_client.delete(
+                self.building_key,
+                f'{self.filter_key}-rebuild-lock',
+            )
+            raise
+
+        async with self.pipeline(transaction=True) as pipe:
+            pipe.rename(self.building_key, self.filter_key)
+            pipe.set(f'{self.filter_key}-rebuilt', count, ex=interval)
+            pipe.delete(f'{self.filter_key}-rebuild-lock')
+            await pipe.execute()
+        return count
+
+    async def _build(self, emails: AsyncIterator[list[str]]) -> int:
+        await self.container.redis_client.delete(self.building_key)
+        # Allocates the whole bitmap, so emails created meanwhile are added to it too
+        await self.container.redis_client.setbit(self.building_key, self.size - 1, 0)
+
+        count = 0
+        async for chunk in emails:
+            arguments = list()
+            for email in chunk:
+                for offset in self.offsets(email):
+                    arguments.extend(('SET', 'u1', offset, 1))
+            if arguments:
+                await self.container.redis_client.execute_command(
+                    'BITFIELD',
+                    self.building_key,
+                    *arguments,
+                )
+            count += len(chunk)
+        return count
+
+    async def update_fill_ratio(self) -> float:
+        """
+        Share of set bits, the real false positive rate is about fill_ratio ** hash_count
+        """
+
+        self.fill_ratio = (
+            await self.container.redis_client.bitcount(self.filter_key) / self.size
+        )
+        return self.fill_ratio
+
+    def stats(self) -> dict[str, float]:
+        return {
+            'capacity': self.capacity,
+            'error_rate': self.error_rate,
+            'size_bits': self.size,
+            'memory_bytes': math.ceil(self.size / 8),
+            'hash_count': self.hash_count,
+            'fill_ratio': self.fill_ratio,
+            'estimated_error_rate': self.fill_ratio**self.hash_count,
+            'checks': self.checks,
+            'absent': self.absent,
+            'maybe': self.maybe,
+            'false_positives': self.false_positives,
+            'unavailable': self.unavailable,
+        }
@@ -0,0 +1,86 @@
+import json
+import time
+
+from redis.exceptions import WatchError
+
+from app.cache.repos import BaseCacheRepo
+from app.core.metrics import retire
+
+
+class MetricsCacheRepo(BaseCacheRepo):
+    """
+    Metrics snapshots of the workers, one hash field per worker.
+    Snapshots of stopped workers are folded into a single retired snapshot,
+    dropping them would make the merged counters go down.
+    """
+
+    def __init__(self, container):
+        super().__init__(container)
+        self.retired_key = f'{self.prefix_key}:retired'
+
+    async def publish(self, worker: str, snapshot: str):
+        await self.container.redis_client.hset(self.prefix_key, worker, snapshot)
+
+    async def get_snapshots(
+        self,
+        max_age: float,
+        retire_after: float,
+    ) -> tuple[list[dict], list[dict]]:
+        """
+        :param max_age: snapshots updated within max_age seconds belong to live workers
+        :param retire_after: snapshots older than this are folded into the retired one
+        :return: snapshots of live workers and snapshots of stopped ones
+            including the retired one
+        """
+
+        async with self.pipeline() as pipe:
+            pipe.hgetall(self.prefix_key)
+            pipe.get(self.retired_key)
+            values, retired_value = await pipe.execute()
+
+        snapshots = list()
+        stopped_snapshots = list()
+        retired_workers = list()
+        now = time.time()
+        for worker, value in values.items():
+            snapshot = json.loads(value)
+            if now - snapshot['updated_at'] <= max_age:
+                snapshots.append(snapshot)
+                continue
+            stopped_snapshots.append(snapshot)
+            if now - snapshot['updated_at'] > retire_after:
+                retired_workers.append(worker)
+
+        if retired_value is not None:
+            stopped_snapshots.append(json.loads(retired_value))
+
+        if retired_workers:
+            await self._retire(retired_workers)
+        return snapshots, stopped_snapshots
+
+    async def _retire(self, workers: list):
+        """
+        Moves the snapshots of the workers into the retired one in a transaction,
+        a worker is never counted twice or dropped by concurrent scrapes
+        """
+
+        async with self.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(self.prefix_key, self.retired_key)
+                values = await pipe.hmget(self.prefix_key, workers)
+                retired_value = await pipe.get(self.retired_key)
+
+                snapshots = [json.loads(value) for value in values if value is not None]
+                if retired_value is not None:
+                    snapshots.append(json.loads(retired_value))
+
+                pipe.multi()
+                pipe.set(
+                    self.retired_key,
+                    json.dumps(retire(snapshots), separators=(',', ':')),
+                )
+                pipe.hdel(self.prefix_key, *workers)
+                await pipe.execute()
+            except WatchError:
+                # A snapshot was published meanwhile, a later scrape retires the workers
+                pass
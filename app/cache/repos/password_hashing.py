@@ -0,0 +1,53 @@
+import json
+from dataclasses import asdict
+
+from app.cache.repos import BaseCacheRepo
+from app.core.environment import env
+from app.core.hashing import PasswordHashingParameters
+
+
+class PasswordHashingCacheRepo(BaseCacheRepo):
+    """
+    Calibrated password hashing parameters shared by all workers.
+    The first stored parameters win, so the fleet hashes with the same ones and stored
+    hashes are not upgraded back and forth. They expire, so the calibration follows
+    changes of the hardware.
+    """
+
+    def _key(self, target_latency: float, memory_cost: int, parallelism: int) -> str:
+        return f'{self.prefix_key}-{target_latency}-{memory_cost}-{parallelism}'
+
+    async def get_parameters(
+        self,
+        target_latency: float,
+        memory_cost: int,
+        parallelism: int,
+    ) -> PasswordHashingParameters:
+        value = await self.container.redis_client.get(
+            self._key(target_latency, memory_cost, parallelism)
+        )
+        await self.check_object_exists(value)
+        return PasswordHashingParameters(**json.loads(value))
+
+    async def set_parameters(
+        self,
+        target_latency: float,
+        memory_cost: int,
+        parallelism: int,
+        parameters: PasswordHashingParameters,
+    ) -> PasswordHashingParameters:
+        """
+        :return: the parameters stored first, which may come from another worker
+        """
+
+        key = self._key(target_latency, memory_cost, parallelism)
+        async with self.pipeline(transaction=True) as pipeline:
+            pipeline.set(
+                key,
+                json.dumps(asdict(parameters)),
+                nx=True,
+                ex=env.password_hashing_calibration_ttl,
+            )
+            pipeline.get(key)
+            _, value = await pipeline.execute()
+        return PasswordHashingParameters(**json.loads(value))
@@ -0,0 +1,62 @@
+from app.cache.repos import BaseCacheRepo
+
+
+class RateLimitCacheRepo(BaseCacheRepo):
+    """
+    Token buckets of the rate limits, one hash per bucket.
+    A bucket holds up to capacity tokens and is refilled evenly, each request takes one.
+    """
+
+    # Refills and takes a token in one atomic call, the clock of Redis is shared by all
+    # workers. Returns whether the request is allowed and otherwise in how many ms
+    # the next token is there.
+    TAKE_TOKEN_SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local refill_per_ms = tonumber(ARGV[2])
+    local time = redis.call('TIME')
+    local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated_at = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(now - updated_at, 0) * refill_per_ms)
+
+    local allowed = 0
+    local retry_after = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    else
+        retry_after = math.ceil((1 - tokens) / refill_per_ms)
+    end
+
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', now)
+    -- A full bucket is the same as a missing one
+    local refilled_in = math.ceil((capacity - tokens) / refill_per_ms)
+    redis.call('PEXPIRE', KEYS[1], math.max(refilled_in, 1))
+    return {allowed, retry_after}
+    """
+
+    def __init__(self, container):
+        super().__init__(container)
+        self._take_token = self.container.redis_client.register_script(
+            self.TAKE_TOKEN_SCRIPT
+        )
+
+    async def take_token(
+        self,
+        name: str,
+        key: str,
+        capacity: int,
+        period: float,
+    ) -> float:
+        """
+        :param period: seconds in which an empty bucket is refilled
+        :return: 0 if the request is allowed, otherwise seconds until it would be
+        """
+
+        allowed, retry_after_ms = await self._take_token(
+            keys=[f'{self.prefix_key}:{name}:{key}'],
+            args=[capacity, capacity / (period * 1000)],
+        )
+        return 0 if allowed else retry_after_ms / 1000
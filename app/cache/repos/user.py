@@ -1,41 +1,160 @@
 import datetime
+import time
+from typing import Optional, Union
 
+from app.core.environment import env
+from app.core.senders import VerificationCodeMessage
 from app.db.models.user import UserDbModel
 
+from app.cache.codecs import decode, passthrough
+from app.cache.exceptions import CacheObjectDoesNotExist
 from app.cache.repos import BaseCacheRepo
-from app.cache.models.user import UserCacheModel
+from app.cache.models.user import UserCacheJson, UserCacheStruct
 
 
 class UserCacheRepo(BaseCacheRepo):
 
-    async def get(self, _id: int) -> UserCacheModel:
-        key = await self._get_key(_id)
-        value = await self.container.redis_client.get(key)
-        await self.check_object_exists(value)
+    # 1 for the right code, 0 for a wrong or missing one, -1 once the attempts are used up.
+    # Wrong codes are counted per user for the lifetime of a code, resending a code does
+    # not reset them, the last allowed miss deletes the code.
+    CHECK_VERIFICATION_CODE_SCRIPT = """
+    local attempts = tonumber(redis.call('GET', KEYS[2]) or '0')
+    if attempts >= tonumber(ARGV[2]) then
+        return -1
+    end
+    local saved_code = redis.call('GET', KEYS[1])
+    if not saved_code then
+        return 0
+    end
+    if saved_code == ARGV[1] then
+        return 1
+    end
+    attempts = redis.call('INCR', KEYS[2])
+    if attempts == 1 then
+        redis.call('EXPIRE', KEYS[2], ARGV[3])
+    end
+    if attempts >= tonumber(ARGV[2]) then
+        redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
 
-        user_cache_model = UserCacheModel.model_validate_json(value)
+    def __init__(self, container):
+        super().__init__(container)
 
-        await self.container.redis_client.expire(
-            key,
-            datetime.timedelta(hours=1),
+        self._check_verification_code = self.container.redis_client.register_script(
+            self.CHECK_VERIFICATION_CODE_SCRIPT
         )
-        return user_cache_model
+
+    async def get(
+        self,
+        _id: int,
+        json: bool = False,
+    ) -> Union[UserCacheStruct, UserCacheJson]:
+        """
+        :param json: return the stored JSON of json codec entries instead of decoding it
+        """
+
+        key = await self._get_key(_id)
+        value = await self.get_sliding(key, datetime.timedelta(hours=1))
+        await self.check_object_exists(value)
+
+        return (json and passthrough(_id, value)) or decode(value)
 
     async def set(self, user_db_model: UserDbModel):
         key = await self._get_key(user_db_model.id)
         user_cache_model = await self.db_model_to_cache(user_db_model)
         await self.container.redis_client.set(
             key,
-            user_cache_model.model_dump_json(),
+            self.container.cache_codec.encode(user_cache_model),
             ex=datetime.timedelta(hours=1),
         )
         return user_cache_model
 
-    async def update(self, user_cache_model: UserCacheModel):
+    async def set_with_email(self, user_db_model: UserDbModel) -> UserCacheStruct:
+        """
+        Caches the user together with its email directory entry in one round trip
+        """
+
+        user_cache_model = await self.db_model_to_cache(user_db_model)
+        async with self.pipeline() as pipe:
+            pipe.set(
+                await self._get_key(user_cache_model.id),
+                self.container.cache_codec.encode(user_cache_model),
+                ex=datetime.timedelta(hours=1),
+            )
+            pipe.set(
+                await self._get_email_key(user_cache_model.email),
+                user_cache_model.id,
+                ex=datetime.timedelta(days=7),
+            )
+            await pipe.execute()
+        return user_cache_model
+
+    async def get_id_by_email(self, email: str) -> int:
+        """
+        Emails never change, an entry can only be stale once the user is deleted
+        """
+
+        value = await self.container.redis_client.get(await self._get_email_key(email))
+        await self.check_object_exists(value)
+        return int(value)
+
+    async def delete_email(self, email: str):
+        await self.container.redis_client.delete(await self._get_email_key(email))
+
+    async def get_many(
+        self,
+        ids: list[int],
+        json: bool = False,
+    ) -> list[Optional[Union[UserCacheStruct, UserCacheJson]]]:
+        """
+        :param json: return the stored JSON of json codec entries instead of decoding it
+        :return: users in the order of ids, None for the ones missing in the cache
+        """
+
+        if not ids:
+            return list()
+
+        values = await self.container.redis_client.mget(
+            [await self._get_key(_id) for _id in ids]
+        )
+        user_cache_models = list()
+        for _id, value in zip(ids, values):
+            if value is None:
+                user_cache_models.append(None)
+                continue
+            try:
+                user_cache_models.append(
+                    (json and passthrough(_id, value)) or decode(value)
+                )
+            except CacheObjectDoesNotExist:
+                user_cache_models.append(None)
+        return user_cache_models
+
+    async def set_many(
+        self, user_db_models: list[UserDbModel]
+    ) -> list[UserCacheStruct]:
+        user_cache_models = list()
+
+        async with self.pipeline() as pipe:
+            for user_db_model in user_db_models:
+                user_cache_model = await self.db_model_to_cache(user_db_model)
+                pipe.set(
+                    await self._get_key(user_cache_model.id),
+                    self.container.cache_codec.encode(user_cache_model),
+                    ex=datetime.timedelta(hours=1),
+                )
+                user_cache_models.append(user_cache_model)
+            await pipe.execute()
+
+        return user_cache_models
+
+    async def update(self, user_cache_model: UserCacheStruct):
         key = await self._get_key(user_cache_model.id)
         await self.container.redis_client.set(
             key,
-            user_cache_model.model_dump_json(),
+            self.container.cache_codec.encode(user_cache_model),
             ex=datetime.timedelta(hours=1),
         )
 
@@ -43,44 +162,79 @@ class UserCacheRepo(BaseCacheRepo):
         key = await self._get_key(_id)
         await self.container.redis_client.delete(key)
 
-    async def set_verification_code(
-        self,
-        _id: int,
-        code: int,
-    ):
+    async def get_version(self, _id: int) -> str:
+        return await self.get_version_token(f'{await self._get_key(_id)}-version')
+
+    async def bump_version(self, _id: int):
+        await self.bump_version_token(f'{await self._get_key(_id)}-version')
+
+    async def stick_to_primary(self, _id: int):
         key = await self._get_key(_id)
         await self.container.redis_client.set(
-            f'{key}-verification-code',
-            str(code),
-            ex=datetime.timedelta(days=2),
-        )
-        await self.container.redis_client.set(
-            f'{key}-verification-code-limit',
-            str(code),
-            ex=datetime.timedelta(minutes=1),
+            f'{key}-primary',
+            1,
+            ex=env.db_replica_sticky_window,
         )
 
-    async def check_verification_code(self, _id: int, code: int) -> bool:
-        key = await self._get_key(_id)
-        saved_code = await self.container.redis_client.get(f'{key}-verification-code')
+    async def check_sticks_to_primary(self, *ids: int) -> bool:
+        """
+        :return: True if any of the users was written within the sticky window
+        """
 
-        if not saved_code:
-            return False
+        keys = [f'{await self._get_key(_id)}-primary' for _id in ids]
+        return bool(await self.container.redis_client.exists(*keys))
 
-        return saved_code == str(code)
+    async def set_verification_code(
+        self,
+        user_cache_model: UserCacheStruct,
+        code: int,
+    ):
+        """
+        Stores the code and queues its delivery in the outbox in one transaction
+        """
+
+        key = await self._get_key(user_cache_model.id)
+        async with self.pipeline(transaction=True) as pipe:
+            pipe.set(
+                f'{key}-verification-code',
+                str(code),
+                ex=env.verification_code_lifetime,
+            )
+            self.container.verification_outbox_cache_repo.append(
+                pipe,
+                VerificationCodeMessage(
+                    user_id=user_cache_model.id,
+                    email=user_cache_model.email,
+                    code=code,
+                    created_at=time.time(),
+                ),
+            )
+            await pipe.execute()
+
+    async def check_verification_code(self, _id: int, code: int) -> Optional[bool]:
+        """
+        :return: whether the code is right, None if the user has used up the attempts
+        """
 
-    async def check_verification_code_limit(self, _id: int) -> bool:
         key = await self._get_key(_id)
-        limit_exists = await self.container.redis_client.get(
-            f'{key}-verification-code-limit'
+        result = await self._check_verification_code(
+            keys=[f'{key}-verification-code', f'{key}-verification-attempts'],
+            args=[
+                str(code),
+                env.verification_code_max_attempts,
+                env.verification_code_lifetime,
+            ],
         )
-        return bool(limit_exists)
+
+        if result == -1:
+            return None
+        return result == 1
 
     async def db_model_to_cache(
         self,
         user_db_model: UserDbModel,
-    ):
-        return UserCacheModel(
+    ) -> UserCacheStruct:
+        return UserCacheStruct(
             id=user_db_model.id,
             email=user_db_model.email,
             first_name=user_db_model.first_name,
@@ -94,3 +248,9 @@ class UserCacheRepo(BaseCacheRepo):
         _id: int,
     ):
         return f'{self.prefix_key}:{_id}'
+
+    async def _get_email_key(
+        self,
+        email: str,
+    ):
+        return f'{self.prefix_key}-email:{email}'
@@ -0,0 +1,141 @@
+import asyncio
+import copy
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+from app.cache.exceptions import CacheObjectDoesNotExist
+from app.cache.local import LocalCache
+from app.cache.models.user import UserCacheStruct
+from app.cache.repos import BaseCacheRepo
+from app.core.environment import env
+
+
+class UserLocalCacheRepo(BaseCacheRepo):
+    """
+    Process-local (L1) tier in front of UserCacheRepo.
+    Entries are dropped in every worker through a Redis pub/sub channel when a user changes.
+
+    An invalidation may arrive while a reader is still loading the user from Redis or the
+    database. The reader takes the generation before loading and the loaded user is only
+    stored if the id was not invalidated since, otherwise the stale value would be served
+    until the TTL.
+
+    Entries also keep the ETag version read before they were loaded. A conditional read
+    only takes an entry of the version it has just read, an entry of an older version
+    may not have been invalidated in this worker yet.
+    """
+
+    def __init__(self, container):
+        super().__init__(container)
+        self.local_cache = LocalCache(
+            max_size=env.user_local_cache_size,
+            ttl=env.user_local_cache_ttl,
+        )
+
+        self._generation = 0
+        # Generation of the last invalidation of the most recently invalidated ids,
+        # older ones are forgotten and only the highest forgotten generation is kept
+        self._invalidated: OrderedDict[int, int] = OrderedDict()
+        self._forgotten_generation = 0
+
+    async def get(self, _id: int, version: Optional[str] = None) -> UserCacheStruct:
+        """
+        :param version: take the entry only if it was loaded under this version
+        """
+
+        entry = self.local_cache.get(_id)
+        await self.check_object_exists(entry)
+        user_cache_model, entry_version = entry
+        if version is not None and entry_version != version:
+            raise CacheObjectDoesNotExist
+
+        # Callers are allowed to modify the returned model, so the cached one is never shared
+        return copy.copy(user_cache_model)
+
+    async def get_many(self, ids: list[int]) -> list[Optional[UserCacheStruct]]:
+        """
+        :return: users in the order of ids, None for the ones missing in the cache
+        """
+
+        user_cache_models = list()
+        for _id in ids:
+            entry = self.local_cache.get(_id)
+            user_cache_models.append(copy.copy(entry[0]) if entry is not None else None)
+        return user_cache_models
+
+    def get_generation(self) -> int:
+        """
+        Taken before a user is loaded from the next tiers, see set
+        """
+
+        return self._generation
+
+    async def set(
+        self,
+        user_cache_model: UserCacheStruct,
+        generation: int,
+        version: Optional[str] = None,
+    ):
+        """
+        :param generation: generation taken before the user was loaded,
+            the user is not stored if it has been invalidated since
+        :param version: ETag version read before the user was loaded, if any
+        """
+
+        if (
+            generation < self._forgotten_generation
+            or self._invalidated.get(user_cache_model.id, 0) > generation
+        ):
+            return
+        self.local_cache.set(
+            user_cache_model.id,
+            (copy.copy(user_cache_model), version),
+        )
+
+    async def invalidate(self, _id: int):
+        self._drop(_id)
+        await self.container.redis_client.publish(self.prefix_key, str(_id))
+
+    def _drop(self, _id: int):
+        self.local_cache.delete(_id)
+
+        self._generation += 1
+        self._invalidated[_id] = self._generation
+        self._invalidated.move_to_end(_id)
+        while len(self._invalidated) > max(env.user_local_cache_size, 1):
+            _, generation = self._invalidated.popitem(last=False)
+            self._forgotten_generation = generation
+
+    def _drop_all(self):
+        self.local_cache.clear()
+
+        self._generation += 1
+        self._invalidated.clear()
+        self._forgotten_generation = self._generation
+
+    async def listen(self):
+        """
+        Drops local entries invalidated by other workers; runs for the lifetime of the worker
+        """
+
+        while True:
+            pubsub = self.container.redis_client.pubsub()
+            try:
+                await pubsub.subscribe(self.prefix_key)
+                async for message in pubsub.listen():
+                    if message['type'] != 'message':
+                        continue
+                    self._drop(int(message['data']))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception('User local cache invalidation listener failed')
+                # Invalidations may have been missed while disconnected
+                self._drop_all()
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    def stats(self) -> dict[str, int]:
+        return self.local_cache.stats()
@@ -1,49 +1,182 @@
 import datetime
+from typing import AsyncIterator, Optional
 
-from app.cache.models.users import UsersCacheModel
-from app.db.models.user import UserDbModel
-
+from app.core.environment import env
 from app.cache.repos import BaseCacheRepo
-from app.cache.models.user import UserCacheModel
 
 
 class UsersCacheRepo(BaseCacheRepo):
+    """
+    List cache of users: a sorted set of user ids scored by id,
+    the users themselves are served from the UserCacheRepo entries
+    """
 
-    async def get(self, page: int) -> list[UserCacheModel]:
-        value = await self.container.redis_client.hget(self.prefix_key, str(page))
-        await self.check_object_exists(value)
+    # Member that keeps the index existing for an empty table, it always has rank 0
+    SENTINEL = 0
 
-        users_cache_model = UsersCacheModel.model_validate_json(value)
+    # Ids are only added to indexes that exist (the live one and the one being built),
+    # an index made of new users alone would hide the older ones
+    ADD_SCRIPT = """
+    for _, key in ipairs(KEYS) do
+        if redis.call('EXISTS', key) == 1 then
+            redis.call('ZADD', key, ARGV[1], ARGV[1])
+        end
+    end
+    """
 
-        await self.container.redis_client.expire(
-            self.prefix_key,
-            datetime.timedelta(hours=1),
-        )
-        return users_cache_model.users
+    def __init__(self, container):
+        super().__init__(container)
+        self.index_key = f'{self.prefix_key}:index'
+        self.building_key = f'{self.index_key}-building'
+        self.version_key = f'{self.prefix_key}:version'
+
+        self._add = self.container.redis_client.register_script(self.ADD_SCRIPT)
+
+    async def get_version(self) -> str:
+        """
+        Version of the whole list, any change of a user changes it
+        """
+
+        return await self.get_version_token(self.version_key)
+
+    async def bump_version(self):
+        await self.bump_version_token(self.version_key)
+
+    async def get_page_ids(self, offset: int, limit: int) -> list[int]:
+        async with self.pipeline() as pipe:
+            pipe.exists(self.index_key)
+            pipe.zrange(self.index_key, offset + 1, offset + limit)
+            index_exists, user_ids = await pipe.execute()
 
-    async def set(
-        self, page: int, user_db_models: list[UserDbModel]
-    ) -> list[UserCacheModel]:
+        await self.check_object_exists(index_exists or None)
+        return [int(user_id) for user_id in user_ids]
 
-        user_cache_models = list()
+    async def get_ids_by_cursor(
+        self,
+        after: Optional[int],
+        before: Optional[int],
+        limit: int,
+    ) -> list[int]:
+        """
+        :return: ids in ascending order
+        """
 
-        for user_db_model in user_db_models:
-            user_cache_model = await self.container.user_cache_repo.db_model_to_cache(
-                user_db_model
+        async with self.pipeline() as pipe:
+            pipe.exists(self.index_key)
+            if after is not None:
+                pipe.zrangebyscore(
+                    self.index_key, f'({after}', '+inf', start=0, num=limit
+                )
+            else:
+                pipe.zrevrangebyscore(
+                    self.index_key,
+                    f'({before}',
+                    f'({self.SENTINEL}',
+                    start=0,
+                    num=limit,
+                )
+            index_exists, user_ids = await pipe.execute()
+
+        await self.check_object_exists(index_exists or None)
+
+        user_ids = [int(user_id) for user_id in user_ids]
+        if after is None:
+            user_ids.reverse()
+        return user_ids
+
+    async def get_last_ids(self, limit: int) -> list[int]:
+        """
+        :return: ids of the newest users in descending order
+        """
+
+        async with self.pipeline() as pipe:
+            pipe.exists(self.index_key)
+            pipe.zrevrangebyscore(
+                self.index_key,
+                '+inf',
+                f'({self.SENTINEL}',
+                start=0,
+                num=limit,
             )
-            user_cache_models.append(user_cache_model)
+            index_exists, user_ids = await pipe.execute()
 
-        users_cache_model = UsersCacheModel(
-            users=user_cache_models,
-        )
-        await self.container.redis_client.hset(
-            self.prefix_key, str(page), users_cache_model.model_dump_json()
+        await self.check_object_exists(index_exists or None)
+        return [int(user_id) for user_id in user_ids]
+
+    async def check_index_exists(self):
+        await self.check_key_exists(self.index_key)
+
+    async def build_index(self, user_ids: AsyncIterator[list[int]]):
+        """
+        Builds a new index next to the live one and swaps it in atomically,
+        readers never see a partially built one
+
+        :param user_ids: all user ids in chunks, read only after the new index exists,
+            so users created meanwhile are added to it as well as to the live one
+        """
+
+        async with self.pipeline(transaction=True) as pipe:
+            pipe.delete(self.building_key)
+            pipe.zadd(self.building_key, {str(self.SENTINEL): self.SENTINEL})
+            pipe.expire(
+                self.building_key,
+                datetime.timedelta(seconds=env.users_index_ttl),
+            )
+            await pipe.execute()
+
+        try:
+            async for chunk in user_ids:
+                await self.container.redis_client.zadd(
+                    self.building_key,
+                    {str(_id): _id for _id in chunk},
+                )
+            await self.container.redis_client.rename(self.building_key, self.index_key)
+        except BaseException:
+            await self.container.redis_client.delete(self.building_key)
+            raise
+
+    async def add(self, _id: int):
+        await self._add(
+            keys=[self.index_key, self.building_key],
+            args=[_id],
         )
-        await self.container.redis_client.expire(
-            self.prefix_key,
-            datetime.timedelta(hours=1),
+
+    async def remove(self, *ids: int) -> int:
+        """
+        :return: number of ids that were in the index
+        """
+
+        return await self.container.redis_client.zrem(self.index_key, *ids)
+
+    async def get_count(self) -> int:
+        value = await self.container.redis_client.get(f'{self.prefix_key}:count')
+        await self.check_object_exists(value)
+        return int(value)
+
+    async def set_count(self, count: int) -> Optional[int]:
+        """
+        :return: the count replaced, None if there was none
+        """
+
+        previous_count = await self.container.redis_client.set(
+            f'{self.prefix_key}:count',
+            count,
+            get=True,
         )
-        return user_cache_models
+        return int(previous_count) if previous_count is not None else None
 
-    async def clear(self):
-        await self.container.redis_client.delete(self.prefix_key)
+    async def incr_count(self, amount: int):
+        await self.incr_existing(f'{self.prefix_key}:count', amount)
+
+    async def lock_count_reconciliation(self, interval: int) -> bool:
+        """
+        :return: True if the caller should reconcile the count now
+        """
+
+        locked = await self.container.redis_client.set(
+            f'{self.prefix_key}:count-reconciliation',
+            1,
+            nx=True,
+            ex=interval,
+        )
+        return bool(locked)
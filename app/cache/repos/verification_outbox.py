@@ -0,0 +1,164 @@
+import datetime
+import time
+from typing import Optional
+
+from redis.asyncio.client import Pipeline
+from redis.exceptions import ResponseError
+
+from app.cache.repos import BaseCacheRepo
+from app.core.environment import env
+from app.core.senders import VerificationCodeMessage
+
+
+class VerificationOutboxCacheRepo(BaseCacheRepo):
+    """
+    Outbox of verification codes to deliver: a Redis stream read by the delivery workers
+    through a consumer group. Messages stay pending until they are acknowledged,
+    so a crashed worker's messages are claimed by another one.
+    """
+
+    GROUP = 'delivery'
+
+    def __init__(self, container):
+        super().__init__(container)
+        self.stream_key = f'{self.prefix_key}:stream'
+        self.dead_letter_key = f'{self.prefix_key}:dead-letter'
+
+    def append(self, pipe: Pipeline, message: VerificationCodeMessage):
+        """
+        Adds the message to a pipeline, so it is written together with the code
+        """
+
+        pipe.xadd(
+            self.stream_key,
+            {
+                'user_id': message.user_id,
+                'email': message.email,
+                'code': message.code,
+                'created_at': message.created_at,
+            },
+            maxlen=env.verification_outbox_max_length,
+            approximate=True,
+        )
+
+    async def create_group(self):
+        try:
+            await self.container.redis_client.xgroup_create(
+                self.stream_key,
+                self.GROUP,
+                id='0',
+                mkstream=True,
+            )
+        except ResponseError as exception:
+            if 'BUSYGROUP' not in str(exception):
+                raise
+
+    async def read(
+        self,
+        consumer: str,
+        count: int,
+        block: Optional[datetime.timedelta] = None,
+        pending: bool = False,
+    ) -> list[tuple[bytes, VerificationCodeMessage]]:
+        """
+        :param pending: re-read the messages of the consumer that are not acknowledged
+            instead of new ones
+        """
+
+        response = await self.container.redis_client.xreadgroup(
+            self.GROUP,
+            consumer,
+            {self.stream_key: '0' if pending else '>'},
+            count=count,
+            block=(
+                int(block.total_seconds() * 1000)
+                if block is not None and not pending
+                else None
+            ),
+        )
+        if not response:
+            return list()
+        return [
+            (message_id, self._to_message(fields))
+            for message_id, fields in response[0][1]
+            if fields
+        ]
+
+    async def claim_abandoned(
+        self,
+        consumer: str,
+        min_idle_time: datetime.timedelta,
+        count: int,
+    ) -> int:
+        """
+        Takes over messages pending longer than min_idle_time in other consumers
+
+        :return: number of claimed messages
+        """
+
+        claimed = await self.container.redis_client.xautoclaim(
+            self.stream_key,
+            self.GROUP,
+            consumer,
+            min_idle_time=int(min_idle_time.total_seconds() * 1000),
+            start_id='0-0',
+            count=count,
+            justid=True,
+        )
+        return len(claimed)
+
+    async def get_delivery_counts(
+        self,
+        consumer: str,
+        message_ids: list[bytes],
+    ) -> dict[bytes, int]:
+        pending = await self.container.redis_client.xpending_range(
+            self.stream_key,
+            self.GROUP,
+            min=min(message_ids),
+            max=max(message_ids),
+            count=len(message_ids),
+            consumername=consumer,
+        )
+        return {entry['message_id']: entry['times_delivered'] for entry in pending}
+
+    async def ack(self, message_ids: list[bytes]):
+        if message_ids:
+            async with self.pipeline(transaction=True) as pipe:
+                pipe.xack(self.stream_key, self.GROUP, *message_ids)
+                pipe.xdel(self.stream_key, *message_ids)
+                await pipe.execute()
+
+    async def move_to_dead_letter(
+        self,
+        messages: list[tuple[bytes, VerificationCodeMessage]],
+    ):
+        async with self.pipeline(transaction=True) as pipe:
+            for message_id, message in messages:
+                pipe.xadd(
+                    self.dead_letter_key,
+                    {
+                        'message_id': message_id,
+                        'user_id': message.user_id,
+                        'email': message.email,
+                        'failed_at': time.time(),
+                    },
+                    maxlen=env.verification_outbox_max_length,
+                    approximate=True,
+                )
+            pipe.xack(
+                self.stream_key,
+                self.GROUP,
+                *(message_id for message_id, _ in messages),
+            )
+            pipe.xdel(self.stream_key, *(message_id for message_id, _ in messages))
+            await pipe.execute()
+
+    @staticmethod
+    def _to_message(fields: dict[bytes, bytes]) -> VerificationCodeMessage:
+        return VerificationCodeMessage(
+            user_id=int(fields[b'user_id']),
+            email=fields[b'email'].decode(),
+            code=int(fields[b'code']),
+            created_at=float(fields[b'created_at']),
+        )
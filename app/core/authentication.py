@@ -1,36 +1,65 @@
+import hashlib
+import time
+from typing import Optional
+
 import jwt
 from fastapi import Request
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
+from app.cache.local import LocalCache
 from app.core.environment import env
 from app.core.exceptions import UnauthorizedException
+from app.schemas.rest.auth import JwtTokenPayload
 
 
 class JWTBearer(HTTPBearer):
     def __init__(self, auto_error: bool = True):
         super(JWTBearer, self).__init__(auto_error=auto_error)
 
-    async def __call__(self, request: Request):
+        # Already verified tokens by sha256 digest, each entry lives until the token expires
+        self.verified_tokens = LocalCache(
+            max_size=env.jwt_cache_size,
+            ttl=0,
+        )
+
+    async def __call__(self, request: Request) -> JwtTokenPayload:
         credentials: HTTPAuthorizationCredentials = await super(
             JWTBearer, self
         ).__call__(request)
         if credentials:
             if not credentials.scheme == 'Bearer':
                 raise UnauthorizedException(detail='Invalid authentication scheme.')
-            if not self.verify_jwt(credentials.credentials):
+            payload = self.verify_jwt(credentials.credentials)
+            if payload is None:
                 raise UnauthorizedException(detail='Invalid token or expired token.')
-            return credentials.credentials
+            return payload
         else:
             raise UnauthorizedException(detail='Invalid authorization code.')
 
-    @staticmethod
-    def verify_jwt(jwt_token: str) -> bool:
+    def verify_jwt(self, jwt_token: str) -> Optional[JwtTokenPayload]:
+        key = hashlib.sha256(jwt_token.encode()).digest()
+
+        payload = self.verified_tokens.get(key)
+        if payload is not None:
+            return payload
+
         try:
-            payload = jwt.decode(
-                jwt_token,
-                env.jwt_secretkey.get_secret_value(),
-                algorithms=[env.jwt_algorithm],
+            payload = JwtTokenPayload.model_validate(
+                jwt.decode(
+                    jwt_token,
+                    env.jwt_secretkey.get_secret_value(),
+                    algorithms=[env.jwt_algorithm],
+                )
             )
         except Exception:
-            payload = None
-        return bool(payload)
+            return None
+
+        self.verified_tokens.set(
+            key,
+            payload,
+            ttl=payload.exp.timestamp() - time.time(),
+        )
+        return payload
+
+
+jwt_bearer = JWTBearer()
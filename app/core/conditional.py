@@ -0,0 +1,44 @@
+"""
+Conditional GET: strong ETags made of cache version stamps, so an unchanged resource is
+answered with 304 after a version read, without loading or serializing the body
+"""
+
+from typing import Optional
+
+from fastapi import Response, status
+
+# Responses belong to the signed in user and may be stored, but have to be revalidated
+CACHE_CONTROL = 'private, no-cache'
+
+
+def make_etag(*parts: object) -> str:
+    return '"' + '-'.join(str(part) for part in parts) + '"'
+
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    """
+    Weak comparison of If-None-Match, as RFC 9110 requires for it.
+    '*' is never a match, whether the resource exists is only known after loading it.
+    """
+
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def set_etag(response: Response, etag: str):
+    response.headers['etag'] = etag
+    response.headers['cache-control'] = CACHE_CONTROL
+
+
+def not_modified_response(etag: str) -> Response:
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={'etag': etag, 'cache-control': CACHE_CONTROL},
+    )
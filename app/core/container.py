@@ -1,11 +1,33 @@
-from argon2 import PasswordHasher
+import asyncio
+from dataclasses import asdict
+
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
 from app.cache import get_redis_client
+from app.cache.codecs import CACHE_CODECS
+from app.cache.exceptions import CacheObjectDoesNotExist
+from app.cache.repos.email_filter import EmailFilterCacheRepo
+from app.cache.repos.metrics import MetricsCacheRepo
+from app.cache.repos.password_hashing import PasswordHashingCacheRepo
+from app.cache.repos.rate_limit import RateLimitCacheRepo
 from app.cache.repos.user import UserCacheRepo
+from app.cache.repos.user_local import UserLocalCacheRepo
 from app.cache.repos.users import UsersCacheRepo
+from app.cache.repos.verification_outbox import VerificationOutboxCacheRepo
+from app.core.authentication import jwt_bearer
 from app.core.environment import env
+from app.core.hashing import (
+    PasswordHashingExecutor,
+    PasswordHashingParameters,
+    calibrate_parameters,
+)
+from app.core.metrics import metrics, observe_component_stats
+from app.core.senders import FileVerificationCodeSender, LogVerificationCodeSender
+from app.core.singleflight import SingleFlight
+from app.db.metrics import TimedAsyncAdaptedQueuePool
 from app.db.models import BaseDbModel
+from app.db.routing import ReplicaSet, RoutingSession
+from app.db.session import LazyAsyncSession
 from app.db.repos.user import UserDbRepo
 from app.unions.user import UserUnion
 
@@ -17,29 +39,46 @@ class Container:
     This class is used as a singleton dependency throughout the application.
     """
 
+    # Set once the worker is initialised and warmed up, reported by '/health/ready'
+    ready = False
+
     @classmethod
     async def initialize(cls):
         """
         Method for initialising components
         """
 
-        cls.password_hasher = PasswordHasher()
-
         cls.__engine = create_async_engine(
             env.db_connection.get_secret_value(),
             echo=False,
+            poolclass=TimedAsyncAdaptedQueuePool,
         )
+        cls.db_replicas = None
+        if env.db_replica_connections:
+            db_replica_connections = env.db_replica_connections.get_secret_value()
+            cls.db_replicas = ReplicaSet(
+                [
+                    create_async_engine(
+                        db_connection.strip(),
+                        echo=False,
+                        poolclass=TimedAsyncAdaptedQueuePool,
+                    )
+                    for db_connection in db_replica_connections.split(',')
+                ],
+                health_check_interval=env.db_replica_health_check_interval,
+            )
         cls.async_session = async_sessionmaker(
-            bind=cls.__engine,
+            sync_session_class=RoutingSession,
+            primary=cls.__engine,
+            replicas=cls.db_replicas,
             expire_on_commit=False,
         )
 
-        cls.redis_client = await get_redis_client(
-            env.redis_host,
-            env.redis_port,
-            env.redis_username.get_secret_value() if env.redis_username else None,
-            env.redis_password.get_secret_value() if env.redis_password else None,
-            env.redis_ssl,
+        cls.cache_codec = CACHE_CODECS[env.cache_codec]
+        cls.redis_client = await cls.create_redis_client()
+
+        cls.single_flight = SingleFlight(
+            container=cls,
         )
 
         cls.user_db_repo = UserDbRepo()
@@ -50,17 +89,78 @@ class Container:
         cls.users_cache_repo = UsersCacheRepo(
             container=cls,
         )
+        cls.user_local_cache_repo = UserLocalCacheRepo(
+            container=cls,
+        )
+        cls.metrics_cache_repo = MetricsCacheRepo(
+            container=cls,
+        )
+        cls.password_hashing_cache_repo = PasswordHashingCacheRepo(
+            container=cls,
+        )
+        cls.email_filter_cache_repo = EmailFilterCacheRepo(
+            container=cls,
+        )
+        cls.verification_outbox_cache_repo = VerificationOutboxCacheRepo(
+            container=cls,
+        )
+        cls.rate_limit_cache_repo = RateLimitCacheRepo(
+            container=cls,
+        )
+
+        cls.password_hasher = PasswordHashingExecutor(
+            pool=env.password_hashing_pool,
+            max_workers=env.password_hashing_workers,
+            max_queue=env.password_hashing_max_queue,
+            parameters=await cls.get_password_hashing_parameters(),
+        )
 
         cls.user_union = UserUnion(
             container=cls,
         )
 
+        metrics.add_collector(cls.collect_metrics)
+
+    @classmethod
+    async def initialize_delivery(cls):
+        """
+        Method for initialising the components of the verification code delivery worker
+        """
+
+        cls.redis_client = await cls.create_redis_client()
+        cls.verification_outbox_cache_repo = VerificationOutboxCacheRepo(
+            container=cls,
+        )
+        if env.verification_sender == 'file':
+            cls.verification_code_sender = FileVerificationCodeSender(
+                env.verification_sender_file,
+            )
+        else:
+            cls.verification_code_sender = LogVerificationCodeSender()
+
+    @classmethod
+    async def shutdown_delivery(cls):
+        await cls.verification_code_sender.close()
+        await cls.redis_client.close()
+
+    @staticmethod
+    async def create_redis_client():
+        return await get_redis_client(
+            env.redis_host,
+            env.redis_port,
+            env.redis_username.get_secret_value() if env.redis_username else None,
+            env.redis_password.get_secret_value() if env.redis_password else None,
+            env.redis_ssl,
+        )
+
     @classmethod
     async def initialize_services(cls):
         """
         Method for initialising services
         """
 
+        from app.services.health import HealthService
+        from app.services.metrics import MetricsService
         from app.services.rest.auth import AuthService
         from app.services.rest.users import UsersService
 
@@ -70,6 +170,111 @@ class Container:
         cls.users_service = UsersService(
             container=cls,
         )
+        cls.metrics_service = MetricsService(
+            container=cls,
+        )
+        cls.health_service = HealthService(
+            container=cls,
+        )
+
+    @classmethod
+    async def initialize_background_tasks(cls):
+        """
+        Method for starting tasks that live as long as the worker
+        """
+
+        cls.background_tasks = [
+            asyncio.create_task(cls.user_local_cache_repo.listen()),
+            asyncio.create_task(cls.user_union.reconcile_count()),
+        ]
+        if cls.db_replicas is not None:
+            cls.background_tasks.append(asyncio.create_task(cls.db_replicas.monitor()))
+        if env.email_filter_enabled:
+            cls.background_tasks.append(
+                asyncio.create_task(cls.user_union.maintain_email_filter())
+            )
+        if env.metrics_enabled:
+            cls.background_tasks.append(
+                asyncio.create_task(cls.metrics_service.publish_forever())
+            )
+
+    @classmethod
+    async def get_password_hashing_parameters(cls) -> PasswordHashingParameters:
+        """
+        Method for choosing the argon2 parameters, fixed ones from the environment or
+        calibrated to the target latency by the first worker that starts
+        """
+
+        if env.password_hashing_target_latency is None:
+            return PasswordHashingParameters(
+                time_cost=env.password_hashing_time_cost,
+                memory_cost=env.password_hashing_memory_cost,
+                parallelism=env.password_hashing_parallelism,
+            )
+
+        calibration = (
+            env.password_hashing_target_latency,
+            env.password_hashing_memory_cost,
+            env.password_hashing_parallelism,
+        )
+
+        async def calibrate() -> PasswordHashingParameters:
+            parameters = await asyncio.to_thread(calibrate_parameters, *calibration)
+            return await cls.password_hashing_cache_repo.set_parameters(
+                *calibration,
+                parameters,
+            )
+
+        try:
+            return await cls.password_hashing_cache_repo.get_parameters(*calibration)
+        except CacheObjectDoesNotExist:
+            # Workers starting together would slow down each other's measurements
+            return await cls.single_flight.do(
+                'password-hashing-calibration',
+                calibrate,
+                lambda: cls.password_hashing_cache_repo.get_parameters(*calibration),
+            )
+
+    @classmethod
+    def collect_metrics(cls):
+        """
+        Method for exporting the statistics of components as metrics
+        """
+
+        observe_component_stats('user_local_cache', cls.user_local_cache_repo.stats())
+        observe_component_stats('jwt_cache', jwt_bearer.verified_tokens.stats())
+        observe_component_stats(
+            'password_hashing',
+            cls.password_hasher.stats() | asdict(cls.password_hasher.parameters),
+        )
+        observe_component_stats('db_sessions', LazyAsyncSession.stats())
+        if env.email_filter_enabled:
+            observe_component_stats(
+                'email_filter',
+                cls.email_filter_cache_repo.stats(),
+            )
+        if cls.db_replicas is not None:
+            observe_component_stats(
+                'db_replicas',
+                {
+                    'total': len(cls.db_replicas.engines),
+                    'healthy': len(cls.db_replicas.healthy),
+                },
+            )
+
+    @classmethod
+    async def shutdown(cls):
+        """
+        Method for stopping background tasks and closing connections
+        """
+
+        for task in cls.background_tasks:
+            task.cancel()
+        await asyncio.gather(*cls.background_tasks, return_exceptions=True)
+
+        cls.password_hasher.shutdown()
+
+        await cls.redis_client.close()
 
     @classmethod
     async def initialize_database(cls):
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Literal, Optional
 
 from pydantic import SecretStr
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -15,9 +15,15 @@ class Environment(BaseSettings):
     jwt_secretkey: SecretStr
     access_token_lifetime: int
     refresh_token_lifetime: int
+    jwt_cache_size: int = 10000
 
     # Database
     db_connection: SecretStr
+    # Comma separated read replicas, reads go to the primary when none are set
+    db_replica_connections: Optional[SecretStr] = None
+    db_replica_health_check_interval: float = 5
+    # Reads of a user stay on the primary this long after it is written, in seconds
+    db_replica_sticky_window: int = 5
 
     # Redis
     redis_host: str
@@ -25,9 +31,99 @@ class Environment(BaseSettings):
     redis_username: Optional[SecretStr] = None
     redis_password: Optional[SecretStr] = None
     redis_ssl: bool = False
+    cache_codec: Literal['json', 'binary'] = 'json'
+    # Sliding TTLs are refreshed once less than this share of the TTL remains
+    cache_ttl_refresh_ratio: float = 0.5
+    # User reads send the JSON stored by the 'json' codec to the client as is
+    cache_passthrough_enabled: bool = True
+
+    # Process-local user cache (size 0 disables it)
+    user_local_cache_size: int = 10000
+    user_local_cache_ttl: float = 30
+
+    # Coalescing of concurrent cache misses, in seconds
+    single_flight_lock_timeout: float = 5
+    single_flight_wait_timeout: float = 1
+    single_flight_poll_interval: float = 0.05
+
+    # Password hashing executor
+    password_hashing_pool: Literal['process', 'thread'] = 'process'
+    password_hashing_workers: int = 2
+    password_hashing_max_queue: int = 32
+    # Argon2 parameters (memory cost in KiB). With a target latency in seconds the time
+    # cost is calibrated on startup instead, once for all workers sharing the Redis
+    password_hashing_time_cost: int = 3
+    password_hashing_memory_cost: int = 65536
+    password_hashing_parallelism: int = 4
+    password_hashing_target_latency: Optional[float] = None
+    # Calibrated parameters are measured again after this many seconds, e.g. on new hardware
+    password_hashing_calibration_ttl: int = 86400
+
+    # Bloom filter of registered emails, sign-ups of new emails skip the existence query.
+    # Sized for the capacity at the error rate, rebuilt this often in seconds
+    email_filter_enabled: bool = True
+    email_filter_capacity: int = 1000000
+    email_filter_error_rate: float = 0.01
+    email_filter_rebuild_interval: int = 86400
+
+    # Token bucket rate limits of the auth routes, 'capacity/seconds'
+    rate_limits_enabled: bool = True
+    rate_limit_sign_up_ip: str = '10/60'
+    rate_limit_sign_in_ip: str = '30/60'
+    rate_limit_sign_in_email: str = '10/300'
+    rate_limit_resend_verification_code_user: str = '1/60'
+    rate_limit_check_verification_code_user: str = '5/300'
+
+    # Verification codes are delivered by 'python -m app.delivery' from a Redis stream
+    verification_code_lifetime: int = 172800
+    # Wrong codes a user may enter within the code lifetime, the code is deleted then
+    verification_code_max_attempts: int = 10
+    verification_sender: Literal['log', 'file'] = 'log'
+    verification_sender_file: str = 'verification_codes.jsonl'
+    verification_batch_size: int = 100
+    verification_max_attempts: int = 5
+    verification_retry_backoff: float = 1
+    verification_retry_backoff_max: float = 60
+    # Messages a delivery worker has not acknowledged for this long are taken over
+    verification_claim_idle: float = 60
+    verification_outbox_max_length: int = 100000
 
     pagination_items: int = 30
 
+    # Metrics of every worker are published to Redis for '/metrics' this often, in seconds
+    metrics_enabled: bool = True
+    metrics_publish_interval: float = 5
+    # Counters of a worker silent this long are folded into the totals of stopped workers
+    metrics_retire_after: float = 300
+    # '/metrics' is served to clients from these networks (comma separated)
+    # and to scrapers sending the token as 'Authorization: Bearer <token>'
+    metrics_allowed_networks: str = '127.0.0.1/32,::1/128'
+    metrics_token: Optional[SecretStr] = None
+
+    # Profiling of requests sent by admins with the 'X-Profile' header,
+    # profiles are returned in the response body when no directory is set
+    profiler_output_dir: Optional[str] = None
+    profiler_max_concurrent: int = 1
+    profiler_sample_interval: float = 0.001
+
+    # Users count maintained in Redis, 'estimate' seeds it from pg_class.reltuples
+    users_count_mode: Literal['exact', 'estimate'] = 'exact'
+    users_count_reconcile_interval: int = 300
+    # The list index is rebuilt from the database at least this often, in seconds
+    users_index_ttl: int = 86400
+
+    # Warmup of a worker before it serves traffic: pooled connections are opened and the
+    # hot queries prepared on each of them, the first list pages and the newest users
+    # are optionally loaded into the caches. '/health/ready' fails until it is over
+    warmup_enabled: bool = True
+    warmup_db_connections: int = 5
+    warmup_redis_connections: int = 5
+    warmup_list_pages: int = 0
+    warmup_last_users: int = 0
+    warmup_timeout: float = 30
+    # Redis and the database have to answer '/health/ready' within this many seconds
+    health_check_timeout: float = 1
+
     model_config = SettingsConfigDict(
         env_file='.env',
         env_file_encoding='utf-8',
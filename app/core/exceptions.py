@@ -39,6 +39,20 @@ class DuplicateException(HTTPException):
         super().__init__(status.HTTP_409_CONFLICT, detail, headers)
 
 
+class ServiceUnavailableException(HTTPException):
+    def __init__(
+        self, detail: Any = None, headers: Optional[dict[str, Any]] = None
+    ) -> None:
+        super().__init__(status.HTTP_503_SERVICE_UNAVAILABLE, detail, headers)
+
+
+class TooManyRequestsException(HTTPException):
+    def __init__(
+        self, detail: Any = None, headers: Optional[dict[str, Any]] = None
+    ) -> None:
+        super().__init__(status.HTTP_429_TOO_MANY_REQUESTS, detail, headers)
+
+
 class ErrorMessageCodes(str, Enum):
     AUTH_FAILED = 'AUTH_FAILED'
     EMAIL_ALREADY_REGISTERED = 'EMAIL_ALREADY_REGISTERED'
@@ -49,10 +63,15 @@ class ErrorMessageCodes(str, Enum):
     INVALID_CODE = 'INVALID_CODE'
     INVALID_REFRESH_TOKEN = 'INVALID_REFRESH_TOKEN'
     INVALID_EMAIL_OR_PASSWORD = 'INVALID_EMAIL_OR_PASSWORD'
+    SERVICE_OVERLOADED = 'SERVICE_OVERLOADED'
+    INVALID_CURSOR = 'INVALID_CURSOR'
+    TOO_MANY_REQUESTS = 'TOO_MANY_REQUESTS'
+    SERVICE_NOT_READY = 'SERVICE_NOT_READY'
 
 
 def raise_exception(
     exception_class,
     error_code: ErrorMessageCodes,
+    headers: Optional[dict[str, Any]] = None,
 ):
-    return exception_class({'error_code': error_code.value})
+    return exception_class({'error_code': error_code.value}, headers)
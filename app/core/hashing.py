@@ -0,0 +1,211 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, replace
+
+from argon2 import PasswordHasher
+
+import password_hashing_worker
+from app.core.exceptions import (
+    raise_exception,
+    ErrorMessageCodes,
+    ServiceUnavailableException,
+)
+from app.core.metrics import password_hashing_duration
+
+
+@dataclass(frozen=True, slots=True)
+class PasswordHashingParameters:
+    """
+    Argon2 cost parameters, memory cost in KiB
+    """
+
+    time_cost: int
+    memory_cost: int
+    parallelism: int
+
+    def create_hasher(self) -> PasswordHasher:
+        return PasswordHasher(**asdict(self))
+
+
+def calibrate_parameters(
+    target_latency: float,
+    memory_cost: int,
+    parallelism: int,
+    min_memory_cost: int = 8192,
+    max_time_cost: int = 16,
+) -> PasswordHashingParameters:
+    """
+    Picks the time cost that makes hashing take about target_latency seconds on this
+    machine. If a single pass is already slower, the memory cost is halved instead.
+    """
+
+    def measure(parameters: PasswordHashingParameters) -> float:
+        password_hasher = parameters.create_hasher()
+        latencies = list()
+        for _ in range(3):
+            started_at = time.perf_counter()
+            password_hasher.hash('calibration')
+            latencies.append(time.perf_counter() - started_at)
+        return min(latencies)
+
+    parameters = PasswordHashingParameters(1, memory_cost, parallelism)
+    latency = measure(parameters)
+    while latency > target_latency and parameters.memory_cost // 2 >= min_memory_cost:
+        parameters = replace(parameters, memory_cost=parameters.memory_cost // 2)
+        latency = measure(parameters)
+
+    # The latency grows about linearly with the time cost, the estimate is only
+    # corrected downwards so hashing never gets slower than the target
+    parameters = replace(
+        parameters,
+        time_cost=min(max(int(target_latency / latency), 1), max_time_cost),
+    )
+    while parameters.time_cost > 1 and measure(parameters) > target_latency:
+        parameters = replace(parameters, time_cost=parameters.time_cost - 1)
+    return parameters
+
+
+class PasswordHashingExecutor:
+    """
+    Runs argon2 hashing and verification outside the event loop.
+    The number of calls waiting for a pool worker is bounded, calls over the limit are rejected
+    with 503 straight away instead of piling up behind a sign-in burst.
+    """
+
+    def __init__(
+        self,
+        pool: str,
+        max_workers: int,
+        max_queue: int,
+        parameters: PasswordHashingParameters,
+    ):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.parameters = parameters
+
+        self._executor = self._create_executor(pool, max_workers, parameters)
+        # Only parses hashes, it never hashes on the event loop
+        self._password_hasher = parameters.create_hasher()
+
+        self.in_flight = 0
+        self.calls = 0
+        self.rejected = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.last_latency = 0.0
+
+    @staticmethod
+    def _create_executor(
+        pool: str,
+        max_workers: int,
+        parameters: PasswordHashingParameters,
+    ) -> Executor:
+        if pool == 'process':
+            return ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=password_hashing_worker.initialize,
+                initargs=(asdict(parameters),),
+            )
+        return ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix='password-hashing',
+            initializer=password_hashing_worker.initialize,
+            initargs=(asdict(parameters),),
+        )
+
+    @property
+    def queue_depth(self) -> int:
+        return max(self.in_flight - self.max_workers, 0)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(
+            'hash',
+            password_hashing_worker.hash_password,
+            password,
+        )
+
+    async def verify(self, password_hash: str, password: str) -> bool:
+        return await self._run(
+            'verify',
+            password_hashing_worker.verify_password,
+            password_hash,
+            password,
+        )
+
+    async def warm_up(self):
+        """
+        Starts all pool workers, pools only start them on demand and the first sign-ins
+        would wait for a process to spawn and import argon2
+        """
+
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *(
+                loop.run_in_executor(self._executor, password_hashing_worker.noop)
+                for _ in range(self.max_workers)
+            )
+        )
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """
+        :return: whether the hash was created with other parameters than the current ones
+        """
+
+        return self._password_hasher.check_needs_rehash(password_hash)
+
+    async def _run(self, operation: str, function, *args):
+        if self.queue_depth >= self.max_queue:
+            self.rejected += 1
+            raise raise_exception(
+                ServiceUnavailableException,
+                ErrorMessageCodes.SERVICE_OVERLOADED,
+            )
+
+        loop = asyncio.get_running_loop()
+        future = self._executor.submit(function, *args)
+        # The call holds its place until the pool is done with it, a cancelled caller
+        # must not let more calls in while its own is still queued or running
+        self.in_flight += 1
+        future.add_done_callback(lambda _: self._release(loop))
+
+        started_at = time.perf_counter()
+        try:
+            return await asyncio.wrap_future(future)
+        finally:
+            latency = time.perf_counter() - started_at
+            password_hashing_duration.observe(latency, operation)
+            self.calls += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            self.last_latency = latency
+
+    def _release(self, loop: asyncio.AbstractEventLoop):
+        """
+        Done callback of a pool future, it runs in a thread of the pool
+        """
+
+        try:
+            loop.call_soon_threadsafe(self._decrement_in_flight)
+        except RuntimeError:
+            # The loop is closed on shutdown, nobody reads the counter anymore
+            pass
+
+    def _decrement_in_flight(self):
+        self.in_flight -= 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict[str, float]:
+        return {
+            'in_flight': self.in_flight,
+            'queue_depth': self.queue_depth,
+            'calls': self.calls,
+            'rejected': self.rejected,
+            'average_latency': self.total_latency / self.calls if self.calls else 0.0,
+            'max_latency': self.max_latency,
+            'last_latency': self.last_latency,
+        }
@@ -0,0 +1,328 @@
+"""
+In-process metrics rendered in the Prometheus text format.
+Every worker keeps its own registry and periodically publishes a snapshot of it to Redis,
+the '/metrics' endpoint merges the snapshots of all workers. Counters of stopped workers
+are kept in a retired snapshot, so the merged counters never go down.
+"""
+
+import bisect
+import json
+import os
+import secrets
+import socket
+import time
+from typing import Callable
+
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(
+        self, name: str, documentation: str, label_names: tuple[str, ...] = ()
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+
+        self.values: dict[tuple[str, ...], float] = dict()
+
+    def inc(self, *labels: str, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> list:
+        return [[list(labels), value] for labels, value in self.values.items()]
+
+
+class Gauge(Counter):
+    """
+    Gauges are reported per worker, summing them across workers is not meaningful
+    """
+
+    type = 'gauge'
+
+    def set(self, value: float, *labels: str):
+        self.values[labels] = value
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+
+        # Per labels: non-cumulative bucket counts (the last one is +Inf), sum
+        self.values: dict[tuple[str, ...], list] = dict()
+
+    def observe(self, value: float, *labels: str):
+        data = self.values.get(labels)
+        if data is None:
+            data = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        data[0][bisect.bisect_left(self.buckets, value)] += 1
+        data[1] += value
+
+    def samples(self) -> list:
+        return [
+            [list(labels), [list(counts), total]]
+            for labels, (counts, total) in self.values.items()
+        ]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: dict[str, Counter | Gauge | Histogram] = dict()
+        self.collectors: list[Callable[[], None]] = list()
+        # A restarted worker may get the pid of the stopped one, its counters start
+        # from zero, so it must not take over the snapshot of the stopped one
+        self.worker = f'{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}'
+
+    def counter(self, name: str, documentation: str, label_names=()) -> Counter:
+        return self._register(Counter(name, documentation, tuple(label_names)))
+
+    def gauge(self, name: str, documentation: str, label_names=()) -> Gauge:
+        return self._register(Gauge(name, documentation, tuple(label_names)))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        label_names=(),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(
+            Histogram(name, documentation, tuple(label_names), buckets)
+        )
+
+    def add_collector(self, collector: Callable[[], None]):
+        """
+        Collectors update gauges right before a snapshot is taken
+        """
+
+        self.collectors.append(collector)
+
+    def _register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self) -> str:
+        for collector in self.collectors:
+            collector()
+
+        return json.dumps(
+            {
+                'worker': self.worker,
+                'updated_at': time.time(),
+                'metrics': {
+                    metric.name: {
+                        'type': metric.type,
+                        'documentation': metric.documentation,
+                        'label_names': metric.label_names,
+                        'buckets': getattr(metric, 'buckets', None),
+                        'samples': metric.samples(),
+                    }
+                    for metric in self.metrics.values()
+                },
+            },
+            separators=(',', ':'),
+        )
+
+
+def render(snapshots: list[dict], retired: list[dict] = ()) -> str:
+    """
+    Merges worker snapshots: counters and histograms are summed,
+    gauges get a 'worker' label
+
+    :param retired: snapshots of stopped workers, only their counters and histograms
+        are summed
+    """
+
+    families: dict[str, dict] = dict()
+    _merge(snapshots, families, gauges=True)
+    _merge(retired, families, gauges=False)
+
+    lines = list()
+    for name, family in sorted(families.items()):
+        label_names = family['label_names']
+        if family['type'] == 'gauge':
+            label_names = label_names + ['worker']
+
+        lines.append(f'# HELP {name} {family["documentation"]}')
+        lines.append(f'# TYPE {name} {family["type"]}')
+        for labels, value in sorted(family['values'].items()):
+            if family['type'] != 'histogram':
+                lines.append(f'{name}{_format_labels(label_names, labels)} {value}')
+                continue
+
+            counts, total = value
+            cumulative = 0
+            for bound, count in zip(
+                [_format_value(bound) for bound in family['buckets']] + ['+Inf'],
+                counts,
+            ):
+                cumulative += count
+                bucket_labels = _format_labels(label_names + ['le'], labels + (bound,))
+                lines.append(f'{name}_bucket{bucket_labels} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(label_names, labels)} {total}')
+            lines.append(
+                f'{name}_count{_format_labels(label_names, labels)} {cumulative}'
+            )
+
+    return '\n'.join(lines) + '\n'
+
+
+def retire(snapshots: list[dict]) -> dict:
+    """
+    Sums the counters and histograms of snapshots of stopped workers into one snapshot,
+    the previous retired snapshot is passed along with the newly stopped workers
+    """
+
+    families: dict[str, dict] = dict()
+    _merge(snapshots, families, gauges=False)
+
+    return {
+        'worker': 'retired',
+        'updated_at': time.time(),
+        'metrics': {
+            name: {
+                'type': family['type'],
+                'documentation': family['documentation'],
+                'label_names': family['label_names'],
+                'buckets': family['buckets'],
+                'samples': [
+                    [list(labels), value] for labels, value in family['values'].items()
+                ],
+            }
+            for name, family in families.items()
+        },
+    }
+
+
+def _merge(snapshots: list[dict], families: dict[str, dict], gauges: bool):
+    for snapshot in snapshots:
+        for name, metric in snapshot['metrics'].items():
+            if metric['type'] == 'gauge' and not gauges:
+                continue
+
+            family = families.setdefault(
+                name,
+                {
+                    'type': metric['type'],
+                    'documentation': metric['documentation'],
+                    'label_names': list(metric['label_names']),
+                    'buckets': metric['buckets'],
+                    'values': dict(),
+                },
+            )
+            values = family['values']
+
+            for labels, value in metric['samples']:
+                if metric['type'] == 'gauge':
+                    values[tuple(labels) + (snapshot['worker'],)] = value
+                elif metric['type'] == 'counter':
+                    values[tuple(labels)] = values.get(tuple(labels), 0) + value
+                else:
+                    counts, total = value
+                    merged = values.get(tuple(labels))
+                    if merged is None:
+                        values[tuple(labels)] = [list(counts), total]
+                    else:
+                        merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                        merged[1] += total
+
+
+def _format_labels(label_names: list[str], labels: tuple) -> str:
+    if not label_names:
+        return ''
+    return (
+        '{'
+        + ','.join(
+            f'{label_name}="{_escape(str(label))}"'
+            for label_name, label in zip(label_names, labels)
+        )
+        + '}'
+    )
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metrics = MetricsRegistry()
+
+http_request_duration = metrics.histogram(
+    'http_request_duration_seconds',
+    'Latency of HTTP requests by route',
+    ('method', 'route', 'status'),
+)
+cache_lookups = metrics.counter(
+    'user_cache_lookups_total',
+    'User lookups of UserUnion by operation, tier and result',
+    ('operation', 'tier', 'result'),
+)
+db_statement_duration = metrics.histogram(
+    'db_statement_duration_seconds',
+    'Duration of database statements by operation and table',
+    ('operation', 'table'),
+)
+db_pool_checkout_wait = metrics.histogram(
+    'db_pool_checkout_wait_seconds',
+    'Time spent waiting for a connection from the database pool',
+)
+redis_command_duration = metrics.histogram(
+    'redis_command_duration_seconds',
+    'Duration of Redis commands, a pipeline is a single PIPELINE command',
+    ('command',),
+)
+password_hashing_duration = metrics.histogram(
+    'password_hashing_duration_seconds',
+    'Duration of argon2 calls including the wait for a pool worker',
+    ('operation',),
+)
+password_rehashes = metrics.counter(
+    'password_rehashes_total',
+    'Stored password hashes upgraded to the current argon2 parameters on sign-in',
+)
+rate_limited = metrics.counter(
+    'rate_limited_requests_total',
+    'Requests rejected with 429 by rate limit',
+    ('limit',),
+)
+component_stats = metrics.gauge(
+    'app_component_stat',
+    'Internal counters of application components',
+    ('component', 'stat'),
+)
+
+
+def observe_component_stats(component: str, stats: dict[str, float]):
+    for stat, value in stats.items():
+        component_stats.set(value, component, stat)
@@ -0,0 +1,73 @@
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.cache import RedisRoundTrips, redis_round_trips
+from app.core.environment import env
+from app.core.metrics import http_request_duration
+
+
+class RedisRoundTripsMiddleware:
+    """
+    Counts Redis round trips per request, in debug mode the count is returned
+    in the 'X-Redis-Round-Trips' header
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        round_trips = RedisRoundTrips()
+        token = redis_round_trips.set(round_trips)
+
+        async def send_wrapper(message: Message):
+            if message['type'] == 'http.response.start' and env.debug:
+                message.setdefault('headers', [])
+                message['headers'] = list(message['headers']) + [
+                    (b'x-redis-round-trips', str(round_trips.count).encode())
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            redis_round_trips.reset(token)
+
+
+class MetricsMiddleware:
+    """
+    Observes request latency labelled with the route template, not the raw path,
+    so that the number of series stays bounded
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get('route')
+            http_request_duration.observe(
+                time.perf_counter() - started_at,
+                scope['method'],
+                route.path if route is not None else 'unmatched',
+                str(status_code),
+            )
@@ -0,0 +1,252 @@
+"""
+Opt-in profiling of single requests.
+An admin sends the 'X-Profile' header ('sample' or 'cprofile') and the request is run
+under a profiler. The profile is written to PROFILER_OUTPUT_DIR, or returned as the
+response body when no directory is configured.
+
+Both profilers observe the whole event loop thread, so other requests served concurrently
+by the worker show up in the profile as well.
+"""
+
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.authentication import jwt_bearer
+from app.core.environment import env
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of a thread at a fixed interval from a helper thread,
+    the result is in the folded format of flamegraph.pl and speedscope
+    """
+
+    # The switch interval is process-wide, the last running sampler restores it
+    _running = 0
+    _switch_interval: float = 0
+    _switch_interval_lock = threading.Lock()
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+
+        self._thread_id = threading.get_ident()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run,
+            name='request-profiler',
+            daemon=True,
+        )
+
+    def start(self):
+        # The sampler needs the GIL at least once per interval to take a sample
+        with SamplingProfiler._switch_interval_lock:
+            if SamplingProfiler._running == 0:
+                SamplingProfiler._switch_interval = sys.getswitchinterval()
+            SamplingProfiler._running += 1
+            sys.setswitchinterval(min(self.interval, sys.getswitchinterval()))
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        with SamplingProfiler._switch_interval_lock:
+            SamplingProfiler._running -= 1
+            if SamplingProfiler._running == 0:
+                sys.setswitchinterval(SamplingProfiler._switch_interval)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = list()
+            while frame is not None:
+                code = frame.f_code
+                filename = os.path.basename(code.co_filename)
+                stack.append(f'{code.co_name} ({filename}:{code.co_firstlineno})')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def render(self) -> str:
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.items())
+
+
+class ProfilerMiddleware:
+    """
+    Profiles requests with the 'X-Profile' header of an authorized admin,
+    requests over the concurrency limit of the worker are served without profiling.
+    Only one cProfile profiler can be enabled in a thread at a time.
+    """
+
+    HEADER = b'x-profile'
+    STATUS_HEADER = b'x-profile-status'
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.semaphore = asyncio.Semaphore(env.profiler_max_concurrent)
+        self.cprofile_lock = asyncio.Lock()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        mode = None
+        authorization = None
+        for name, value in scope['headers']:
+            if name == self.HEADER:
+                mode = value.decode('latin-1')
+            elif name == b'authorization':
+                authorization = value.decode('latin-1')
+
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not await self._authorize(authorization):
+            await self.app(scope, receive, self._with_headers(send, 'unauthorized'))
+            return
+
+        if self.semaphore.locked() or (
+            mode == 'cprofile' and self.cprofile_lock.locked()
+        ):
+            await self.app(scope, receive, self._with_headers(send, 'busy'))
+            return
+
+        async with self.semaphore:
+            await self._profile(mode, scope, receive, send)
+
+    async def _profile(self, mode: str, scope: Scope, receive: Receive, send: Send):
+        if env.profiler_output_dir is None:
+            # The profile replaces the response, which is buffered meanwhile
+            messages: list[Message] = list()
+
+            async def app_send(message: Message):
+                messages.append(message)
+
+        else:
+            route = re.sub(r'[^\w-]+', '-', scope['path']).strip('-') or 'root'
+            extension = 'prof' if mode == 'cprofile' else 'folded'
+            filename = (
+                f'{int(time.time())}-{scope["method"]}-{route}-'
+                f'{uuid.uuid4().hex[:8]}.{extension}'
+            )
+            app_send = self._with_headers(
+                send,
+                'written',
+                [(b'x-profile-file', filename.encode())],
+            )
+
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            async with self.cprofile_lock:
+                profiler.enable()
+                try:
+                    await self.app(scope, receive, app_send)
+                finally:
+                    profiler.disable()
+        else:
+            profiler = SamplingProfiler(env.profiler_sample_interval)
+            profiler.start()
+            try:
+                await self.app(scope, receive, app_send)
+            finally:
+                profiler.stop()
+
+        if env.profiler_output_dir is not None:
+            await asyncio.to_thread(
+                self._write,
+                profiler,
+                os.path.join(env.profiler_output_dir, filename),
+            )
+            return
+
+        original_status = next(
+            message['status']
+            for message in messages
+            if message['type'] == 'http.response.start'
+        )
+        body = self._render(profiler).encode()
+        await send(
+            {
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'content-type', b'text/plain; charset=utf-8'),
+                    (b'content-length', str(len(body)).encode()),
+                    (self.STATUS_HEADER, b'inline'),
+                    (b'x-profile-original-status', str(original_status).encode()),
+                ],
+            }
+        )
+        await send({'type': 'http.response.body', 'body': body})
+
+    @staticmethod
+    def _render(profiler: cProfile.Profile | SamplingProfiler) -> str:
+        if isinstance(profiler, SamplingProfiler):
+            return profiler.render()
+
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(50)
+        return output.getvalue()
+
+    @staticmethod
+    def _write(profiler: cProfile.Profile | SamplingProfiler, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if isinstance(profiler, SamplingProfiler):
+            with open(path, 'w') as file:
+                file.write(profiler.render())
+        else:
+            profiler.dump_stats(path)
+
+    @staticmethod
+    async def _authorize(authorization: Optional[str]) -> bool:
+        from app.core.container import Container
+        from app.db.exceptions import DbObjectDoesNotExist
+        from app.db.session import LazyAsyncSession
+
+        if authorization is None or not authorization.startswith('Bearer '):
+            return False
+
+        payload = jwt_bearer.verify_jwt(authorization.removeprefix('Bearer '))
+        if payload is None or payload.type != 'access':
+            return False
+
+        async with LazyAsyncSession(Container.async_session) as session:
+            try:
+                user_cache_model = await Container.user_union.get(
+                    payload.id,
+                    session=session,
+                )
+            except DbObjectDoesNotExist:
+                return False
+
+        return user_cache_model.verified and user_cache_model.is_admin
+
+    def _with_headers(
+        self,
+        send: Send,
+        status: str,
+        headers: Optional[list[tuple[bytes, bytes]]] = None,
+    ) -> Send:
+        async def send_wrapper(message: Message):
+            if message['type'] == 'http.response.start':
+                message['headers'] = (
+                    list(message.get('headers', []))
+                    + [(self.STATUS_HEADER, status.encode())]
+                    + (headers or [])
+                )
+            await send(message)
+
+        return send_wrapper
@@ -0,0 +1,91 @@
+import logging
+import math
+from typing import Literal
+
+from fastapi import Request
+from redis.exceptions import RedisError
+
+from app.core.authentication import jwt_bearer
+from app.core.environment import env
+from app.core.exceptions import (
+    raise_exception,
+    ErrorMessageCodes,
+    TooManyRequestsException,
+)
+from app.core.metrics import rate_limited
+
+
+class RateLimit:
+    """
+    Dependency limiting the requests of a route with a token bucket in Redis.
+    It is meant for the route 'dependencies', which run before the endpoint's own ones,
+    so rejected requests never reach the database or password hashing.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        limit: str,
+        key: Literal['ip', 'email', 'user'],
+        error_code: ErrorMessageCodes = ErrorMessageCodes.TOO_MANY_REQUESTS,
+    ):
+        """
+        :param limit: 'capacity/seconds', bursts of capacity requests and capacity
+            requests per seconds on average
+        :param key: what the bucket belongs to, the client address, the 'email' field
+            of the JSON body or the user of the access token.
+            Behind a reverse proxy the client address is only the real one if uvicorn
+            trusts the proxy's X-Forwarded-For, see FORWARDED_ALLOW_IPS in the README,
+            otherwise all clients share the bucket of the proxy.
+        """
+
+        capacity, period = limit.split('/')
+        self.name = name
+        self.capacity = int(capacity)
+        self.period = float(period)
+        self.key = key
+        self.error_code = error_code
+
+    async def __call__(self, request: Request):
+        from app.core.container import Container
+
+        if not env.rate_limits_enabled:
+            return
+
+        key = await self._get_key(request)
+        if key is None:
+            return
+
+        try:
+            retry_after = await Container.rate_limit_cache_repo.take_token(
+                self.name,
+                key,
+                self.capacity,
+                self.period,
+            )
+        except RedisError:
+            # Authentication keeps working while Redis is unavailable
+            logging.exception(f'Rate limit {self.name} could not be checked')
+            return
+
+        if retry_after:
+            rate_limited.inc(self.name)
+            raise raise_exception(
+                TooManyRequestsException,
+                self.error_code,
+                headers={'Retry-After': str(math.ceil(retry_after))},
+            )
+
+    async def _get_key(self, request: Request):
+        if self.key == 'ip':
+            return request.client.host if request.client else None
+        if self.key == 'user':
+            return str((await jwt_bearer(request)).id)
+
+        # The body is cached by the request, the endpoint does not read it again
+        try:
+            body = await request.json()
+        except ValueError:
+            return None
+        email = body.get('email') if isinstance(body, dict) else None
+        return email.lower() if isinstance(email, str) else None
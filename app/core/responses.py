@@ -0,0 +1,37 @@
+"""
+JSON responses assembled from pre-serialized parts, cached users are spliced into
+the envelope as stored instead of being validated and encoded again
+"""
+
+from typing import Any, Union
+
+import pydantic_core
+from fastapi import Response
+
+from app.cache.codecs import encode_json
+from app.cache.models.user import UserCacheJson, UserCacheStruct
+
+
+def encode_user(user: Union[UserCacheStruct, UserCacheJson]) -> bytes:
+    if isinstance(user, UserCacheJson):
+        return user.json
+    # The serializer the json codec stores users with, without a validation pass
+    return encode_json(user)
+
+
+def encode_users(users: list[Union[UserCacheStruct, UserCacheJson]]) -> bytes:
+    return b'[' + b','.join(encode_user(user) for user in users) + b']'
+
+
+def spliced_json_response(fields: dict[str, Any]) -> Response:
+    """
+    :param fields: members of the JSON object, bytes values are already encoded JSON
+    """
+
+    body = b','.join(
+        pydantic_core.to_json(name)
+        + b':'
+        + (value if isinstance(value, bytes) else pydantic_core.to_json(value))
+        for name, value in fields.items()
+    )
+    return Response(b'{' + body + b'}', media_type='application/json')
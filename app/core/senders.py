@@ -0,0 +1,54 @@
+import asyncio
+import json
+import logging
+from dataclasses import asdict, dataclass
+
+
+@dataclass(slots=True)
+class VerificationCodeMessage:
+    user_id: int
+    email: str
+    code: int
+    # Unix time the code was created at
+    created_at: float
+
+
+class BaseVerificationCodeSender:
+    """
+    Base parent class of verification code senders.
+    A sender gets a whole batch and raises if it could not be delivered, the batch is
+    retried then, so delivery is at least once.
+    """
+
+    async def send(self, messages: list[VerificationCodeMessage]):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class LogVerificationCodeSender(BaseVerificationCodeSender):
+    """
+    Writes the codes to the log, for development
+    """
+
+    async def send(self, messages: list[VerificationCodeMessage]):
+        for message in messages:
+            logging.warning(f'Verification code of {message.email}: {message.code}')
+
+
+class FileVerificationCodeSender(BaseVerificationCodeSender):
+    """
+    Appends the messages as JSON lines to a local file, for tests
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _write(self, lines: str):
+        with open(self.path, 'a') as file:
+            file.write(lines)
+
+    async def send(self, messages: list[VerificationCodeMessage]):
+        lines = ''.join(json.dumps(asdict(message)) + '\n' for message in messages)
+        await asyncio.to_thread(self._write, lines)
@@ -0,0 +1,127 @@
+import asyncio
+import time
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional
+
+from redis.exceptions import LockError
+
+from app.cache.exceptions import CacheObjectDoesNotExist
+from app.core.environment import env
+
+if TYPE_CHECKING:
+    from app.core.container import Container
+
+
+class _LeaderCancelled(Exception):
+    """
+    The caller loading the value was cancelled, a waiter has to take over the load
+    """
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent loads of the same key.
+    Inside a worker the callers await one shared future, across workers a short Redis lock
+    picks a single loader while the others poll the cache for its result.
+    """
+
+    def __init__(self, container: type['Container']):
+        self.container = container
+        self._futures: dict[str, asyncio.Future] = dict()
+
+    async def do(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        cached: Optional[Callable[[], Awaitable[Any]]] = None,
+        missing: Optional[type[Exception]] = None,
+    ) -> Any:
+        """
+        :param key: key identifying the loaded value
+        :param loader: loads the value from the source of truth and writes it to the cache
+        :param cached: reads the value written by a loader in another worker,
+            raises CacheObjectDoesNotExist while it is not there yet
+        :param missing: exception of the loader for a value that does not exist,
+            it is published to the other workers, there is nothing cached for them to find
+        """
+
+        while True:
+            future = self._futures.get(key)
+            if future is None:
+                break
+            try:
+                return await asyncio.shield(future)
+            except _LeaderCancelled:
+                # A disconnected client must not fail the requests waiting for its load,
+                # the first waiter to wake up becomes the leader
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        self._futures[key] = future
+        try:
+            result = await self._load(key, loader, cached, missing)
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        except Exception as exception:
+            future.set_exception(exception)
+            # The exception is re-raised here, waiters (if any) retrieve it themselves
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._futures[key]
+
+    async def _load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        cached: Optional[Callable[[], Awaitable[Any]]],
+        missing: Optional[type[Exception]],
+    ) -> Any:
+        if cached is None:
+            return await loader()
+
+        lock = self.container.redis_client.lock(
+            f'singleflight:{key}',
+            timeout=env.single_flight_lock_timeout,
+        )
+        missing_key = f'singleflight:{key}-missing'
+        if await lock.acquire(blocking=False):
+            try:
+                return await loader()
+            except Exception as exception:
+                if missing is not None and isinstance(exception, missing):
+                    # Lives as long as the other workers may poll for this load
+                    await self.container.redis_client.set(
+                        missing_key,
+                        time.time(),
+                        px=int(env.single_flight_wait_timeout * 1000),
+                    )
+                raise
+            finally:
+                try:
+                    await lock.release()
+                except LockError:
+                    # The lock has expired and may be held by another loader already
+                    pass
+
+        waiting_since = time.time()
+        deadline = time.monotonic() + env.single_flight_wait_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(env.single_flight_poll_interval)
+            try:
+                return await cached()
+            except CacheObjectDoesNotExist:
+                pass
+            if missing is None:
+                continue
+            # A marker of an earlier load may outlive the value being created since
+            missing_since = await self.container.redis_client.get(missing_key)
+            if missing_since is not None and float(missing_since) >= waiting_since:
+                raise missing
+
+        # The loader in the other worker is too slow, do not keep the request waiting
+        return await loader()
@@ -1,2 +1,6 @@
 class DbObjectDoesNotExist(Exception):
     pass
+
+
+class DbObjectAlreadyExists(Exception):
+    pass
@@ -0,0 +1,53 @@
+import re
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.core.metrics import db_pool_checkout_wait, db_statement_duration
+
+_TABLE_PATTERN = re.compile(
+    r'\b(?:FROM|INTO|UPDATE|JOIN)\s+"?([\w.]+)"?',
+    re.IGNORECASE,
+)
+# Statements are generated, so there are few distinct ones and they are parsed once
+_statement_labels: dict[str, tuple[str, str]] = dict()
+
+
+def _get_statement_labels(statement: str) -> tuple[str, str]:
+    labels = _statement_labels.get(statement)
+    if labels is None:
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement else ''
+        table = _TABLE_PATTERN.search(statement)
+        labels = (operation, table.group(1) if table else '')
+        if len(_statement_labels) < 1000:
+            _statement_labels[statement] = labels
+    return labels
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._started_at = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    db_statement_duration.observe(
+        time.perf_counter() - context._started_at,
+        *_get_statement_labels(statement),
+    )
+
+
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Pool that observes how long a checkout waits for a connection,
+    including opening a new one
+    """
+
+    def _do_get(self):
+        started_at = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_checkout_wait.observe(time.perf_counter() - started_at)
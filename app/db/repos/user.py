@@ -1,8 +1,20 @@
-from typing import Any
+from typing import Any, AsyncIterator, Optional
 
-from sqlalchemy import select, update, func, delete
+from sqlalchemy import (
+    ARRAY,
+    Integer,
+    any_,
+    bindparam,
+    select,
+    update,
+    func,
+    delete,
+    text,
+)
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.db.exceptions import DbObjectAlreadyExists, DbObjectDoesNotExist
 from app.db.models.user import UserDbModel
 from app.db.repos import BaseDbRepo
 
@@ -31,23 +43,115 @@ class UserDbRepo(BaseDbRepo):
         await self.check_object_exists(user_db_model)
         return user_db_model
 
-    async def all(
+    async def get_many(
         self,
-        offset: int,
-        limit: int,
+        ids: list[int],
         session: AsyncSession,
     ):
-        result = await session.execute(select(UserDbModel).offset(offset).limit(limit))
+        # A single array parameter keeps one prepared statement for any number of ids
+        result = await session.execute(
+            select(UserDbModel).where(
+                UserDbModel.id == any_(bindparam('ids', ids, type_=ARRAY(Integer)))
+            )
+        )
         return result.scalars().all()
 
-    async def create(
+    async def all_by_cursor(
         self,
-        user_db_model: UserDbModel,
+        after: Optional[int],
+        before: Optional[int],
+        limit: int,
         session: AsyncSession,
     ):
-        session.add(user_db_model)
+        """
+        Keyset pagination over the primary key, returns users in ascending id order
+        """
+
+        if after is not None:
+            query = (
+                select(UserDbModel)
+                .where(UserDbModel.id > after)
+                .order_by(UserDbModel.id)
+                .limit(limit)
+            )
+        else:
+            query = (
+                select(UserDbModel)
+                .where(UserDbModel.id < before)
+                .order_by(UserDbModel.id.desc())
+                .limit(limit)
+            )
+
+        result = await session.execute(query)
+        user_db_models = result.scalars().all()
+
+        if after is None:
+            user_db_models = list(reversed(user_db_models))
+        return user_db_models
+
+    async def iter_ids(
+        self,
+        session: AsyncSession,
+        chunk_size: int = 10000,
+    ) -> AsyncIterator[list[int]]:
+        """
+        All ids in ascending chunks, each one read by a keyset query after the previous
+        """
+
+        last_id = 0
+        while True:
+            result = await session.execute(
+                select(UserDbModel.id)
+                .where(UserDbModel.id > last_id)
+                .order_by(UserDbModel.id)
+                .limit(chunk_size)
+            )
+            user_ids = list(result.scalars().all())
+            if not user_ids:
+                return
+            yield user_ids
+            if len(user_ids) < chunk_size:
+                return
+            last_id = user_ids[-1]
+
+    async def iter_emails(
+        self,
+        session: AsyncSession,
+        chunk_size: int = 10000,
+    ) -> AsyncIterator[list[str]]:
+        """
+        All emails in chunks, streamed with a server-side cursor
+        """
+
+        result = await session.stream_scalars(
+            select(UserDbModel.email).execution_options(yield_per=chunk_size)
+        )
+        async for partition in result.partitions():
+            yield list(partition)
+
+    async def create(
+        self,
+        values: dict[str, Any],
+        session: AsyncSession,
+    ) -> UserDbModel:
+        """
+        Inserts the user and returns the stored row in one statement,
+        the unique email is checked by the insert itself
+
+        :raise DbObjectAlreadyExists: the email is registered already
+        """
+
+        result = await session.execute(
+            insert(UserDbModel)
+            .values(values)
+            .on_conflict_do_nothing(index_elements=[UserDbModel.email])
+            .returning(UserDbModel)
+        )
+        user_db_model = result.scalar_one_or_none()
         await session.commit()
-        await session.refresh(user_db_model)
+        if user_db_model is None:
+            raise DbObjectAlreadyExists
+        return user_db_model
 
     async def update(
         self,
@@ -60,6 +164,28 @@ class UserDbRepo(BaseDbRepo):
         )
         await session.commit()
 
+    async def update_password_hash(
+        self,
+        _id: int,
+        password_hash: str,
+        new_password_hash: str,
+        session: AsyncSession,
+    ) -> bool:
+        """
+        Replaces the hash only if it is still the given one, a password changed in the
+        meantime is not overwritten
+
+        :return: whether the hash was replaced
+        """
+
+        result = await session.execute(
+            update(UserDbModel)
+            .where(UserDbModel.id == _id, UserDbModel.password == password_hash)
+            .values(password=new_password_hash)
+        )
+        await session.commit()
+        return bool(result.rowcount)
+
     async def delete(
         self,
         _id: int,
@@ -87,6 +213,25 @@ class UserDbRepo(BaseDbRepo):
         result = await session.execute(select(func.count(UserDbModel.id)))
         return result.scalar()
 
+    async def estimate_count(
+        self,
+        session: AsyncSession,
+    ) -> Optional[int]:
+        """
+        Row count estimated by the planner statistics, None if the table was never analyzed
+        """
+
+        result = await session.execute(
+            text(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)'
+            ),
+            {'table': UserDbModel.__tablename__},
+        )
+        estimate = result.scalar()
+        if estimate is None or estimate < 0:
+            return None
+        return estimate
+
     async def get_password_hash(self, _id: int, session: AsyncSession):
         result = await session.execute(
             select(UserDbModel.password).where(UserDbModel.id == _id)
@@ -94,3 +239,22 @@ class UserDbRepo(BaseDbRepo):
         password_hash = result.scalar_one_or_none()
         await self.check_object_exists(password_hash)
         return password_hash
+
+    async def prime_statements(self, session: AsyncSession):
+        """
+        Runs the hot read queries once on the connection of the session, so their
+        prepared statements are cached before the first requests need them
+        """
+
+        for query in (
+            self.get(0, session=session),
+            self.get_many([0], session=session),
+            self.get_by_email('', session=session),
+            self.get_password_hash(0, session=session),
+        ):
+            try:
+                await query
+            except DbObjectDoesNotExist:
+                pass
+        await self.exists('', session=session)
+        await self.count(session=session)
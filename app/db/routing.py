@@ -0,0 +1,95 @@
+import asyncio
+import itertools
+import logging
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Delete, Insert, Update
+
+
+class ReplicaSet:
+    """
+    Read replicas served round-robin, a replica failing its health check
+    is skipped until it passes one again
+    """
+
+    def __init__(self, engines: list[AsyncEngine], health_check_interval: float):
+        self.engines = engines
+        self.health_check_interval = health_check_interval
+
+        self.healthy: list[AsyncEngine] = list(engines)
+        self._counter = itertools.count()
+
+    def next(self) -> Optional[AsyncEngine]:
+        healthy = self.healthy
+        if not healthy:
+            return None
+        return healthy[next(self._counter) % len(healthy)]
+
+    async def check_health(self):
+        healthy = list()
+        for engine in self.engines:
+            try:
+                async with asyncio.timeout(self.health_check_interval):
+                    async with engine.connect() as connection:
+                        await connection.execute(text('SELECT 1'))
+            except Exception:
+                logging.warning(f'Database replica {engine.url.host} is unhealthy')
+                continue
+            healthy.append(engine)
+        self.healthy = healthy
+
+    async def monitor(self):
+        """
+        Re-checks the replicas periodically; runs for the lifetime of the worker
+        """
+
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            await self.check_health()
+
+
+def use_primary(session):
+    """
+    Routes all further statements of the session to the primary
+    """
+
+    session.info['primary'] = True
+
+
+class RoutingSession(Session):
+    """
+    Sends writes to the primary and reads to a replica.
+    Once a session has written (or is marked with info['primary']) it stays on the
+    primary, so a request always reads its own writes. A session reads from a single
+    replica for its whole lifetime.
+    """
+
+    def __init__(
+        self,
+        primary: AsyncEngine,
+        replicas: Optional[ReplicaSet] = None,
+        **kw,
+    ):
+        super().__init__(**kw)
+        self.primary = primary
+        self.replicas = replicas
+
+    def get_bind(self, mapper=None, *, clause=None, **kw) -> Engine:
+        if self.replicas is None or self.info.get('primary'):
+            return self.primary.sync_engine
+
+        if self._flushing or isinstance(clause, (Insert, Update, Delete)):
+            self.info['primary'] = True
+            return self.primary.sync_engine
+
+        replica = self.info.get('replica')
+        if replica is None:
+            replica = self.replicas.next()
+            if replica is None:
+                return self.primary.sync_engine
+            self.info['replica'] = replica
+        return replica.sync_engine
@@ -0,0 +1,59 @@
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session
+
+
+@event.listens_for(Session, 'after_begin')
+def _mark_checked_out(session, transaction, connection):
+    session.info['checked_out'] = True
+
+
+class LazyAsyncSession:
+    """
+    Proxy for AsyncSession that creates the session only when it is used for the first time,
+    so requests served entirely from the cache never touch the connection pool.
+    """
+
+    requests = 0
+    requests_without_checkout = 0
+
+    def __init__(self, session_maker: async_sessionmaker):
+        self._session_maker = session_maker
+        self._session: Optional[AsyncSession] = None
+
+    def _get_session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self._session_maker()
+        return self._session
+
+    def __getattr__(self, name: str):
+        return getattr(self._get_session(), name)
+
+    @property
+    def checked_out(self) -> bool:
+        return self._session is not None and self._session.info.get(
+            'checked_out', False
+        )
+
+    async def close(self):
+        LazyAsyncSession.requests += 1
+        if not self.checked_out:
+            LazyAsyncSession.requests_without_checkout += 1
+
+        if self._session is not None:
+            await self._session.close()
+
+    async def __aenter__(self) -> 'LazyAsyncSession':
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    @classmethod
+    def stats(cls) -> dict[str, int]:
+        return {
+            'requests': cls.requests,
+            'requests_without_checkout': cls.requests_without_checkout,
+        }
@@ -0,0 +1,29 @@
+"""
+Worker delivering the verification codes queued in the Redis outbox.
+Any number of workers can run, the stream is shared through a consumer group.
+
+Run from the project root: python -m app.delivery
+"""
+
+import asyncio
+import os
+import socket
+
+from app.core.container import Container
+from app.services.verification import VerificationDeliveryService
+
+
+async def main():
+    await Container.initialize_delivery()
+    verification_delivery_service = VerificationDeliveryService(
+        container=Container,
+        consumer=f'{socket.gethostname()}:{os.getpid()}',
+    )
+    try:
+        await verification_delivery_service.deliver_forever()
+    finally:
+        await Container.shutdown_delivery()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
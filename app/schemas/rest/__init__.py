@@ -1,4 +1,4 @@
-from typing import Any
+from typing import Any, Optional
 
 from pydantic import BaseModel
 
@@ -8,3 +8,5 @@ class BasePaginatedResponse(BaseModel):
     previous: bool
     count: int
     data: list[Any]
+    next_cursor: Optional[str] = None
+    previous_cursor: Optional[str] = None
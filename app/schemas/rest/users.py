@@ -1,6 +1,6 @@
-from typing import Optional
+from typing import Annotated, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from app.cache.models.user import UserCacheModel
 from app.schemas.rest import BasePaginatedResponse
@@ -17,3 +17,12 @@ class UsersResponse(BasePaginatedResponse):
 class UpdateUserRequest(BaseModel):
     first_name: Optional[str] = None
     last_name: Optional[str] = None
+
+
+class UsersBatchRequest(BaseModel):
+    ids: list[Annotated[int, Field(ge=1)]] = Field(min_length=1, max_length=100)
+
+
+class UsersBatchResponse(BaseModel):
+    data: list[UserCacheModel]
+    missing_ids: list[int]
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import time
+
+from sqlalchemy import text
+
+from app.core.environment import env
+from app.core.exceptions import (
+    raise_exception,
+    ErrorMessageCodes,
+    ServiceUnavailableException,
+)
+from app.db.routing import use_primary
+from app.services import BaseService
+
+
+class HealthService(BaseService):
+    """
+    Service for the warmup of a worker and the requests '/health/live' and '/health/ready'
+    """
+
+    async def warm_up(self):
+        """
+        Every step is best effort, a failed one is logged and the worker still starts
+        """
+
+        started_at = time.perf_counter()
+        steps = (
+            ('redis', self._warm_up_redis),
+            ('database', self._warm_up_database),
+            ('password hashing', self.container.password_hasher.warm_up),
+            ('caches', self._warm_up_caches),
+        )
+        try:
+            async with asyncio.timeout(env.warmup_timeout):
+                for name, step in steps:
+                    try:
+                        await step()
+                    except Exception:
+                        logging.exception(f'Warmup of {name} failed')
+        except TimeoutError:
+            logging.error(f'Warmup did not finish in {env.warmup_timeout} seconds')
+
+        logging.warning(f'Warmup took {time.perf_counter() - started_at:.3f} seconds')
+
+    async def _warm_up_redis(self):
+        # Concurrent commands make the pool open a connection for each
+        await asyncio.gather(
+            *(
+                self.container.redis_client.ping()
+                for _ in range(env.warmup_redis_connections)
+            )
+        )
+
+    async def _warm_up_database(self):
+        await self._warm_up_connections(primary=True)
+        if self.container.db_replicas is not None:
+            await self._warm_up_connections(primary=False)
+
+    async def _warm_up_connections(self, primary: bool):
+        if env.warmup_db_connections <= 0:
+            return
+
+        # Every session keeps its connection until all of them have one,
+        # so each prepares the statements on a different connection
+        barrier = asyncio.Barrier(env.warmup_db_connections)
+
+        async def warm_up_connection():
+            async with self.container.async_session() as session:
+                if primary:
+                    use_primary(session)
+                try:
+                    await self.container.user_db_repo.prime_statements(session)
+                finally:
+                    await barrier.wait()
+
+        await asyncio.gather(
+            *(warm_up_connection() for _ in range(env.warmup_db_connections))
+        )
+
+    async def _warm_up_caches(self):
+        if env.warmup_list_pages <= 0 and env.warmup_last_users <= 0:
+            return
+
+        async with self.container.async_session() as session:
+            await self.container.user_union.prefill(
+                env.warmup_list_pages,
+                env.pagination_items,
+                env.warmup_last_users,
+                session=session,
+            )
+
+    async def live(self) -> dict[str, str]:
+        return {'status': 'live'}
+
+    async def ready(self) -> dict[str, str]:
+        if not self.container.ready:
+            raise raise_exception(
+                ServiceUnavailableException,
+                ErrorMessageCodes.SERVICE_NOT_READY,
+            )
+
+        try:
+            async with asyncio.timeout(env.health_check_timeout):
+                await self.container.redis_client.ping()
+                async with self.container.async_session() as session:
+                    use_primary(session)
+                    await session.execute(text('SELECT 1'))
+        except Exception as exception:
+            logging.warning(f'Readiness check failed: {exception!r}')
+            raise raise_exception(
+                ServiceUnavailableException,
+                ErrorMessageCodes.SERVICE_NOT_READY,
+            )
+
+        return {'status': 'ready'}
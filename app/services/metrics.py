@@ -0,0 +1,41 @@
+import asyncio
+import logging
+
+from app.core.environment import env
+from app.core.metrics import metrics, render
+from app.services import BaseService
+
+
+class MetricsService(BaseService):
+    """
+    Service for processing the request '/metrics'
+    """
+
+    async def metrics(self) -> str:
+        # The worker serving the scrape is always up to date
+        await self.publish()
+        snapshots, stopped_snapshots = (
+            await self.container.metrics_cache_repo.get_snapshots(
+                env.metrics_publish_interval * 3,
+                max(env.metrics_retire_after, env.metrics_publish_interval * 3),
+            )
+        )
+        return render(snapshots, stopped_snapshots)
+
+    async def publish(self):
+        await self.container.metrics_cache_repo.publish(
+            metrics.worker,
+            metrics.snapshot(),
+        )
+
+    async def publish_forever(self):
+        """
+        Publishes the metrics of the worker periodically; runs for the lifetime of the worker
+        """
+
+        while True:
+            await asyncio.sleep(env.metrics_publish_interval)
+            try:
+                await self.publish()
+            except Exception:
+                logging.exception('Metrics publishing failed')
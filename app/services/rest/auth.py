@@ -1,5 +1,4 @@
 import datetime
-import logging
 import random
 
 import argon2
@@ -7,16 +6,16 @@ import jwt
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.environment import env
-from app.cache.models.user import UserCacheModel
+from app.cache.models.user import UserCacheStruct
 from app.core.exceptions import (
     raise_exception,
     DuplicateException,
     ErrorMessageCodes,
     BadRequestException,
     PermissionDeniedException,
+    TooManyRequestsException,
 )
-from app.db.exceptions import DbObjectDoesNotExist
-from app.db.models.user import UserDbModel
+from app.db.exceptions import DbObjectAlreadyExists, DbObjectDoesNotExist
 from app.schemas.rest.auth import (
     SignUpRequest,
     JwtTokenPayload,
@@ -40,7 +39,9 @@ class AuthService(BaseService):
         Service method for processing the request ‘/rest/sign-up’
         """
 
-        if await self.container.user_db_repo.exists(
+        # Rejects most duplicates before the password is hashed,
+        # the insert below catches the rest
+        if await self.container.user_union.check_email_registered(
             request_schema.email,
             session=session,
         ):
@@ -50,7 +51,9 @@ class AuthService(BaseService):
             )
 
         try:
-            password_hash = self.container.password_hasher.hash(request_schema.password)
+            password_hash = await self.container.password_hasher.hash(
+                request_schema.password
+            )
         except argon2.exceptions.HashingError:
             raise raise_exception(
                 BadRequestException,
@@ -58,71 +61,67 @@ class AuthService(BaseService):
             )
 
         # Упростил назначение админа
-        user_db_model = UserDbModel(
-            email=request_schema.email,
-            first_name=request_schema.first_name,
-            last_name=request_schema.last_name,
-            password=password_hash,
-            is_admin=request_schema.email == env.admin_email.get_secret_value(),
-        )
-        user_cache_model = await self.container.user_union.create(
-            user_db_model,
-            session=session,
-        )
-
-        verification_code = random.randint(1000, 9999)
-        logging.warning(f'Verification code: {verification_code}')
-        # FIXME: I could put the sending of code on a queue, like kafka or redis pubsub
+        is_admin = request_schema.email == env.admin_email.get_secret_value()
+        try:
+            user_cache_model = await self.container.user_union.create(
+                {
+                    'email': request_schema.email,
+                    'first_name': request_schema.first_name,
+                    'last_name': request_schema.last_name,
+                    'password': password_hash,
+                    'is_admin': is_admin,
+                },
+                session=session,
+            )
+        except DbObjectAlreadyExists:
+            raise raise_exception(
+                DuplicateException,
+                ErrorMessageCodes.EMAIL_ALREADY_REGISTERED,
+            )
 
+        # The code is delivered by the delivery worker through the outbox
         await self.container.user_cache_repo.set_verification_code(
-            user_cache_model.id,
-            verification_code,
+            user_cache_model,
+            random.randint(1000, 9999),
         )
 
         return await self._generate_jwt_response(user_cache_model)
 
     async def resend_verification_code(
         self,
-        current_user: UserCacheModel,
+        current_user: UserCacheStruct,
     ) -> None:
         """
         Service method for processing the request ‘/rest/resend-verification-code’
         """
 
-        if await self.container.user_cache_repo.check_verification_code_limit(
-            current_user.id
-        ):
-            raise raise_exception(
-                PermissionDeniedException,
-                ErrorMessageCodes.VERIFICATION_CODE_LIMIT,
-            )
-
-        # FIXME: I could add more checking for the number of ‘sms’ sent recently, but that would take more time :)
-
-        verification_code = random.randint(1000, 9999)
-        logging.warning(f'Verification code: {verification_code}')
-
+        # Resends are limited by the route's rate limit
         await self.container.user_cache_repo.set_verification_code(
-            current_user.id,
-            verification_code,
+            current_user,
+            random.randint(1000, 9999),
         )
 
     async def check_verification_code(
         self,
         code: int,
-        current_user: UserCacheModel,
+        current_user: UserCacheStruct,
         session: AsyncSession,
     ) -> JWTResponse:
         """
         Service method for processing the request ‘/rest/check-verification-code’
         """
 
-        # FIXME: I could add more checking for the number of code check requests recently, but that would take more time :)
-
+        # Attempts are limited by the route's rate limit and in total by the code's
+        # attempts counter, so the code cannot be guessed over its lifetime
         verified = await self.container.user_cache_repo.check_verification_code(
             current_user.id,
             code=code,
         )
+        if verified is None:
+            raise raise_exception(
+                TooManyRequestsException,
+                ErrorMessageCodes.VERIFICATION_CODE_LIMIT,
+            )
         if not verified:
             raise raise_exception(
                 PermissionDeniedException,
@@ -186,23 +185,12 @@ class AuthService(BaseService):
         request_schema: SignInRequest,
         session: AsyncSession,
     ) -> JWTResponse:
-        try:
-            user_cache_model = await self.container.user_union.get_by_email(
-                request_schema.email,
-                session=session,
-            )
-        except DbObjectDoesNotExist:
-            raise raise_exception(
-                PermissionDeniedException,
-                ErrorMessageCodes.INVALID_EMAIL_OR_PASSWORD,
-            )
-
-        password_verified = await self.container.user_union.verify_password(
-            user_cache_model.id,
+        user_cache_model = await self.container.user_union.authenticate(
+            request_schema.email,
             request_schema.password,
             session=session,
         )
-        if not password_verified:
+        if user_cache_model is None:
             raise raise_exception(
                 PermissionDeniedException,
                 ErrorMessageCodes.INVALID_EMAIL_OR_PASSWORD,
@@ -215,7 +203,7 @@ class AuthService(BaseService):
 
     @staticmethod
     async def _generate_jwt_response(
-        user_cache_model: UserCacheModel,
+        user_cache_model: UserCacheStruct,
         with_refresh_token: bool = False,
     ) -> JWTResponse:
         now = datetime.datetime.now(datetime.UTC)
@@ -1,23 +1,76 @@
+import base64
+from typing import Any, Optional, Union
+
+from fastapi import Response
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.cache.models.user import UserCacheModel
+from app.cache.models.user import UserCacheStruct
+from app.core.conditional import (
+    make_etag,
+    etag_matches,
+    set_etag,
+    not_modified_response,
+)
 from app.core.environment import env
-from app.core.exceptions import raise_exception, NotFoundException, ErrorMessageCodes
+from app.core.responses import encode_user, encode_users, spliced_json_response
+from app.core.exceptions import (
+    raise_exception,
+    BadRequestException,
+    NotFoundException,
+    ErrorMessageCodes,
+)
 from app.db.exceptions import DbObjectDoesNotExist
-from app.schemas.rest.users import UsersResponse, MeResponse, UpdateUserRequest
+from app.schemas.rest.users import (
+    UsersResponse,
+    MeResponse,
+    UpdateUserRequest,
+    UsersBatchRequest,
+    UsersBatchResponse,
+)
 from app.services import BaseService
+from app.unions.loaders import UserLoader
 
 
 class UsersService(BaseService):
 
-    async def me(self, current_user: UserCacheModel) -> MeResponse:
+    async def me(
+        self,
+        current_user: UserCacheStruct,
+        version: str,
+        if_none_match: Optional[str],
+        response: Response,
+    ) -> Union[MeResponse, Response]:
+        """
+        :param version: version of the current user read before loading it
+        """
+
+        etag = make_etag(current_user.id, version)
+        if etag_matches(etag, if_none_match):
+            return not_modified_response(etag)
+
+        set_etag(response, etag)
         return MeResponse(user=current_user)
 
-    async def user(self, user_id: int, session: AsyncSession) -> MeResponse:
+    async def user(
+        self,
+        user_id: int,
+        if_none_match: Optional[str],
+        response: Response,
+        session: AsyncSession,
+    ) -> Union[MeResponse, Response]:
+        # The version is read before the user, a concurrent update then only makes
+        # the ETag older than the body and the next request gets the new one
+        version = await self.container.user_union.get_version(user_id)
+        etag = make_etag(user_id, version)
+        if etag_matches(etag, if_none_match):
+            return not_modified_response(etag)
+
         try:
             user_cache_model = await self.container.user_union.get(
                 user_id,
                 session=session,
+                json=env.cache_passthrough_enabled,
+                version=version,
             )
         except DbObjectDoesNotExist:
             raise raise_exception(
@@ -25,6 +78,12 @@ class UsersService(BaseService):
                 ErrorMessageCodes.USER_NOT_FOUND,
             )
 
+        if env.cache_passthrough_enabled:
+            response = spliced_json_response({'user': encode_user(user_cache_model)})
+            set_etag(response, etag)
+            return response
+
+        set_etag(response, etag)
         return MeResponse(user=user_cache_model)
 
     async def update_user(
@@ -79,22 +138,164 @@ class UsersService(BaseService):
             session=session,
         )
 
-    async def users(self, page: int, session: AsyncSession) -> UsersResponse:
+    async def users_batch(
+        self,
+        request_schema: UsersBatchRequest,
+        user_loader: UserLoader,
+    ) -> UsersBatchResponse:
+        user_cache_models = await user_loader.load_many(request_schema.ids)
+
+        found_ids = {user_cache_model.id for user_cache_model in user_cache_models}
+        return UsersBatchResponse(
+            data=user_cache_models,
+            missing_ids=[_id for _id in request_schema.ids if _id not in found_ids],
+        )
+
+    async def users(
+        self,
+        page: Optional[int],
+        after: Optional[str],
+        before: Optional[str],
+        if_none_match: Optional[str],
+        response: Response,
+        session: AsyncSession,
+    ) -> Union[UsersResponse, Response]:
+        # Any change of a user changes the list version, pages are told apart by the URL
+        etag = make_etag(
+            await self.container.user_union.get_list_version(),
+            env.pagination_items,
+        )
+        if etag_matches(etag, if_none_match):
+            return not_modified_response(etag)
+
+        if after is not None or before is not None:
+            users_response = await self._users_by_cursor(after, before, session)
+        else:
+            users_response = await self._users_by_page(page, session)
+
+        set_etag(
+            users_response if isinstance(users_response, Response) else response,
+            etag,
+        )
+        return users_response
+
+    async def _users_by_page(
+        self,
+        page: Optional[int],
+        session: AsyncSession,
+    ) -> Union[UsersResponse, Response]:
+        page = page or 1
         end_index = page * env.pagination_items
         start_index = end_index - env.pagination_items
 
-        users_count = await self.container.user_db_repo.count(
+        users_count = await self.container.user_union.count(
             session=session,
         )
         user_cache_models = await self.container.user_union.all(
-            page,
             start_index,
             env.pagination_items,
             session=session,
+            json=env.cache_passthrough_enabled,
+            # Entries of the local cache may predate the list version
+            local=False,
         )
-        return UsersResponse(
-            next=users_count > end_index,
-            previous=min(end_index, users_count) >= env.pagination_items,
-            count=users_count,
-            data=user_cache_models,
+
+        next_page = users_count > end_index
+        previous_page = min(end_index, users_count) >= env.pagination_items
+        return self._users_response(
+            {
+                'next': next_page,
+                'previous': previous_page,
+                'count': users_count,
+                'data': user_cache_models,
+                'next_cursor': (
+                    self._encode_cursor(user_cache_models[-1].id)
+                    if next_page and user_cache_models
+                    else None
+                ),
+                'previous_cursor': (
+                    self._encode_cursor(user_cache_models[0].id)
+                    if page > 1 and user_cache_models
+                    else None
+                ),
+            }
+        )
+
+    async def _users_by_cursor(
+        self,
+        after: Optional[str],
+        before: Optional[str],
+        session: AsyncSession,
+    ) -> Union[UsersResponse, Response]:
+        if after is not None and before is not None:
+            raise raise_exception(
+                BadRequestException,
+                ErrorMessageCodes.INVALID_CURSOR,
+            )
+
+        after_id = self._decode_cursor(after) if after is not None else None
+        before_id = self._decode_cursor(before) if before is not None else None
+
+        users_count = await self.container.user_union.count(
+            session=session,
+        )
+        user_cache_models, has_more = await self.container.user_union.all_by_cursor(
+            after_id,
+            before_id,
+            env.pagination_items,
+            session=session,
+            json=env.cache_passthrough_enabled,
+            local=False,
         )
+
+        # Moving forward there is always something behind the cursor and vice versa
+        next_page = has_more if after is not None else True
+        previous_page = has_more if before is not None else True
+        return self._users_response(
+            {
+                'next': next_page,
+                'previous': previous_page,
+                'count': users_count,
+                'data': user_cache_models,
+                'next_cursor': (
+                    self._encode_cursor(user_cache_models[-1].id)
+                    if next_page and user_cache_models
+                    else None
+                ),
+                'previous_cursor': (
+                    self._encode_cursor(user_cache_models[0].id)
+                    if previous_page and user_cache_models
+                    else None
+                ),
+            }
+        )
+
+    @staticmethod
+    def _users_response(fields: dict[str, Any]) -> Union[UsersResponse, Response]:
+        if not env.cache_passthrough_enabled:
+            return UsersResponse(**fields)
+
+        # Cached users are spliced into the page as stored, nothing is validated again
+        fields['data'] = encode_users(fields['data'])
+        return spliced_json_response(fields)
+
+    @staticmethod
+    def _encode_cursor(user_id: int) -> str:
+        return base64.urlsafe_b64encode(str(user_id).encode()).decode().rstrip('=')
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> int:
+        try:
+            user_id = int(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        except ValueError:
+            raise raise_exception(
+                BadRequestException,
+                ErrorMessageCodes.INVALID_CURSOR,
+            )
+
+        if user_id < 0:
+            raise raise_exception(
+                BadRequestException,
+                ErrorMessageCodes.INVALID_CURSOR,
+            )
+        return user_id
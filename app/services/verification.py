@@ -0,0 +1,115 @@
+import asyncio
+import datetime
+import logging
+import random
+import time
+
+from app.core.environment import env
+from app.services import BaseService
+
+
+class VerificationDeliveryService(BaseService):
+    """
+    Service of the delivery worker: sends the verification codes of the outbox in batches.
+    Failed batches stay pending and are retried with exponential backoff, messages that
+    keep failing go to a dead-letter stream.
+    """
+
+    def __init__(self, container, consumer: str):
+        super().__init__(container)
+        self.consumer = consumer
+        self.failures = 0
+
+    async def deliver_forever(self):
+        outbox = self.container.verification_outbox_cache_repo
+        await outbox.create_group()
+
+        last_claimed_at = 0.0
+        while True:
+            try:
+                if time.monotonic() - last_claimed_at > env.verification_claim_idle:
+                    await outbox.claim_abandoned(
+                        self.consumer,
+                        datetime.timedelta(seconds=env.verification_claim_idle),
+                        env.verification_batch_size,
+                    )
+                    last_claimed_at = time.monotonic()
+
+                # Failed and claimed messages first, then new ones
+                messages = await outbox.read(
+                    self.consumer,
+                    env.verification_batch_size,
+                    pending=True,
+                )
+                if not messages:
+                    messages = await outbox.read(
+                        self.consumer,
+                        env.verification_batch_size,
+                        block=datetime.timedelta(seconds=5),
+                    )
+                if messages:
+                    await self.deliver(messages)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception('Verification code delivery failed')
+                await self._backoff()
+
+    async def deliver(self, messages: list):
+        outbox = self.container.verification_outbox_cache_repo
+
+        # Nobody can use a code that has expired, it is not worth sending
+        expired_before = time.time() - env.verification_code_lifetime
+        expired = [
+            message_id
+            for message_id, message in messages
+            if message.created_at < expired_before
+        ]
+        messages = [
+            (message_id, message)
+            for message_id, message in messages
+            if message.created_at >= expired_before
+        ]
+        await outbox.ack(expired)
+        if not messages:
+            return
+
+        try:
+            await self.container.verification_code_sender.send(
+                [message for _, message in messages]
+            )
+        except Exception:
+            logging.exception(f'Sending {len(messages)} verification codes failed')
+            await self._give_up_exhausted(messages)
+            await self._backoff()
+            return
+
+        self.failures = 0
+        await outbox.ack([message_id for message_id, _ in messages])
+
+    async def _give_up_exhausted(self, messages: list):
+        outbox = self.container.verification_outbox_cache_repo
+        delivery_counts = await outbox.get_delivery_counts(
+            self.consumer,
+            [message_id for message_id, _ in messages],
+        )
+        exhausted = [
+            (message_id, message)
+            for message_id, message in messages
+            if delivery_counts.get(message_id, 0) >= env.verification_max_attempts
+        ]
+        if exhausted:
+            logging.error(
+                f'Giving up on {len(exhausted)} verification codes after '
+                f'{env.verification_max_attempts} attempts'
+            )
+            await outbox.move_to_dead_letter(exhausted)
+
+    async def _backoff(self):
+        self.failures += 1
+        delay = min(
+            env.verification_retry_backoff * 2 ** (self.failures - 1),
+            env.verification_retry_backoff_max,
+        )
+        # Jitter keeps the workers from retrying against the provider in lockstep
+        await asyncio.sleep(delay * random.uniform(0.5, 1))
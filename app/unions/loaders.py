@@ -0,0 +1,102 @@
+"""
+Module includes per-request loaders that batch lookups of unions
+"""
+
+import asyncio
+from typing import TYPE_CHECKING
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache.models.user import UserCacheStruct
+from app.db.exceptions import DbObjectDoesNotExist
+
+if TYPE_CHECKING:
+    from app.core.container import Container
+
+
+class UserLoader:
+    """
+    Coalesces the user lookups made within the same event loop tick
+    into a single UserUnion.get_many call and memoizes them for the request
+    """
+
+    def __init__(self, container: type['Container'], session: AsyncSession):
+        self.container = container
+        self.session = session
+
+        self._futures: dict[int, asyncio.Future] = dict()
+        self._queue: list[int] = list()
+        self._tasks: set[asyncio.Task] = set()
+        # The session can not be used by two batches at once
+        self._lock = asyncio.Lock()
+
+    def load(self, _id: int) -> asyncio.Future:
+        """
+        :return: future of the user, it fails with DbObjectDoesNotExist for a missing user
+        """
+
+        future = self._futures.get(_id)
+        if future is not None:
+            return future
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._futures[_id] = future
+
+        if not self._queue:
+            loop.call_soon(self._dispatch)
+        self._queue.append(_id)
+        return future
+
+    async def load_many(self, ids: list[int]) -> list[UserCacheStruct]:
+        """
+        :return: users in the order of ids, missing users are skipped
+        """
+
+        results = await asyncio.gather(
+            *(self.load(_id) for _id in ids),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, BaseException) and not isinstance(
+                result, DbObjectDoesNotExist
+            ):
+                raise result
+        return [
+            result for result in results if not isinstance(result, DbObjectDoesNotExist)
+        ]
+
+    def _dispatch(self):
+        ids, self._queue = self._queue, list()
+        task = asyncio.create_task(self._load_batch(ids))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _load_batch(self, ids: list[int]):
+        try:
+            async with self._lock:
+                user_cache_models = await self.container.user_union.get_many(
+                    ids,
+                    session=self.session,
+                )
+        except BaseException as exception:
+            for _id in ids:
+                future = self._futures.pop(_id)
+                if not future.done():
+                    future.set_exception(exception)
+            if isinstance(exception, asyncio.CancelledError):
+                raise
+            return
+
+        found = {
+            user_cache_model.id: user_cache_model
+            for user_cache_model in user_cache_models
+        }
+        for _id in ids:
+            future = self._futures[_id]
+            if future.done():
+                continue
+            if _id in found:
+                future.set_result(found[_id])
+            else:
+                future.set_exception(DbObjectDoesNotExist)
@@ -1,115 +1,647 @@
-from typing import Any
+import asyncio
+import copy
+import logging
+from typing import Any, Optional, Union
 
 import argon2.exceptions
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.environment import env
+from app.core.exceptions import ServiceUnavailableException
+from app.core.metrics import cache_lookups, password_rehashes
 from app.db.exceptions import DbObjectDoesNotExist
 from app.db.models.user import UserDbModel
+from app.db.routing import use_primary
 
 from app.cache.exceptions import CacheObjectDoesNotExist
-from app.cache.models.user import UserCacheModel
+from app.cache.models.user import UserCacheJson, UserCacheStruct
 
 from app.unions import BaseUnion
 
 
 class UserUnion(BaseUnion):
+    def __init__(self, container):
+        super().__init__(container)
+        self._index_rebuild: Optional[asyncio.Task] = None
 
     async def get(
         self,
         _id: int,
         session: AsyncSession,
-    ) -> UserCacheModel:
+        json: bool = False,
+        version: Optional[str] = None,
+    ) -> Union[UserCacheStruct, UserCacheJson]:
+        """
+        :param json: return Redis hits of the json codec as their stored JSON,
+            they are not decoded and kept in the local cache then
+        :param version: ETag version read before, the local cache is only used
+            if its user was loaded under the same version
+        """
+
+        try:
+            user_cache_model = await self.container.user_local_cache_repo.get(
+                _id,
+                version=version,
+            )
+        except CacheObjectDoesNotExist:
+            cache_lookups.inc('get', 'local', 'miss')
+        else:
+            cache_lookups.inc('get', 'local', 'hit')
+            return user_cache_model
+
+        generation = self.container.user_local_cache_repo.get_generation()
         try:
             user_cache_model = await self.container.user_cache_repo.get(
                 _id,
+                json=json,
             )
         except CacheObjectDoesNotExist:
+            cache_lookups.inc('get', 'redis', 'miss')
+            user_cache_model = await self.container.single_flight.do(
+                f'{self.container.user_cache_repo.prefix_key}:{_id}',
+                loader=lambda: self._load(_id, session=session),
+                cached=lambda: self.container.user_cache_repo.get(_id),
+                missing=DbObjectDoesNotExist,
+            )
+            # Every caller of the load gets the same struct, callers may modify theirs
+            user_cache_model = copy.copy(user_cache_model)
+        else:
+            cache_lookups.inc('get', 'redis', 'hit')
+            if isinstance(user_cache_model, UserCacheJson):
+                return user_cache_model
+
+        await self.container.user_local_cache_repo.set(
+            user_cache_model,
+            generation,
+            version=version,
+        )
+        return user_cache_model
+
+    async def _load(
+        self,
+        _id: int,
+        session: AsyncSession,
+    ) -> UserCacheStruct:
+        await self._route_reads(session, _id)
+        try:
             user_db_model = await self.container.user_db_repo.get(
                 _id,
                 session=session,
             )
+        except DbObjectDoesNotExist:
+            cache_lookups.inc('get', 'db', 'miss')
+            raise
+        cache_lookups.inc('get', 'db', 'hit')
 
-            user_cache_model = await self.container.user_cache_repo.set(
-                user_db_model,
-            )
-
-        return user_cache_model
+        return await self.container.user_cache_repo.set(
+            user_db_model,
+        )
 
     async def get_by_email(
         self,
         email: str,
         session: AsyncSession,
-    ) -> UserCacheModel:
-        user_db_model = await self.container.user_db_repo.get_by_email(
-            email,
+    ) -> UserCacheStruct:
+        user_db_model = await self._get_db_model_by_email(email, session=session)
+        return await self.container.user_cache_repo.set_with_email(user_db_model)
+
+    async def _get_db_model_by_email(
+        self,
+        email: str,
+        session: AsyncSession,
+    ) -> UserDbModel:
+        try:
+            return await self.container.user_db_repo.get_by_email(
+                email,
+                session=session,
+            )
+        except DbObjectDoesNotExist:
+            # The user may have just been created and not replicated yet
+            if session.info.get('primary') or self.container.db_replicas is None:
+                raise
+            use_primary(session)
+            return await self.container.user_db_repo.get_by_email(
+                email,
+                session=session,
+            )
+
+    async def authenticate(
+        self,
+        email: str,
+        password: str,
+        session: AsyncSession,
+    ) -> Optional[UserCacheStruct]:
+        """
+        Signs in with a single database query: the password hash only when the email
+        directory and the cache know the user, otherwise the whole row by email
+
+        :return: the user, None if the email is unknown or the password is wrong
+        """
+
+        user_cache_model = await self._get_cached_by_email(email)
+
+        password_hash = None
+        if user_cache_model is not None:
+            await self._route_reads(session, user_cache_model.id)
+            try:
+                password_hash = await self.container.user_db_repo.get_password_hash(
+                    user_cache_model.id,
+                    session=session,
+                )
+            except DbObjectDoesNotExist:
+                # Deleted user, the email may belong to a newer one
+                await self.container.user_cache_repo.delete_email(email)
+
+        if password_hash is None:
+            try:
+                user_db_model = await self._get_db_model_by_email(
+                    email,
+                    session=session,
+                )
+            except DbObjectDoesNotExist:
+                return None
+            password_hash = user_db_model.password
+            user_cache_model = await self.container.user_cache_repo.set_with_email(
+                user_db_model,
+            )
+
+        if not await self._check_password(
+            user_cache_model.id,
+            password_hash,
+            password,
             session=session,
-        )
+        ):
+            return None
+        return user_cache_model
 
-        user_cache_model = await self.container.user_cache_repo.set(
-            user_db_model,
-        )
+    async def _get_cached_by_email(self, email: str) -> Optional[UserCacheStruct]:
+        try:
+            _id = await self.container.user_cache_repo.get_id_by_email(email)
+        except CacheObjectDoesNotExist:
+            cache_lookups.inc('authenticate', 'directory', 'miss')
+            return None
+        cache_lookups.inc('authenticate', 'directory', 'hit')
+
+        try:
+            user_cache_model = await self.container.user_local_cache_repo.get(_id)
+        except CacheObjectDoesNotExist:
+            cache_lookups.inc('authenticate', 'local', 'miss')
+        else:
+            cache_lookups.inc('authenticate', 'local', 'hit')
+            return user_cache_model
 
+        generation = self.container.user_local_cache_repo.get_generation()
+        try:
+            user_cache_model = await self.container.user_cache_repo.get(_id)
+        except CacheObjectDoesNotExist:
+            cache_lookups.inc('authenticate', 'redis', 'miss')
+            return None
+        cache_lookups.inc('authenticate', 'redis', 'hit')
+
+        await self.container.user_local_cache_repo.set(user_cache_model, generation)
         return user_cache_model
 
     async def all(
         self,
-        page: int,
         offset: int,
         limit: int,
         session: AsyncSession,
-    ) -> list[UserCacheModel]:
+        json: bool = False,
+        local: bool = True,
+    ) -> list[Union[UserCacheStruct, UserCacheJson]]:
+        """
+        :param local: whether users may be served from the local cache
+        """
+
         try:
-            user_cache_models = await self.container.users_cache_repo.get(page)
+            user_ids = await self.container.users_cache_repo.get_page_ids(
+                offset,
+                limit,
+            )
         except CacheObjectDoesNotExist:
-            user_cache_models = list()
-
-        if not user_cache_models:
-            user_db_models = await self.container.user_db_repo.all(
+            await self._load_index(session=session)
+            user_ids = await self.container.users_cache_repo.get_page_ids(
                 offset,
                 limit,
+            )
+
+        return await self._get_indexed(
+            user_ids,
+            session=session,
+            json=json,
+            local=local,
+        )
+
+    async def all_by_cursor(
+        self,
+        after: Optional[int],
+        before: Optional[int],
+        limit: int,
+        session: AsyncSession,
+        json: bool = False,
+        local: bool = True,
+    ) -> tuple[list[Union[UserCacheStruct, UserCacheJson]], bool]:
+        """
+        :param local: whether users may be served from the local cache
+        :return: users of the page and whether there are more users past the page
+        """
+
+        # One extra id is loaded to know whether the page is the last one
+        try:
+            user_ids = await self.container.users_cache_repo.get_ids_by_cursor(
+                after,
+                before,
+                limit + 1,
+            )
+        except CacheObjectDoesNotExist:
+            # Building the index reads every id, a page of any depth is a keyset query
+            # on the primary key meanwhile
+            self._rebuild_index_in_background()
+            user_db_models = await self.container.user_db_repo.all_by_cursor(
+                after,
+                before,
+                limit + 1,
                 session=session,
             )
-            user_cache_models = await self.container.users_cache_repo.set(
-                page,
+            has_more = len(user_db_models) > limit
+            if after is not None:
+                user_db_models = user_db_models[:limit]
+            else:
+                user_db_models = user_db_models[-limit:]
+            self._observe_lookups('all', 'db', len(user_db_models), 0)
+            user_cache_models = await self.container.user_cache_repo.set_many(
                 user_db_models,
             )
+            return user_cache_models, has_more
+
+        has_more = len(user_ids) > limit
+        if after is not None:
+            user_ids = user_ids[:limit]
+        else:
+            user_ids = user_ids[-limit:]
+
+        user_cache_models = await self._get_indexed(
+            user_ids,
+            session=session,
+            json=json,
+            local=local,
+        )
+        return user_cache_models, has_more
+
+    async def prefill(
+        self,
+        list_pages: int,
+        page_size: int,
+        last_users: int,
+        session: AsyncSession,
+    ):
+        """
+        Loads the first list pages and the newest users into the caches
+        """
+
+        await self.count(session=session)
+        for page in range(list_pages):
+            await self.all(page * page_size, page_size, session=session)
+
+        if last_users > 0:
+            try:
+                user_ids = await self.container.users_cache_repo.get_last_ids(
+                    last_users,
+                )
+            except CacheObjectDoesNotExist:
+                await self._load_index(session=session)
+                user_ids = await self.container.users_cache_repo.get_last_ids(
+                    last_users,
+                )
+            await self.get_many(user_ids, session=session)
+
+    def _rebuild_index_in_background(self):
+        if self._index_rebuild is not None and not self._index_rebuild.done():
+            return
+        self._index_rebuild = asyncio.create_task(self._rebuild_index())
+
+    async def _rebuild_index(self):
+        try:
+            async with self.container.async_session() as session:
+                await self._load_index(session=session)
+        except Exception:
+            logging.exception('Users index rebuild failed')
+
+    async def _load_index(self, session: AsyncSession):
+        async def loader():
+            await self.container.users_cache_repo.build_index(
+                self.container.user_db_repo.iter_ids(session=session),
+            )
+            # The rebuilt index may differ from the one pages were served from
+            await self.container.users_cache_repo.bump_version()
+
+        await self.container.single_flight.do(
+            self.container.users_cache_repo.index_key,
+            loader=loader,
+            cached=self.container.users_cache_repo.check_index_exists,
+        )
+
+    async def get_many(
+        self,
+        ids: list[int],
+        session: AsyncSession,
+    ) -> list[UserCacheStruct]:
+        """
+        Every tier is queried once for all of its misses
+        :return: users in the order of ids, ids missing in the database are skipped
+        """
+
+        user_cache_models, _ = await self._get_many(
+            ids,
+            operation='get_many',
+            session=session,
+        )
         return user_cache_models
 
-    async def create(
+    async def _get_indexed(
         self,
-        user_db_model: UserDbModel,
+        ids: list[int],
         session: AsyncSession,
-    ) -> UserCacheModel:
-        await self.container.user_db_repo.create(
-            user_db_model,
+        json: bool = False,
+        local: bool = True,
+    ) -> list[Union[UserCacheStruct, UserCacheJson]]:
+        user_cache_models, deleted_ids = await self._get_many(
+            ids,
+            operation='all',
             session=session,
+            json=json,
+            local=local,
+        )
+
+        # The index may still reference users deleted behind its back,
+        # only the reader that removes them changes the versions
+        if deleted_ids and await self.container.users_cache_repo.remove(*deleted_ids):
+            for _id in deleted_ids:
+                await self.container.user_cache_repo.bump_version(_id)
+            await self.container.users_cache_repo.bump_version()
+
+        return user_cache_models
+
+    async def _get_many(
+        self,
+        ids: list[int],
+        operation: str,
+        session: AsyncSession,
+        json: bool = False,
+        local: bool = True,
+    ) -> tuple[list[Union[UserCacheStruct, UserCacheJson]], list[int]]:
+        """
+        :param operation: label of the lookup metrics
+        :param json: return Redis hits of the json codec as their stored JSON
+        :param local: whether users may be served from the local cache,
+            they are stored in it either way
+        :return: users in the order of ids and the ids missing in the database
+        """
+
+        found: dict[int, Union[UserCacheStruct, UserCacheJson]] = dict()
+        generation = self.container.user_local_cache_repo.get_generation()
+        if local:
+            for user_cache_model in await self.container.user_local_cache_repo.get_many(
+                ids
+            ):
+                if user_cache_model is not None:
+                    found[user_cache_model.id] = user_cache_model
+
+        missing_ids = [_id for _id in dict.fromkeys(ids) if _id not in found]
+        self._observe_lookups(operation, 'local', len(found), len(missing_ids))
+        if missing_ids:
+            for user_cache_model in await self.container.user_cache_repo.get_many(
+                missing_ids,
+                json=json,
+            ):
+                if user_cache_model is None:
+                    continue
+                found[user_cache_model.id] = user_cache_model
+                if isinstance(user_cache_model, UserCacheStruct):
+                    await self.container.user_local_cache_repo.set(
+                        user_cache_model,
+                        generation,
+                    )
+            looked_up_count = len(missing_ids)
+            missing_ids = [_id for _id in missing_ids if _id not in found]
+            self._observe_lookups(
+                operation,
+                'redis',
+                looked_up_count - len(missing_ids),
+                len(missing_ids),
+            )
+
+        if missing_ids:
+            await self._route_reads(session, *missing_ids)
+            user_db_models = await self.container.user_db_repo.get_many(
+                missing_ids,
+                session=session,
+            )
+            for user_cache_model in await self.container.user_cache_repo.set_many(
+                user_db_models,
+            ):
+                found[user_cache_model.id] = user_cache_model
+                await self.container.user_local_cache_repo.set(
+                    user_cache_model,
+                    generation,
+                )
+            looked_up_count = len(missing_ids)
+            missing_ids = [_id for _id in missing_ids if _id not in found]
+            self._observe_lookups(
+                operation,
+                'db',
+                looked_up_count - len(missing_ids),
+                len(missing_ids),
+            )
+
+        return [found[_id] for _id in ids if _id in found], missing_ids
+
+    @staticmethod
+    def _observe_lookups(operation: str, tier: str, hits: int, misses: int):
+        if hits:
+            cache_lookups.inc(operation, tier, 'hit', amount=hits)
+        if misses:
+            cache_lookups.inc(operation, tier, 'miss', amount=misses)
+
+    async def count(self, session: AsyncSession) -> int:
+        try:
+            return await self.container.users_cache_repo.get_count()
+        except CacheObjectDoesNotExist:
+            return await self.container.single_flight.do(
+                f'{self.container.users_cache_repo.prefix_key}:count',
+                loader=lambda: self._load_count(session=session),
+                cached=self.container.users_cache_repo.get_count,
+            )
+
+    async def _load_count(self, session: AsyncSession) -> int:
+        users_count = None
+        if env.users_count_mode == 'estimate':
+            users_count = await self.container.user_db_repo.estimate_count(
+                session=session,
+            )
+        if users_count is None:
+            users_count = await self.container.user_db_repo.count(
+                session=session,
+            )
+
+        previous_count = await self.container.users_cache_repo.set_count(users_count)
+        if previous_count != users_count:
+            # Pages show the count, they changed without any user changing
+            await self.container.users_cache_repo.bump_version()
+        return users_count
+
+    async def reconcile_count(self):
+        """
+        Periodically corrects the maintained count against the database;
+        runs for the lifetime of the worker, only one worker reconciles per interval
+        """
+
+        while True:
+            await asyncio.sleep(env.users_count_reconcile_interval)
+            try:
+                if await self.container.users_cache_repo.lock_count_reconciliation(
+                    env.users_count_reconcile_interval,
+                ):
+                    async with self.container.async_session() as session:
+                        await self._load_count(session=session)
+            except Exception:
+                logging.exception('Users count reconciliation failed')
+
+    async def check_email_registered(
+        self,
+        email: str,
+        session: AsyncSession,
+    ) -> bool:
+        """
+        The email filter answers for new emails, only possible matches are checked
+        in the database
+        """
+
+        if not env.email_filter_enabled:
+            return False
+
+        might_contain = await self.container.email_filter_cache_repo.might_contain(
+            email
         )
-        await self.container.users_cache_repo.clear()
-        user_cache_model = await self.get(
-            user_db_model.id,
+        if might_contain is False:
+            return False
+
+        # The request writes, so the check must not read a lagging replica
+        use_primary(session)
+        registered = await self.container.user_db_repo.exists(email, session=session)
+        if might_contain and not registered:
+            self.container.email_filter_cache_repo.false_positives += 1
+        return registered
+
+    async def maintain_email_filter(self, poll_interval: float = 60):
+        """
+        Builds the email filter when it is missing and rebuilds it periodically to drop
+        deleted emails; runs for the lifetime of the worker, one worker rebuilds at a time
+        """
+
+        email_filter_cache_repo = self.container.email_filter_cache_repo
+        while True:
+            try:
+                if await email_filter_cache_repo.lock_rebuild(
+                    env.email_filter_rebuild_interval,
+                ):
+                    async with self.container.async_session() as session:
+                        count = await email_filter_cache_repo.rebuild(
+                            self.container.user_db_repo.iter_emails(session=session),
+                            env.email_filter_rebuild_interval,
+                        )
+                    if count > email_filter_cache_repo.capacity:
+                        logging.warning(
+                            f'Email filter holds {count} emails over its capacity '
+                            f'{email_filter_cache_repo.capacity}, '
+                            f'its error rate is higher than configured'
+                        )
+                await email_filter_cache_repo.update_fill_ratio()
+            except Exception:
+                logging.exception('Email filter maintenance failed')
+            await asyncio.sleep(min(poll_interval, env.email_filter_rebuild_interval))
+
+    async def create(
+        self,
+        values: dict[str, Any],
+        session: AsyncSession,
+    ) -> UserCacheStruct:
+        user_db_model = await self.container.user_db_repo.create(
+            values,
             session=session,
         )
+        await self._stick_to_primary(user_db_model.id)
+        await self.container.users_cache_repo.add(user_db_model.id)
+        await self.container.users_cache_repo.incr_count(1)
+        await self.container.user_local_cache_repo.invalidate(user_db_model.id)
+        if env.email_filter_enabled:
+            await self.container.email_filter_cache_repo.add(user_db_model.email)
+        # The returned row is complete, it is cached without reading it back
+        user_cache_model = await self.container.user_cache_repo.set_with_email(
+            user_db_model
+        )
+        await self._bump_versions(user_db_model.id)
         return user_cache_model
 
     async def update(
         self,
-        user_cache_model: UserCacheModel,
+        user_cache_model: UserCacheStruct,
         values: dict[str, Any],
         session: AsyncSession,
-    ) -> UserCacheModel:
+    ) -> UserCacheStruct:
         await self.container.user_db_repo.update(
             user_cache_model.id,
             values,
             session=session,
         )
+        await self._stick_to_primary(user_cache_model.id)
         await self.container.user_cache_repo.update(user_cache_model)
-        await self.container.users_cache_repo.clear()
+        await self.container.user_local_cache_repo.invalidate(user_cache_model.id)
+        await self._bump_versions(user_cache_model.id)
         return user_cache_model
 
     async def delete(self, _id: int, session: AsyncSession):
         await self.container.user_db_repo.delete(_id, session=session)
+        await self._stick_to_primary(_id)
         await self.container.user_cache_repo.delete(_id)
-        await self.container.users_cache_repo.clear()
+        await self.container.users_cache_repo.remove(_id)
+        await self.container.users_cache_repo.incr_count(-1)
+        await self.container.user_local_cache_repo.invalidate(_id)
+        await self._bump_versions(_id)
+
+    async def get_version(self, _id: int) -> str:
+        return await self.container.user_cache_repo.get_version(_id)
+
+    async def get_list_version(self) -> str:
+        return await self.container.users_cache_repo.get_version()
+
+    async def _bump_versions(self, _id: int):
+        """
+        Changes the ETags of the user and of the list after a write, once the data itself
+        has changed. Readers take the version before the data, so a body is never older
+        than its ETag. Pages also change when the count is reconciled, the index is
+        rebuilt or users deleted behind its back are pruned, those paths bump the list
+        version themselves.
+        """
+
+        await self.container.user_cache_repo.bump_version(_id)
+        await self.container.users_cache_repo.bump_version()
+
+    async def _stick_to_primary(self, _id: int):
+        if self.container.db_replicas is not None:
+            await self.container.user_cache_repo.stick_to_primary(_id)
+
+    async def _route_reads(self, session: AsyncSession, *ids: int):
+        """
+        Sends the reads of the session to the primary if any of the users
+        was written recently, replicas may not have caught up yet
+        """
+
+        if self.container.db_replicas is None or session.info.get('primary'):
+            return
+        if await self.container.user_cache_repo.check_sticks_to_primary(*ids):
+            use_primary(session)
 
     async def verify_password(
         self,
@@ -117,6 +649,7 @@ class UserUnion(BaseUnion):
         password: str,
         session: AsyncSession,
     ) -> bool:
+        await self._route_reads(session, _id)
         try:
             password_hash = await self.container.user_db_repo.get_password_hash(
                 _id,
@@ -125,8 +658,17 @@ class UserUnion(BaseUnion):
         except DbObjectDoesNotExist:
             return False
 
+        return await self._check_password(_id, password_hash, password, session)
+
+    async def _check_password(
+        self,
+        _id: int,
+        password_hash: str,
+        password: str,
+        session: AsyncSession,
+    ) -> bool:
         try:
-            password_verified = self.container.password_hasher.verify(
+            password_verified = await self.container.password_hasher.verify(
                 password_hash,
                 password,
             )
@@ -137,4 +679,37 @@ class UserUnion(BaseUnion):
         ):
             return False
 
+        if password_verified and self.container.password_hasher.needs_rehash(
+            password_hash
+        ):
+            await self._rehash_password(_id, password_hash, password, session)
+
         return password_verified
+
+    async def _rehash_password(
+        self,
+        _id: int,
+        password_hash: str,
+        password: str,
+        session: AsyncSession,
+    ):
+        """
+        Upgrades a hash created with older parameters while the plain password is known.
+        The sign-in succeeds anyway, the next one retries if this fails.
+        """
+
+        try:
+            new_password_hash = await self.container.password_hasher.hash(password)
+            await self.container.user_db_repo.update_password_hash(
+                _id,
+                password_hash,
+                new_password_hash,
+                session=session,
+            )
+        except ServiceUnavailableException:
+            pass
+        except SQLAlchemyError:
+            await session.rollback()
+            logging.exception('Password rehash failed')
+        else:
+            password_rehashes.inc()
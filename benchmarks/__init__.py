@@ -0,0 +1,15 @@
+"""
+Benchmarks are run as modules from the project root, e.g. python -m benchmarks.auth_dependency.
+The settings required by app.core.environment get placeholder values unless already set.
+"""
+
+import os
+
+os.environ.setdefault('JWT_SECRETKEY', 'benchmark-secret-key-of-32-bytes!')
+os.environ.setdefault('JWT_ALGORITHM', 'HS256')
+os.environ.setdefault('ACCESS_TOKEN_LIFETIME', '5')
+os.environ.setdefault('REFRESH_TOKEN_LIFETIME', '1440')
+os.environ.setdefault('DB_CONNECTION', 'postgresql+asyncpg://')
+os.environ.setdefault('REDIS_HOST', 'localhost')
+os.environ.setdefault('REDIS_PORT', '6379')
+os.environ.setdefault('ADMIN_EMAIL', 'admin@admin.com')
@@ -0,0 +1,58 @@
+"""
+Microbenchmark of the user cache entry serialization.
+
+Compares the previous pydantic JSON entries with the json and binary codecs:
+encode and decode time per user and the size of an entry.
+
+Run from the project root: python -m benchmarks.cache_codec
+"""
+
+import timeit
+
+from app.cache.codecs import CACHE_CODECS, decode
+from app.cache.models.user import UserCacheModel, UserCacheStruct
+
+NUMBER = 100000
+
+
+def main():
+    user = UserCacheStruct(
+        id=123456,
+        email='john.doe@example.com',
+        first_name='John',
+        last_name='Doe',
+        verified=True,
+        is_admin=False,
+    )
+    user_model = UserCacheModel.model_validate(user)
+    pydantic_value = user_model.model_dump_json().encode()
+
+    results = {
+        'pydantic json': (
+            timeit.timeit(lambda: user_model.model_dump_json(), number=NUMBER),
+            timeit.timeit(
+                lambda: UserCacheModel.model_validate_json(pydantic_value),
+                number=NUMBER,
+            ),
+            len(pydantic_value),
+        ),
+    }
+    for name, codec in CACHE_CODECS.items():
+        value = codec.encode(user)
+        results[f'{name} codec'] = (
+            timeit.timeit(lambda: codec.encode(user), number=NUMBER),
+            timeit.timeit(lambda: decode(value), number=NUMBER),
+            len(value),
+        )
+
+    for name, (encode_seconds, decode_seconds, size) in results.items():
+        print(
+            f'{name:<16}'
+            f' encode {encode_seconds / NUMBER * 1_000_000:6.2f} us'
+            f' decode {decode_seconds / NUMBER * 1_000_000:6.2f} us'
+            f' {size:4} bytes'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Compares two results of benchmarks.load, e.g. of two commits.
+
+Run from the project root: python -m benchmarks.compare before.json after.json
+"""
+
+import argparse
+import json
+
+METRICS = ('throughput', 'p50_ms', 'p95_ms', 'p99_ms')
+
+
+def change(before: float, after: float) -> str:
+    if not before:
+        return '     n/a'
+    return f'{(after - before) / before * 100:+7.1f}%'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    arguments = parser.parse_args()
+
+    with open(arguments.before) as file:
+        before = json.load(file)
+    with open(arguments.after) as file:
+        after = json.load(file)
+
+    if before.get('config') != after.get('config'):
+        print('warning: the results were produced with different settings')
+    print(f'{before.get("commit", "?")} -> {after.get("commit", "?")}')
+
+    print(f'{"endpoint":<10}' + ''.join(f' {metric:>22}' for metric in METRICS))
+    for operation in sorted(set(before['endpoints']) | set(after['endpoints'])):
+        before_endpoint = before['endpoints'].get(operation, {})
+        after_endpoint = after['endpoints'].get(operation, {})
+        cells = list()
+        for metric in METRICS:
+            before_value = before_endpoint.get(metric, 0)
+            after_value = after_endpoint.get(metric, 0)
+            cells.append(
+                f'{before_value:>7.1f} {after_value:>7.1f} '
+                f'{change(before_value, after_value)}'
+            )
+        print(f'{operation:<10}' + ''.join(f' {cell:>22}' for cell in cells))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Bulk synthetic users for the benchmarks, loaded with COPY.
+
+All users share one precomputed argon2 hash of the same password, hashing every password
+would take longer than the benchmark itself.
+"""
+
+import datetime
+import random
+
+import asyncpg
+from argon2 import PasswordHasher
+
+PASSWORD = 'benchmark-password'
+ADMIN_EMAIL = 'admin@benchmark.example.com'
+
+FIRST_NAMES = ['Alex', 'Maria', 'John', 'Aisha', 'Li', 'Olga', 'Omar', 'Sofia', None]
+LAST_NAMES = ['Smith', 'Ivanova', 'Chen', 'Garcia', 'Khan', 'Mueller', None]
+
+
+def user_email(index: int) -> str:
+    return f'user{index}@benchmark.example.com'
+
+
+def generate_users(count: int, password_hash: str, seed: int = 0):
+    """
+    :return: rows of the users table, the first user is the admin
+    """
+
+    rng = random.Random(seed)
+    created_at = datetime.datetime.now()
+    for index in range(1, count + 1):
+        yield (
+            index,
+            ADMIN_EMAIL if index == 1 else user_email(index),
+            rng.choice(FIRST_NAMES),
+            rng.choice(LAST_NAMES),
+            password_hash,
+            True,
+            index == 1,
+            created_at,
+        )
+
+
+async def seed_users(
+    dsn: str,
+    count: int,
+    password_hasher: PasswordHasher,
+    chunk_size: int = 50000,
+):
+    """
+    Replaces the content of the users table with count synthetic users
+
+    :param password_hasher: hasher with the parameters of the application, otherwise
+        every first sign-in of a user would rehash its password
+    """
+
+    password_hash = password_hasher.hash(PASSWORD)
+
+    connection = await asyncpg.connect(dsn.replace('postgresql+asyncpg', 'postgresql'))
+    try:
+        await connection.execute('TRUNCATE users RESTART IDENTITY')
+
+        rows = generate_users(count, password_hash)
+        while chunk := [row for _, row in zip(range(chunk_size), rows)]:
+            await connection.copy_records_to_table(
+                'users',
+                records=chunk,
+                columns=[
+                    'id',
+                    'email',
+                    'first_name',
+                    'last_name',
+                    'password',
+                    'verified',
+                    'is_admin',
+                    'created_at',
+                ],
+            )
+
+        await connection.execute(
+            "SELECT setval(pg_get_serial_sequence('users', 'id'), $1)",
+            count,
+        )
+        await connection.execute('ANALYZE users')
+    finally:
+        await connection.close()
@@ -0,0 +1,308 @@
+"""
+End-to-end load test of the application booted in-process.
+
+The app runs with its lifespan behind an ASGI transport, against a throwaway local Postgres
+(or --db-connection) and an in-memory Redis, after seeding --users synthetic users.
+A fixed number of concurrent clients send a weighted mix of requests for --duration
+seconds, then throughput and latency percentiles per endpoint are printed and written
+as JSON for benchmarks.compare.
+
+Run from the project root: python -m benchmarks.load --users 10000 --output result.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import asdict
+
+from benchmarks.datagen import ADMIN_EMAIL, PASSWORD, seed_users, user_email
+from benchmarks.standins import LocalPostgres, use_in_memory_redis
+
+DEFAULT_MIX = 'me=50,user=20,users=15,sign_in=10,sign_up=5'
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    weights = dict()
+    for item in mix.split(','):
+        name, weight = item.split('=')
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+def percentile(sorted_values: list[float], percent: float) -> float:
+    """
+    Nearest-rank percentile
+    """
+
+    if not sorted_values:
+        return 0.0
+    rank = max(int(-(-percent * len(sorted_values) // 100)), 1)
+    return sorted_values[rank - 1]
+
+
+def make_access_token(user_id: int) -> str:
+    import jwt
+
+    from app.core.environment import env
+    from app.schemas.rest.auth import JwtTokenPayload
+
+    payload = JwtTokenPayload(
+        id=user_id,
+        type='access',
+        exp=datetime.datetime.now(datetime.UTC)
+        + datetime.timedelta(minutes=env.access_token_lifetime),
+    )
+    return jwt.encode(
+        payload.model_dump(),
+        env.jwt_secretkey.get_secret_value(),
+        algorithm=env.jwt_algorithm,
+    )
+
+
+class LoadTest:
+    def __init__(self, client, users: int, mix: dict[str, float], seed: int):
+        self.client = client
+        self.users = users
+        self.operations = list(mix)
+        self.weights = list(mix.values())
+        self.rng = random.Random(seed)
+
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+        self.admin_headers: dict[str, str] = dict()
+        self.user_tokens: list[str] = list()
+
+    def prepare(self, token_count: int = 1000):
+        """
+        Tokens are minted directly, signing in every simulated user is not the point
+        """
+
+        self.admin_headers = {'Authorization': f'Bearer {make_access_token(1)}'}
+        self.user_tokens = [
+            make_access_token(self.rng.randint(1, self.users))
+            for _ in range(min(token_count, self.users))
+        ]
+
+    async def me(self):
+        token = self.rng.choice(self.user_tokens)
+        return await self.client.get(
+            '/rest/users/me',
+            headers={'Authorization': f'Bearer {token}'},
+        )
+
+    async def user(self):
+        return await self.client.get(
+            f'/rest/users/users/{self.rng.randint(1, self.users)}',
+            headers=self.admin_headers,
+        )
+
+    async def users_page(self):
+        pages = max(self.users // 30, 1)
+        # Early pages are requested far more often than deep ones
+        page = min(int(self.rng.paretovariate(1.2)), pages)
+        return await self.client.get(
+            f'/rest/users/users?page={page}',
+            headers=self.admin_headers,
+        )
+
+    async def sign_in(self):
+        index = self.rng.randint(2, max(self.users, 2))
+        return await self.client.post(
+            '/rest/auth/sign-in',
+            json={'email': user_email(index), 'password': PASSWORD},
+        )
+
+    async def sign_up(self):
+        return await self.client.post(
+            '/rest/auth/sign-up',
+            json={
+                'email': f'load-{uuid.uuid4().hex}@benchmark.example.com',
+                'password': PASSWORD,
+            },
+        )
+
+    async def worker(self, deadline: float, record: bool):
+        handlers = {
+            'me': self.me,
+            'user': self.user,
+            'users': self.users_page,
+            'sign_in': self.sign_in,
+            'sign_up': self.sign_up,
+        }
+        while time.perf_counter() < deadline:
+            operation = self.rng.choices(self.operations, self.weights)[0]
+            started_at = time.perf_counter()
+            response = await handlers[operation]()
+            latency = time.perf_counter() - started_at
+            if not record:
+                continue
+            self.latencies[operation].append(latency)
+            if response.status_code >= 400:
+                self.errors[operation] += 1
+
+    async def run(self, concurrency: int, duration: float, record: bool = True):
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(
+            *(self.worker(deadline, record) for _ in range(concurrency))
+        )
+
+    def results(self, duration: float) -> dict:
+        endpoints = dict()
+        for operation, latencies in sorted(self.latencies.items()):
+            latencies.sort()
+            endpoints[operation] = {
+                'requests': len(latencies),
+                'errors': self.errors[operation],
+                'throughput': len(latencies) / duration,
+                'p50_ms': percentile(latencies, 50) * 1000,
+                'p95_ms': percentile(latencies, 95) * 1000,
+                'p99_ms': percentile(latencies, 99) * 1000,
+            }
+
+        total = sum(endpoint['requests'] for endpoint in endpoints.values())
+        return {
+            'total': {
+                'requests': total,
+                'errors': sum(self.errors.values()),
+                'throughput': total / duration,
+            },
+            'endpoints': endpoints,
+        }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+async def run(arguments, db_connection: str) -> dict:
+    import httpx
+
+    from app import app
+    from app.core.container import Container
+    from app.core.environment import env
+
+    use_in_memory_redis()
+
+    async with app.router.lifespan_context(app):
+        await seed_users(
+            db_connection,
+            arguments.users,
+            Container.password_hasher.parameters.create_hasher(),
+        )
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport,
+            base_url='http://benchmark',
+            timeout=None,
+        ) as client:
+            load_test = LoadTest(
+                client,
+                users=arguments.users,
+                mix=parse_mix(arguments.mix),
+                seed=arguments.seed,
+            )
+            load_test.prepare()
+
+            await load_test.run(arguments.concurrency, arguments.warmup, record=False)
+            started_at = time.perf_counter()
+            await load_test.run(arguments.concurrency, arguments.duration)
+            duration = time.perf_counter() - started_at
+
+        results = load_test.results(duration)
+        results['config'] = {
+            'users': arguments.users,
+            'concurrency': arguments.concurrency,
+            'duration': arguments.duration,
+            'warmup': arguments.warmup,
+            'mix': arguments.mix,
+            'seed': arguments.seed,
+            'password_hashing_pool': env.password_hashing_pool,
+            'cache_codec': env.cache_codec,
+            'password_hashing': asdict(Container.password_hasher.parameters),
+        }
+    return results
+
+
+def print_results(results: dict):
+    print(
+        f'{"endpoint":<10} {"requests":>9} {"errors":>7} {"req/s":>9}'
+        f' {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}'
+    )
+    for operation, endpoint in results['endpoints'].items():
+        print(
+            f'{operation:<10} {endpoint["requests"]:>9} {endpoint["errors"]:>7}'
+            f' {endpoint["throughput"]:>9.1f} {endpoint["p50_ms"]:>8.2f}'
+            f' {endpoint["p95_ms"]:>8.2f} {endpoint["p99_ms"]:>8.2f}'
+        )
+    total = results['total']
+    print(
+        f'{"total":<10} {total["requests"]:>9} {total["errors"]:>7}'
+        f' {total["throughput"]:>9.1f}'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--warmup', type=float, default=5)
+    parser.add_argument('--mix', default=DEFAULT_MIX)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument(
+        '--db-connection',
+        help='existing database to use (its users table is replaced) '
+        'instead of a throwaway local cluster',
+    )
+    parser.add_argument('--output', help='path of the JSON result')
+    arguments = parser.parse_args()
+
+    postgres = None
+    db_connection = arguments.db_connection
+    if db_connection is None:
+        postgres = LocalPostgres()
+        db_connection = postgres.start()
+
+    # The settings are read when the application is imported
+    os.environ['DB_CONNECTION'] = db_connection
+    os.environ['ADMIN_EMAIL'] = ADMIN_EMAIL
+    os.environ['ACCESS_TOKEN_LIFETIME'] = '1440'
+    # All simulated clients share one address
+    os.environ['RATE_LIMITS_ENABLED'] = 'false'
+
+    try:
+        results = asyncio.run(run(arguments, db_connection))
+    finally:
+        if postgres is not None:
+            postgres.stop()
+
+    results['commit'] = git_commit()
+    results['python'] = platform.python_version()
+    results['created_at'] = datetime.datetime.now(datetime.UTC).isoformat()
+
+    print_results(results)
+    if arguments.output:
+        with open(arguments.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Microbenchmark of the metrics collection overhead.
+
+Measures the cost of single observations on the hot path, of the metrics middleware
+around a trivial ASGI app and of publishing a snapshot of the registry.
+
+Run from the project root: python -m benchmarks.metrics_overhead
+"""
+
+import asyncio
+import json
+import time
+import timeit
+
+from app.core.metrics import (
+    cache_lookups,
+    http_request_duration,
+    metrics,
+    redis_command_duration,
+    render,
+)
+from app.core.middleware import MetricsMiddleware
+from app.db.metrics import _get_statement_labels
+
+NUMBER = 100000
+
+
+class Route:
+    path = '/rest/users/users/{user_id}'
+
+
+async def endpoint(scope, receive, send):
+    scope['route'] = Route
+    await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def receive():
+    return {'type': 'http.request', 'body': b''}
+
+
+async def send(message):
+    pass
+
+
+async def time_asgi_app(app) -> float:
+    scope = {'type': 'http', 'method': 'GET', 'path': '/rest/users/users/1'}
+    started_at = time.perf_counter()
+    for _ in range(NUMBER):
+        await app(dict(scope), receive, send)
+    return time.perf_counter() - started_at
+
+
+def main():
+    statement = 'SELECT users.id, users.email FROM users WHERE users.id = $1::INTEGER'
+
+    results = {
+        'histogram observe': timeit.timeit(
+            lambda: redis_command_duration.observe(0.0003, 'GET'), number=NUMBER
+        ),
+        'counter inc': timeit.timeit(
+            lambda: cache_lookups.inc('get', 'local', 'hit'), number=NUMBER
+        ),
+        'statement labels': timeit.timeit(
+            lambda: _get_statement_labels(statement), number=NUMBER
+        ),
+        'asgi app': asyncio.run(time_asgi_app(endpoint)),
+        'asgi app + middleware': asyncio.run(
+            time_asgi_app(MetricsMiddleware(endpoint))
+        ),
+    }
+
+    for name, seconds in results.items():
+        print(f'{name:<24} {seconds / NUMBER * 1_000_000:8.3f} us/call')
+
+    # Enough label combinations to resemble a busy worker
+    for route in range(20):
+        for status in ('200', '204', '404'):
+            http_request_duration.observe(0.01, 'GET', f'/route/{route}', status)
+
+    number = 100
+    snapshot_seconds = timeit.timeit(metrics.snapshot, number=number)
+    snapshots = [json.loads(metrics.snapshot()) for _ in range(4)]
+    render_seconds = timeit.timeit(lambda: render(snapshots), number=number)
+    print(f'{"snapshot":<24} {snapshot_seconds / number * 1_000:8.3f} ms/call')
+    print(f'{"render of 4 workers":<24} {render_seconds / number * 1_000:8.3f} ms/call')
+
+
+if __name__ == '__main__':
+    main()
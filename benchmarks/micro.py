@@ -0,0 +1,298 @@
+"""
+Microbenchmarks of the primitives on every request path, with a regression gate.
+
+Every case is timed as the best of several repeats and divided by the time of a fixed
+pure-Python reference workload measured alongside it, so stored baselines stay
+comparable between machines of a similar kind. A case fails when its normalized time
+exceeds the baseline by more than the threshold in two measurements, and the exit code
+is then 1.
+
+Thresholds of single cases are set in the 'thresholds' section of the baselines file,
+null reports a case without gating it. Argon2 depends on memory bandwidth far more than
+the reference workload does, its cases are only reported.
+
+Run from the project root:
+    python -m benchmarks.micro                     # check against the baselines
+    python -m benchmarks.micro --update-baseline   # store new baselines
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+from typing import Callable, Optional
+
+from app.cache.codecs import CACHE_CODECS, decode, passthrough
+from app.cache.models.user import UserCacheModel, UserCacheStruct
+from app.core.authentication import JWTBearer
+from app.core.environment import env
+from app.core.exceptions import ErrorMessageCodes, NotFoundException, raise_exception
+from app.core.hashing import PasswordHashingParameters
+from app.core.responses import encode_users, spliced_json_response
+from app.schemas.rest.users import UsersResponse
+from app.services.rest.auth import AuthService
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baselines.json')
+REPEAT = 7
+REFERENCE_NUMBER = 500
+
+
+def run_coroutine(coroutine):
+    """
+    Runs a coroutine that never suspends without the overhead of an event loop
+    """
+
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError('The coroutine suspended')
+
+
+def reference():
+    total = 0
+    for i in range(1000):
+        total += i * i
+    return total
+
+
+def make_cases() -> dict[str, tuple[Callable, int]]:
+    """
+    :return: callable and the number of calls per repeat of every case
+    """
+
+    user = UserCacheStruct(
+        id=123456,
+        email='john.doe@example.com',
+        first_name='John',
+        last_name='Doe',
+        verified=True,
+        is_admin=False,
+    )
+    user_json = UserCacheModel.model_validate(user).model_dump_json()
+    page = [
+        UserCacheStruct(
+            id=_id,
+            email=f'user{_id}@example.com',
+            first_name='John',
+            last_name=None,
+            verified=True,
+            is_admin=False,
+        )
+        for _id in range(1, 31)
+    ]
+    page_entries = {
+        name: [codec.encode(user) for user in page]
+        for name, codec in CACHE_CODECS.items()
+    }
+
+    jwt_response = run_coroutine(
+        AuthService._generate_jwt_response(user, with_refresh_token=True)
+    )
+    cold_bearer = JWTBearer()
+    cold_bearer.verified_tokens.max_size = 0
+    warm_bearer = JWTBearer()
+
+    password_hasher = PasswordHashingParameters(
+        time_cost=env.password_hashing_time_cost,
+        memory_cost=env.password_hashing_memory_cost,
+        parallelism=env.password_hashing_parallelism,
+    ).create_hasher()
+    password_hash = password_hasher.hash('benchmark-password')
+
+    cases = {
+        'jwt_encode_response': (
+            lambda: run_coroutine(
+                AuthService._generate_jwt_response(user, with_refresh_token=True)
+            ),
+            2000,
+        ),
+        'jwt_verify_uncached': (
+            lambda: cold_bearer.verify_jwt(jwt_response.access_token),
+            2000,
+        ),
+        'jwt_verify_cached': (
+            lambda: warm_bearer.verify_jwt(jwt_response.access_token),
+            20000,
+        ),
+        'user_model_validate': (lambda: UserCacheModel.model_validate(user), 20000),
+        'user_model_validate_json': (
+            lambda: UserCacheModel.model_validate_json(user_json),
+            20000,
+        ),
+        'user_model_dump_json': (
+            lambda: UserCacheModel.model_validate(user).model_dump_json(),
+            20000,
+        ),
+        'users_page_response': (
+            lambda: UsersResponse(
+                next=True,
+                previous=False,
+                count=1000,
+                data=page,
+            ).model_dump_json(),
+            2000,
+        ),
+        # The same page spliced from json codec entries as they come from Redis
+        'users_page_passthrough': (
+            lambda: spliced_json_response(
+                {
+                    'next': True,
+                    'previous': False,
+                    'count': 1000,
+                    'data': encode_users(
+                        [
+                            passthrough(user.id, entry)
+                            for user, entry in zip(page, page_entries['json'])
+                        ]
+                    ),
+                }
+            ),
+            2000,
+        ),
+        'password_hash': (lambda: password_hasher.hash('benchmark-password'), 3),
+        'password_verify': (
+            lambda: password_hasher.verify(password_hash, 'benchmark-password'),
+            3,
+        ),
+        'raise_exception': (
+            lambda: raise_exception(
+                NotFoundException, ErrorMessageCodes.USER_NOT_FOUND
+            ),
+            20000,
+        ),
+    }
+    for name, entries in page_entries.items():
+        cases[f'users_page_decode_{name}'] = (
+            lambda entries=entries: [decode(entry) for entry in entries],
+            2000,
+        )
+        cases[f'users_page_encode_{name}'] = (
+            lambda codec=CACHE_CODECS[name]: [codec.encode(user) for user in page],
+            2000,
+        )
+    return cases
+
+
+def measure(
+    cases: dict[str, tuple[Callable, int]], repeat: int
+) -> tuple[dict[str, float], dict[str, float]]:
+    """
+    The reference is timed next to every repeat of every case, so a slow phase of a
+    noisy machine affects both sides of the ratio
+
+    :return: seconds per call and normalized time of every case
+    """
+
+    reference_timer = timeit.Timer(reference)
+    seconds, normalized = dict(), dict()
+    for name, (function, number) in cases.items():
+        timer = timeit.Timer(function)
+        case_times, reference_times = list(), list()
+        for _ in range(repeat):
+            reference_times.append(reference_timer.timeit(REFERENCE_NUMBER))
+            case_times.append(timer.timeit(number) / number)
+        seconds[name] = min(case_times)
+        normalized[name] = seconds[name] / (min(reference_times) / REFERENCE_NUMBER)
+    return seconds, normalized
+
+
+def load_baselines(path: str) -> tuple[dict[str, float], dict[str, Optional[float]]]:
+    """
+    :return: baselines and per-case thresholds
+    """
+
+    if not os.path.exists(path):
+        return dict(), dict()
+    with open(path) as file:
+        content = json.load(file)
+    return content.get('baselines', dict()), content.get('thresholds', dict())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument(
+        '--threshold',
+        type=float,
+        default=0.25,
+        help='allowed slowdown against the baseline, 0.25 is 25%%, '
+        'for cases without a threshold of their own',
+    )
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('cases', nargs='*', help='run only these cases')
+    arguments = parser.parse_args()
+
+    cases = make_cases()
+    if arguments.cases:
+        cases = {name: case for name, case in cases.items() if name in arguments.cases}
+
+    seconds, normalized = measure(cases, arguments.repeat)
+    baselines, thresholds = load_baselines(arguments.baseline)
+
+    if arguments.update_baseline:
+        baselines.update({name: round(value, 4) for name, value in normalized.items()})
+        with open(arguments.baseline, 'w') as file:
+            json.dump(
+                {
+                    'thresholds': dict(sorted(thresholds.items())),
+                    'baselines': dict(sorted(baselines.items())),
+                },
+                file,
+                indent=2,
+            )
+            file.write('\n')
+        for name, value in normalized.items():
+            print(f'{name:<28} {seconds[name] * 1_000_000:12.2f} us  {value:10.3f}')
+        return
+
+    def threshold(name: str) -> Optional[float]:
+        return thresholds.get(name, arguments.threshold)
+
+    def regressed(name: str) -> bool:
+        return (
+            name in baselines
+            and threshold(name) is not None
+            and normalized[name] / baselines[name] - 1 > threshold(name)
+        )
+
+    # A regression has to show up again in a second measurement, one slow phase of a
+    # shared machine is not enough to fail the gate
+    suspects = [name for name in normalized if regressed(name)]
+    if suspects:
+        remeasured = measure({name: cases[name] for name in suspects}, arguments.repeat)
+        for name in suspects:
+            if remeasured[1][name] < normalized[name]:
+                seconds[name] = remeasured[0][name]
+                normalized[name] = remeasured[1][name]
+
+    failed = list()
+    print(f'{"case":<28} {"us/call":>12} {"normalized":>10} {"baseline":>10} change')
+    for name, value in normalized.items():
+        baseline = baselines.get(name)
+        if baseline is None:
+            status = 'new'
+        else:
+            status = f'{(value / baseline - 1) * 100:+6.1f}%'
+            if threshold(name) is None:
+                status += ' (not gated)'
+            elif regressed(name):
+                status += ' FAIL'
+                failed.append(name)
+        print(
+            f'{name:<28} {seconds[name] * 1_000_000:12.2f} {value:10.3f}'
+            f' {baseline if baseline is not None else float("nan"):10.3f} {status}'
+        )
+
+    if failed:
+        print(
+            'Regressions over the threshold: '
+            + ', '.join(f'{name} ({threshold(name):.0%})' for name in failed)
+        )
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
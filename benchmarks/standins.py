@@ -0,0 +1,122 @@
+"""
+Local stand-ins for the services the application needs, nothing listens on the network:
+a throwaway Postgres cluster on a unix socket and an in-memory Redis.
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+from typing import Optional
+
+
+class LocalPostgres:
+    """
+    Throwaway Postgres cluster from the local binaries (initdb, pg_ctl),
+    found in BENCHMARK_POSTGRES_BIN, on PATH or through pg_config
+    """
+
+    def __init__(self, bin_dir: Optional[str] = None):
+        self.bin_dir = bin_dir or os.environ.get('BENCHMARK_POSTGRES_BIN')
+        self.directory: Optional[str] = None
+
+    def _binary(self, name: str) -> str:
+        path = shutil.which(name, path=self.bin_dir) if self.bin_dir else None
+        path = path or shutil.which(name)
+        if path is None and shutil.which('pg_config'):
+            bin_dir = subprocess.run(
+                ['pg_config', '--bindir'],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+            path = shutil.which(name, path=bin_dir)
+        if path is None:
+            raise RuntimeError(
+                f'{name} not found, set BENCHMARK_POSTGRES_BIN or pass --db-connection'
+            )
+        return path
+
+    @property
+    def data_directory(self) -> str:
+        return os.path.join(self.directory, 'data')
+
+    @property
+    def dsn(self) -> str:
+        return f'postgresql+asyncpg://postgres@/postgres?host={self.directory}'
+
+    def start(self) -> str:
+        """
+        :return: SQLAlchemy DSN of the cluster
+        """
+
+        self.directory = tempfile.mkdtemp(prefix='benchmark-postgres-')
+        subprocess.run(
+            [
+                self._binary('initdb'),
+                '-D',
+                self.data_directory,
+                '-U',
+                'postgres',
+                '-A',
+                'trust',
+                '--no-sync',
+            ],
+            capture_output=True,
+            check=True,
+        )
+        subprocess.run(
+            [
+                self._binary('pg_ctl'),
+                '-D',
+                self.data_directory,
+                '-l',
+                os.path.join(self.directory, 'postgres.log'),
+                '-o',
+                f"-k {self.directory} -c listen_addresses=''",
+                '-w',
+                'start',
+            ],
+            capture_output=True,
+            check=True,
+        )
+        return self.dsn
+
+    def stop(self):
+        if self.directory is None:
+            return
+        subprocess.run(
+            [self._binary('pg_ctl'), '-D', self.data_directory, '-m', 'fast', 'stop'],
+            capture_output=True,
+        )
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.directory = None
+
+    def __enter__(self) -> 'LocalPostgres':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def use_in_memory_redis():
+    """
+    Makes the Container create an in-memory Redis (fakeredis) instead of connecting,
+    the client keeps the round trip counting and metrics of the real one
+    """
+
+    import fakeredis
+
+    import app.core.container
+    from app.cache import CountingRedis
+
+    class InMemoryRedis(CountingRedis, fakeredis.FakeAsyncRedis):
+        pass
+
+    server = fakeredis.FakeServer()
+
+    async def get_redis_client(*args, **kwargs):
+        return InMemoryRedis(server=server)
+
+    app.core.container.get_redis_client = get_redis_client
@@ -0,0 +1,33 @@
+"""
+Functions run by the password hashing pool workers.
+Spawned worker processes import the module of every function they run, so it lives
+outside the 'app' package: importing 'app' builds the whole application.
+"""
+
+from typing import Optional
+
+from argon2 import PasswordHasher
+
+# Hasher of the pool worker (process or thread), created by the pool initializer
+_password_hasher: Optional[PasswordHasher] = None
+
+
+def initialize(parameters: dict):
+    """
+    :param parameters: arguments of PasswordHasher
+    """
+
+    global _password_hasher
+    _password_hasher = PasswordHasher(**parameters)
+
+
+def hash_password(password: str) -> str:
+    return _password_hasher.hash(password)
+
+
+def verify_password(password_hash: str, password: str) -> bool:
+    return _password_hasher.verify(password_hash, password)
+
+
+def noop():
+    pass
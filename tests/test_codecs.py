@@ -0,0 +1,41 @@
+import pytest
+
+from app.cache.codecs import CACHE_CODECS, JsonCacheCodec, decode
+from app.cache.exceptions import CacheObjectDoesNotExist
+from app.cache.models.user import UserCacheStruct
+
+
+def make_user(first_name: str) -> UserCacheStruct:
+    return UserCacheStruct(
+        id=1,
+        email='user@example.com',
+        first_name=first_name,
+        last_name=None,
+        verified=True,
+        is_admin=False,
+    )
+
+
+def test_binary_codec_round_trip():
+    user = make_user('Jöhn')
+    value = CACHE_CODECS['binary'].encode(user)
+
+    assert value[:1] == CACHE_CODECS['binary'].format_byte
+    assert decode(value) == user
+
+
+def test_binary_codec_falls_back_to_json_for_long_strings():
+    user = make_user('n' * 70000)
+    value = CACHE_CODECS['binary'].encode(user)
+
+    assert value[:1] == JsonCacheCodec.format_byte
+    assert decode(value) == user
+
+
+@pytest.mark.parametrize('codec', CACHE_CODECS.values())
+def test_entries_of_another_schema_version_are_misses(codec):
+    value = codec.encode(make_user('John'))
+    value = value[:1] + b'\x00' + value[2:]
+
+    with pytest.raises(CacheObjectDoesNotExist):
+        decode(value)
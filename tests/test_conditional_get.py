@@ -0,0 +1,89 @@
+import pytest
+from fastapi import status
+from httpx import ASGITransport, AsyncClient
+
+from app import app
+from app.core.environment import env
+from app.db.models.user import UserDbModel
+from app.db.session import LazyAsyncSession
+from app.services.rest.auth import AuthService
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def client(container, monkeypatch):
+    # Returns the Redis round trips of each request
+    monkeypatch.setattr(env, 'debug', True)
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app),
+        base_url='http://test',
+    ) as client:
+        yield client
+
+
+@pytest.fixture
+async def user_cache_model(container):
+    # The database is never reached, the user is only known to the cache
+    return await container.user_cache_repo.set(
+        UserDbModel(
+            id=1,
+            email='admin@example.com',
+            first_name='John',
+            last_name=None,
+            password='hash',
+            verified=True,
+            is_admin=True,
+        )
+    )
+
+
+@pytest.fixture
+async def headers(user_cache_model):
+    jwt_response = await AuthService._generate_jwt_response(user_cache_model)
+    return {'Authorization': f'Bearer {jwt_response.access_token}'}
+
+
+def checked_out_sessions() -> int:
+    return LazyAsyncSession.requests - LazyAsyncSession.requests_without_checkout
+
+
+@pytest.mark.parametrize('url', ['/rest/users/me', '/rest/users/users/1'])
+async def test_not_modified_costs_one_redis_read(client, headers, url):
+    response = await client.get(url, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    etag = response.headers['etag']
+
+    checked_out_before = checked_out_sessions()
+    response = await client.get(url, headers=headers | {'If-None-Match': etag})
+
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers['etag'] == etag
+    assert response.content == b''
+    assert response.headers['x-redis-round-trips'] == '1'
+    assert checked_out_sessions() == checked_out_before
+
+
+async def test_me_is_not_served_stale_under_a_new_etag(
+    client,
+    container,
+    headers,
+    user_cache_model,
+):
+    response = await client.get('/rest/users/me', headers=headers)
+    etag = response.headers['etag']
+
+    # Another worker updates the user, its invalidation has not arrived here yet
+    user_cache_model.first_name = 'Jane'
+    await container.user_cache_repo.update(user_cache_model)
+    await container.user_cache_repo.bump_version(user_cache_model.id)
+
+    response = await client.get(
+        '/rest/users/me',
+        headers=headers | {'If-None-Match': etag},
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers['etag'] != etag
+    assert response.json()['user']['first_name'] == 'Jane'
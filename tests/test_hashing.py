@@ -0,0 +1,105 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.core.environment import env
+from app.core.exceptions import ServiceUnavailableException
+from app.core.hashing import PasswordHashingExecutor, PasswordHashingParameters
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def released():
+    released = threading.Event()
+    yield released
+    # Pool threads blocked on it would keep the test run from exiting
+    released.set()
+
+
+@pytest.fixture
+def password_hasher(released):
+    password_hasher = PasswordHashingExecutor(
+        pool='thread',
+        max_workers=1,
+        max_queue=1,
+        parameters=PasswordHashingParameters(
+            time_cost=1,
+            memory_cost=8192,
+            parallelism=1,
+        ),
+    )
+    yield password_hasher
+    password_hasher.shutdown()
+
+
+async def test_cancelled_callers_keep_their_place_until_the_pool_is_done(
+    password_hasher,
+    released,
+):
+    running = asyncio.create_task(password_hasher._run('hash', released.wait))
+    queued = asyncio.create_task(password_hasher._run('hash', released.wait))
+    await asyncio.sleep(0.05)
+
+    running.cancel()
+    queued.cancel()
+    await asyncio.gather(running, queued, return_exceptions=True)
+
+    # The cancelled call still runs, the queued one has been taken off the queue
+    assert password_hasher.in_flight == 1
+
+    queued = asyncio.create_task(password_hasher._run('hash', released.wait))
+    await asyncio.sleep(0.05)
+    with pytest.raises(ServiceUnavailableException):
+        await password_hasher._run('hash', released.wait)
+
+    released.set()
+    await queued
+    await asyncio.sleep(0.05)
+
+    assert password_hasher.in_flight == 0
+
+
+async def test_process_workers_do_not_import_the_application():
+    password_hasher = PasswordHashingExecutor(
+        pool='process',
+        max_workers=1,
+        max_queue=1,
+        parameters=PasswordHashingParameters(
+            time_cost=1,
+            memory_cost=8192,
+            parallelism=1,
+        ),
+    )
+    try:
+        password_hash = await password_hasher.hash('password')
+        assert await password_hasher.verify(password_hash, 'password')
+
+        loop = asyncio.get_running_loop()
+        assert not await loop.run_in_executor(
+            password_hasher._executor,
+            eval,
+            "'app' in __import__('sys').modules",
+        )
+    finally:
+        password_hasher.shutdown()
+
+
+async def test_first_calibrated_parameters_win_and_expire(container):
+    password_hashing_cache_repo = container.password_hashing_cache_repo
+    calibration = (0.05, 65536, 1)
+
+    stored = await password_hashing_cache_repo.set_parameters(
+        *calibration,
+        PasswordHashingParameters(time_cost=2, memory_cost=65536, parallelism=1),
+    )
+    other = await password_hashing_cache_repo.set_parameters(
+        *calibration,
+        PasswordHashingParameters(time_cost=3, memory_cost=65536, parallelism=1),
+    )
+
+    assert stored == other == PasswordHashingParameters(2, 65536, 1)
+    assert await container.redis_client.ttl(
+        password_hashing_cache_repo._key(*calibration)
+    ) == pytest.approx(env.password_hashing_calibration_ttl, abs=1)
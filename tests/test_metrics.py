@@ -0,0 +1,79 @@
+import json
+
+import pytest
+from fastapi import status
+from httpx import ASGITransport, AsyncClient
+from pydantic import SecretStr
+
+from app import app
+from app.core.environment import env
+from app.core.metrics import MetricsRegistry, render
+
+pytestmark = pytest.mark.anyio
+
+
+def worker_snapshot(requests: int, age: float = 0) -> tuple[str, str]:
+    registry = MetricsRegistry()
+    counter = registry.counter('requests_total', 'Requests')
+    histogram = registry.histogram('duration_seconds', 'Duration', buckets=(1.0,))
+    for _ in range(requests):
+        counter.inc()
+        histogram.observe(0.5)
+
+    snapshot = json.loads(registry.snapshot())
+    snapshot['updated_at'] -= age
+    return registry.worker, json.dumps(snapshot)
+
+
+async def scrape(container) -> str:
+    snapshots, stopped_snapshots = await container.metrics_cache_repo.get_snapshots(
+        max_age=15,
+        retire_after=300,
+    )
+    return render(snapshots, stopped_snapshots)
+
+
+async def test_counters_of_stopped_workers_are_kept(container):
+    metrics_cache_repo = container.metrics_cache_repo
+    stopped_worker, _ = worker_snapshot(3)
+    await metrics_cache_repo.publish(*worker_snapshot(2))
+
+    for age in (0, 60, 600):
+        await metrics_cache_repo.publish(stopped_worker, worker_snapshot(3, age)[1])
+        rendered = await scrape(container)
+
+        assert 'requests_total 5' in rendered
+        assert 'duration_seconds_count 5' in rendered
+
+    # The stopped worker has been folded into the retired snapshot
+    assert await container.redis_client.hlen(metrics_cache_repo.prefix_key) == 1
+
+    await metrics_cache_repo.publish(*worker_snapshot(1))
+    rendered = await scrape(container)
+
+    assert 'requests_total 6' in rendered
+    assert 'duration_seconds_count 6' in rendered
+
+
+@pytest.mark.parametrize(
+    'client_host, authorization, status_code',
+    [
+        ('127.0.0.1', None, status.HTTP_200_OK),
+        ('203.0.113.7', None, status.HTTP_401_UNAUTHORIZED),
+        ('203.0.113.7', 'Bearer wrong-token', status.HTTP_401_UNAUTHORIZED),
+        ('203.0.113.7', 'Bearer scraper-token', status.HTTP_200_OK),
+    ],
+)
+async def test_metrics_are_served_to_allowed_scrapers(
+    container, monkeypatch, client_host, authorization, status_code
+):
+    monkeypatch.setattr(env, 'metrics_token', SecretStr('scraper-token'))
+    headers = {'Authorization': authorization} if authorization else {}
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app, client=(client_host, 123)),
+        base_url='http://test',
+    ) as client:
+        response = await client.get('/metrics', headers=headers)
+
+    assert response.status_code == status_code
@@ -0,0 +1,65 @@
+import sys
+
+import anyio
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.core.environment import env
+from app.core.profiling import ProfilerMiddleware, SamplingProfiler
+
+pytestmark = pytest.mark.anyio
+
+
+def test_overlapping_samplers_restore_the_switch_interval():
+    switch_interval = sys.getswitchinterval()
+    first = SamplingProfiler(0.0001)
+    second = SamplingProfiler(0.0002)
+
+    first.start()
+    second.start()
+    first.stop()
+    assert sys.getswitchinterval() < switch_interval
+
+    second.stop()
+    assert sys.getswitchinterval() == switch_interval
+
+
+async def test_concurrent_cprofile_requests_are_not_profiled_twice(monkeypatch):
+    monkeypatch.setattr(env, 'profiler_max_concurrent', 2)
+    monkeypatch.setattr(env, 'profiler_output_dir', None)
+    monkeypatch.setattr(
+        ProfilerMiddleware, '_authorize', staticmethod(lambda *args: _authorized())
+    )
+    started = [anyio.Event(), anyio.Event()]
+    released = anyio.Event()
+
+    async def endpoint(scope, receive, send):
+        next(event for event in started if not event.is_set()).set()
+        await released.wait()
+        await send({'type': 'http.response.start', 'status': 204, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    headers = {'X-Profile': 'cprofile', 'Authorization': 'Bearer admin'}
+    responses = dict()
+
+    async with AsyncClient(
+        transport=ASGITransport(app=ProfilerMiddleware(endpoint)),
+        base_url='http://test',
+    ) as client:
+
+        async def request(name: str):
+            responses[name] = await client.get('/', headers=headers)
+
+        async with anyio.create_task_group() as task_group:
+            task_group.start_soon(request, 'first')
+            await started[0].wait()
+            task_group.start_soon(request, 'second')
+            await started[1].wait()
+            released.set()
+
+    assert responses['first'].headers['x-profile-status'] == 'inline'
+    assert responses['second'].headers['x-profile-status'] == 'busy'
+
+
+async def _authorized() -> bool:
+    return True
@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+from app.core.environment import env
+from app.core.singleflight import SingleFlight
+from app.db.exceptions import DbObjectDoesNotExist
+from app.db.models.user import UserDbModel
+from app.db.repos.user import UserDbRepo
+
+pytestmark = pytest.mark.anyio
+
+
+class CountingUserDbRepo(UserDbRepo):
+    """
+    Serves a single user and counts the queries, each one takes a while so that
+    concurrent callers arrive while it is in flight
+    """
+
+    def __init__(self, user_db_model: UserDbModel):
+        self.user_db_model = user_db_model
+        self.get_calls = 0
+
+    async def get(self, _id: int, session):
+        self.get_calls += 1
+        await asyncio.sleep(0.05)
+        if _id != self.user_db_model.id:
+            raise DbObjectDoesNotExist
+        return self.user_db_model
+
+
+@pytest.fixture
+def user_db_repo(container):
+    container.user_db_repo = CountingUserDbRepo(
+        UserDbModel(
+            id=1,
+            email='user@example.com',
+            first_name='John',
+            last_name=None,
+            password='hash',
+            verified=True,
+            is_admin=False,
+        )
+    )
+    return container.user_db_repo
+
+
+async def test_concurrent_misses_query_the_database_once(container, user_db_repo):
+    user_cache_models = await asyncio.gather(
+        *(container.user_union.get(1, session=None) for _ in range(50))
+    )
+
+    assert user_db_repo.get_calls == 1
+    assert {user_cache_model.id for user_cache_model in user_cache_models} == {1}
+    # Services modify the users they get, so every caller has its own
+    assert len({id(user_cache_model) for user_cache_model in user_cache_models}) == 50
+
+
+async def test_cancelled_loader_does_not_fail_the_waiters(container, user_db_repo):
+    leader = asyncio.create_task(container.user_union.get(1, session=None))
+    await asyncio.sleep(0.01)
+    waiters = [
+        asyncio.create_task(container.user_union.get(1, session=None))
+        for _ in range(10)
+    ]
+    await asyncio.sleep(0.01)
+
+    leader.cancel()
+    user_cache_models = await asyncio.gather(*waiters)
+
+    assert leader.cancelled()
+    assert {user_cache_model.id for user_cache_model in user_cache_models} == {1}
+    # One of the waiters took over the load
+    assert user_db_repo.get_calls == 2
+
+
+async def test_missing_value_is_published_to_other_workers(
+    container, user_db_repo, monkeypatch
+):
+    monkeypatch.setattr(env, 'single_flight_wait_timeout', 5)
+    other_worker = SingleFlight(container=container)
+
+    async def load_missing():
+        await asyncio.sleep(0.05)
+        raise DbObjectDoesNotExist
+
+    other_worker_load = asyncio.create_task(
+        other_worker.do(
+            'missing',
+            loader=load_missing,
+            cached=lambda: container.user_cache_repo.get(1),
+            missing=DbObjectDoesNotExist,
+        )
+    )
+    await asyncio.sleep(0.01)
+
+    loads = 0
+
+    async def load():
+        nonlocal loads
+        loads += 1
+
+    started_at = asyncio.get_running_loop().time()
+    with pytest.raises(DbObjectDoesNotExist):
+        await container.single_flight.do(
+            'missing',
+            loader=load,
+            cached=lambda: container.user_cache_repo.get(1),
+            missing=DbObjectDoesNotExist,
+        )
+
+    assert loads == 0
+    assert asyncio.get_running_loop().time() - started_at < 1
+    with pytest.raises(DbObjectDoesNotExist):
+        await other_worker_load
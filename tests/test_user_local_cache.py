@@ -0,0 +1,60 @@
+import pytest
+
+from app.cache.exceptions import CacheObjectDoesNotExist
+from app.core.environment import env
+from app.db.models.user import UserDbModel
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def user_cache_model(container):
+    return await container.user_cache_repo.set(
+        UserDbModel(
+            id=1,
+            email='user@example.com',
+            first_name='John',
+            last_name=None,
+            password='hash',
+            verified=True,
+            is_admin=False,
+        )
+    )
+
+
+async def test_users_invalidated_during_the_load_are_not_stored(
+    container,
+    user_cache_model,
+):
+    user_local_cache_repo = container.user_local_cache_repo
+
+    generation = user_local_cache_repo.get_generation()
+    await user_local_cache_repo.invalidate(user_cache_model.id)
+    await user_local_cache_repo.set(user_cache_model, generation)
+
+    with pytest.raises(CacheObjectDoesNotExist):
+        await user_local_cache_repo.get(user_cache_model.id)
+
+    await user_local_cache_repo.set(
+        user_cache_model,
+        user_local_cache_repo.get_generation(),
+    )
+    assert (await user_local_cache_repo.get(user_cache_model.id)).id == 1
+
+
+async def test_loads_older_than_forgotten_invalidations_are_not_stored(
+    container,
+    user_cache_model,
+    monkeypatch,
+):
+    monkeypatch.setattr(env, 'user_local_cache_size', 1)
+    user_local_cache_repo = container.user_local_cache_repo
+
+    generation = user_local_cache_repo.get_generation()
+    await user_local_cache_repo.invalidate(user_cache_model.id)
+    # Pushes the invalidation of the user out of the remembered ones
+    await user_local_cache_repo.invalidate(2)
+    await user_local_cache_repo.set(user_cache_model, generation)
+
+    with pytest.raises(CacheObjectDoesNotExist):
+        await user_local_cache_repo.get(user_cache_model.id)
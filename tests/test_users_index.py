@@ -0,0 +1,83 @@
+import pytest
+
+from app.db.models.user import UserDbModel
+from app.db.repos.user import UserDbRepo
+
+pytestmark = pytest.mark.anyio
+
+
+class ScanningUserDbRepo(UserDbRepo):
+    """
+    Users 1-3 exist when the scan starts, user 4 is created while it runs
+    """
+
+    def __init__(self, container):
+        self.container = container
+
+    async def iter_ids(self, session, chunk_size: int = 10000):
+        yield [1, 2]
+        await self.container.users_cache_repo.add(4)
+        yield [3]
+
+
+async def test_rebuild_keeps_users_created_during_the_scan(container):
+    container.user_db_repo = ScanningUserDbRepo(container)
+
+    await container.user_union._load_index(session=None)
+    # The live index exists now, the rebuild replaces it
+    await container.user_union._load_index(session=None)
+
+    assert await container.users_cache_repo.get_page_ids(0, 10) == [1, 2, 3, 4]
+
+
+class KeysetUserDbRepo(UserDbRepo):
+    """
+    Users 1-5, counts the keyset queries
+    """
+
+    def __init__(self):
+        self.all_by_cursor_calls = 0
+
+    async def all_by_cursor(self, after, before, limit, session):
+        self.all_by_cursor_calls += 1
+        return [make_user(_id) for _id in range(after + 1, 6)][:limit]
+
+    async def iter_ids(self, session, chunk_size: int = 10000):
+        yield [1, 2, 3, 4, 5]
+
+    async def get_many(self, ids, session):
+        return [make_user(_id) for _id in ids]
+
+
+def make_user(_id: int) -> UserDbModel:
+    return UserDbModel(
+        id=_id,
+        email=f'user{_id}@example.com',
+        first_name=None,
+        last_name=None,
+        password='hash',
+        verified=True,
+        is_admin=False,
+    )
+
+
+async def test_cursor_page_does_not_wait_for_the_index(container):
+    container.user_db_repo = user_db_repo = KeysetUserDbRepo()
+
+    user_cache_models, has_more = await container.user_union.all_by_cursor(
+        2, None, 2, session=None
+    )
+
+    assert [user_cache_model.id for user_cache_model in user_cache_models] == [3, 4]
+    assert has_more
+    assert user_db_repo.all_by_cursor_calls == 1
+
+    # The index is built in the background and serves the next pages
+    await container.user_union._index_rebuild
+    user_cache_models, has_more = await container.user_union.all_by_cursor(
+        3, None, 2, session=None
+    )
+
+    assert [user_cache_model.id for user_cache_model in user_cache_models] == [4, 5]
+    assert not has_more
+    assert user_db_repo.all_by_cursor_calls == 1
@@ -0,0 +1,40 @@
+import pytest
+
+from app.cache.models.user import UserCacheStruct
+from app.core.environment import env
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def user_cache_model(container):
+    user_cache_model = UserCacheStruct(
+        id=1,
+        email='user@example.com',
+        first_name=None,
+        last_name=None,
+        verified=False,
+        is_admin=False,
+    )
+    await container.user_cache_repo.set_verification_code(user_cache_model, 1234)
+    return user_cache_model
+
+
+async def test_code_is_deleted_after_the_attempts(
+    container,
+    user_cache_model,
+    monkeypatch,
+):
+    monkeypatch.setattr(env, 'verification_code_max_attempts', 3)
+    user_cache_repo = container.user_cache_repo
+
+    assert await user_cache_repo.check_verification_code(1, 1111) is False
+    assert await user_cache_repo.check_verification_code(1, 1234) is True
+    assert await user_cache_repo.check_verification_code(1, 2222) is False
+    assert await user_cache_repo.check_verification_code(1, 3333) is False
+
+    assert await user_cache_repo.check_verification_code(1, 1234) is None
+
+    # A new code does not give more attempts
+    await user_cache_repo.set_verification_code(user_cache_model, 5678)
+    assert await user_cache_repo.check_verification_code(1, 5678) is None